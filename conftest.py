@@ -0,0 +1,14 @@
+"""
+pytest 配置
+
+插件包在导入时会创建各数据管理器，并在当前目录的 data/data_manager/ 下读写数据文件，
+测试改在临时目录中运行，避免读取或改动正式数据。
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="musicalbot-test-"))
@@ -1,13 +1,22 @@
-import json
 import os
+import hashlib
 import asyncio
 import traceback
 from ncatbot.utils.logger import get_log
+from plugins.AdminPlugin import codec
+from plugins.AdminPlugin.storage import create_storage
+from plugins.AdminPlugin.perf import perf
 
 log = get_log()
 
+
 class BaseDataManager:
     
+    # 持久化后端："json"（默认）或 "sqlite"，见 plugins/AdminPlugin/storage.py
+    storage_backend = os.environ.get("DATA_MANAGER_BACKEND", "json")
+    # request_save() 的合并窗口（秒）：窗口内的多次保存请求只写一次；None 表示不启用
+    save_debounce_seconds = None
+    
     def __init__(self, file_path, *args, **kwargs):
         if hasattr(self, "_initialized") and self._initialized:
             return
@@ -15,23 +24,31 @@ class BaseDataManager:
         self.file_path = file_path or f"{self.work_path}{self.__class__.__name__}.json"
         self.data = {}
         self.updating = False
+        self._version = 0  # 修改计数，由 mark_dirty 增加
+        self._saved_version = 0  # 上次加载/保存时的修改计数
+        self._saved_fingerprint = None  # 上次加载/保存时数据的摘要，只在 save(force=True) 时用于检查
+        self._pending_save = None
+        self._save_lock = asyncio.Lock()
+        self.storage = create_storage(self.storage_backend, self.file_path, self.work_path)
         self.__on_load()
         self.on_load(*args, **kwargs)
+        self._saved_version = self._version  # 加载过程中的修改不需要写回
         self._initialized = True
         
     async def on_close(self):
-        await self.save()
+        await self.save(on_close=True, force=True)
+        self.storage.close()
 
     def __on_load(self):
         try:
             self.updating = True
-            if os.path.exists(self.file_path):
+            if self.storage.exists():
                 self.load()
-            elif not os.path.exists(self.work_path):
-                os.makedirs(self.work_path)
-                open(self.file_path, "w", encoding="utf-8").write(json.dumps({}))
             else:
-                open(self.file_path, "w", encoding="utf-8").write(json.dumps({}))
+                if not os.path.exists(self.work_path):
+                    os.makedirs(self.work_path)
+                self.storage.save({})
+            self._saved_fingerprint = self._fingerprint()
             self.updating = False
         except Exception as e:
             self.updating = False
@@ -39,54 +56,105 @@ class BaseDataManager:
             raise RuntimeError(self.__class__.__name__, f"加载持久化数据时出错: {e}")
         
     def load(self):
-        with open(self.file_path, "r", encoding="utf-8") as f:
-            try:
-                self.data = json.load(f)
-            except json.JSONDecodeError as e:
-                self.data = {}
-                raise
-
-    async def save(self, on_close=False):
+        try:
+            self.data = self.storage.load()
+        except codec.JSONDecodeError as e:
+            self.data = {}
+            raise
+
+    def _structure_snapshot(self):
+        # 在事件循环中执行：只复制顶层字典和它下一层的字典/列表（不序列化内容），
+        # 之后事件循环中对这两层的增删不会影响工作线程中的序列化。
+        # 更深层的对象仍然共享：各管理器对它们多为整体替换，且 orjson 和标准库 C 编码器序列化时不释放 GIL
+        return {key: dict(value) if isinstance(value, dict) else list(value) if isinstance(value, list) else value
+                for key, value in self.data.items()}
+
+    def _snapshot(self, data=None):
+        # 紧凑格式（orjson 或标准库 C 编码器），得到的文本与 self.data 不再共享对象
+        return codec.dumps(self.data if data is None else data)
+
+    def _fingerprint(self, text=None):
+        text = self._snapshot() if text is None else text
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def mark_dirty(self):
+        """数据被修改后调用（由各管理器的修改方法调用），下一次 save 时写入"""
+        self._version += 1
+
+    def is_dirty(self):
+        return self._version != self._saved_version
+
+    def _write_snapshot(self, data, check_fingerprint=False):
+        # 在工作线程中执行：序列化、计算摘要并写盘，返回快照的摘要；
+        # check_fingerprint 为 True 且摘要与上次保存的相同时不写盘，返回 None
+        text = self._snapshot(data)
+        fingerprint = self._fingerprint(text)
+        if check_fingerprint and fingerprint == self._saved_fingerprint:
+            return None
+        self.storage.save_snapshot(text)
+        return fingerprint
+
+    async def save(self, on_close=False, force=False):
         """_summary_
 
+        自上次加载/保存以来没有调用过 mark_dirty 时跳过写入（skipped 为 True），不生成快照。
+        force 为 True 时（/save、关闭时）即使没有登记修改，也比较快照的摘要，
+        以免遗漏没有调用 mark_dirty 的修改。
+        事件循环中只复制数据的顶层结构（见 _structure_snapshot），序列化、摘要和写盘都在工作线程中完成。
+
         Raises:
             RuntimeError: _description_
 
         Returns:
-            dict[str: bool]:  {"success":True, "updating":False}
+            dict[str: bool]:  {"success":True, "updating":False, "skipped":False}
         """
         try:
             if self.updating:
                 if not on_close:
                     await self._wait_for_data_update()
                 else:
-                    return {"success":False, "updating":True}
-            # 备份机制：保存前先备份原文件
-            if os.path.exists(self.file_path):
-                backup_path = self.file_path + ".bak"
-                try:
-                    # 如果已有备份，先删除
-                    if os.path.exists(backup_path):
-                        os.remove(backup_path)
-                    os.rename(self.file_path, backup_path)
-                except Exception as e:
-                    print(f"备份原数据文件失败: {e}")
-            # 正式写入新数据
-            with open(self.file_path, "w", encoding="utf-8") as f:
-                json.dump(self.data, f, ensure_ascii=False, indent=4)
-                return {"success":True, "updating":False}
+                    return {"success":False, "updating":True, "skipped":False}
+            async with self._save_lock:
+                dirty = self.is_dirty()
+                if not (dirty or force):
+                    return {"success":True, "updating":False, "skipped":True}
+                version = self._version
+                data = self._structure_snapshot()
+                # JSON 后端整体重写文件（原子替换）；SQLite 后端只写入变化的记录
+                with perf.timer(f"save:{self.__class__.__name__}"):
+                    fingerprint = await asyncio.to_thread(self._write_snapshot, data, not dirty)
+                if fingerprint is None:
+                    return {"success":True, "updating":False, "skipped":True}
+                self._saved_fingerprint = fingerprint
+                # 写盘期间的修改留到下一次保存
+                self._saved_version = version
+            return {"success":True, "updating":False, "skipped":False}
         except Exception as e:
             traceback.print_exc()
-            # 如果写入失败，尝试恢复备份
-            backup_path = self.file_path + ".bak"
-            if os.path.exists(backup_path):
-                try:
-                    os.rename(backup_path, self.file_path)
-                    print("已自动恢复备份数据文件！")
-                except Exception as e2:
-                    print(f"恢复备份失败: {e2}")
             raise RuntimeError(f"保存持久化数据时出错: {e}")
         
+    def request_save(self):
+        """
+        请求一次延迟保存：save_debounce_seconds 内的多次请求合并为一次写入。
+        未设置 save_debounce_seconds 或不在事件循环中时不做任何事，由定时保存兜底。
+        """
+        if self.save_debounce_seconds is None:
+            return
+        if self._pending_save is not None and not self._pending_save.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._pending_save = loop.create_task(self._debounced_save())
+
+    async def _debounced_save(self):
+        await asyncio.sleep(self.save_debounce_seconds)
+        try:
+            await self.save()
+        except Exception as e:
+            log.error(f"{self.__class__.__name__} 延迟保存失败: {e}")
+
     async def _wait_for_data_update(self):
         """
         等待数据更新完成，直到self.updating为False
@@ -2,7 +2,7 @@ from datetime import datetime
 from plugins.AdminPlugin.BaseDataManager import BaseDataManager
 from ncatbot.plugin import BasePlugin
 from ncatbot.utils.logger import get_log
-from copy import deepcopy
+from types import MappingProxyType
 log = get_log()
 
 def USER_MODEL():
@@ -28,6 +28,7 @@ class UsersManager(BaseDataManager):
     
     
     admin_id = "3022402752"
+    save_debounce_seconds = 30
 
     def __init__(self, file_path=None):
         super().__init__(file_path=file_path)
@@ -43,6 +44,7 @@ class UsersManager(BaseDataManager):
             self.data["groups"] = data["groups"]
             self.data["groups_list"] = data["groups_list"]
             print(len(self.data["users_list"]))
+            self._build_subscribe_index()
             return super().on_load()
         if "users" not in self.data:
             self.data["users"] = data["users"] if first_init else {}
@@ -55,51 +57,186 @@ class UsersManager(BaseDataManager):
         if "groups_list" not in self.data:
             self.data["groups_list"] = data["groups_list"] if first_init else []
         self.data.setdefault("todays_likes", [])
+        self._build_subscribe_index()
         return super().on_load()
     
+    # ---------------- 订阅倒排索引 ---------------- #
+    # _ticket_subs: {ticket_id: {user_id: mode}}
+    # _event_subs: {event_id: {user_id: mode}}
+    # _global_users / _global_groups: {mode: set(id)}  全局通知模式（attention_to_hulaquan）分桶
+    # 索引只存在于内存中，由各订阅方法维护，不写入持久化数据
+    
+    def _build_subscribe_index(self):
+        self._invalidate_views()
+        self._ticket_subs = {}
+        self._event_subs = {}
+        self._user_index_keys = {}  # user_id -> (ticket_ids, event_ids)，用于移除旧索引
+        self._global_users = {1: set(), 2: set(), 3: set()}
+        self._global_groups = {1: set(), 2: set(), 3: set()}
+        for user_id in self.data["users"]:
+            self._reindex_user(user_id)
+        for group_id in self.data["groups"]:
+            self._reindex_global(group_id, is_group=True)
+
+    @staticmethod
+    def _mode_int(mode):
+        try:
+            return int(mode)
+        except (TypeError, ValueError):
+            return 0
+
+    def _reindex_global(self, _id, is_group=False):
+        # 通知模式、订阅和用户 / 群聊的增删都会重建索引，同时登记修改
+        self.mark_dirty()
+        buckets = self._global_groups if is_group else self._global_users
+        for ids in buckets.values():
+            ids.discard(_id)
+        item = self.data["groups" if is_group else "users"].get(_id)
+        if item is None:
+            return
+        mode = self._mode_int(item.get("attention_to_hulaquan", 0))
+        if mode in buckets:
+            buckets[mode].add(_id)
+
+    def _reindex_user(self, user_id):
+        """按用户当前的订阅数据重建该用户在倒排索引中的条目（同时登记修改）"""
+        old_tickets, old_events = self._user_index_keys.pop(user_id, ((), ()))
+        for tid in old_tickets:
+            subs = self._ticket_subs.get(tid)
+            if subs is not None:
+                subs.pop(user_id, None)
+                if not subs:
+                    del self._ticket_subs[tid]
+        for eid in old_events:
+            subs = self._event_subs.get(eid)
+            if subs is not None:
+                subs.pop(user_id, None)
+                if not subs:
+                    del self._event_subs[eid]
+        self._reindex_global(user_id)
+        user = self.data["users"].get(user_id)
+        if user is None:
+            return
+        subscribe = user.get("subscribe", {})
+        ticket_ids, event_ids = set(), set()
+        for key, index, ids in (("subscribe_tickets", self._ticket_subs, ticket_ids),
+                                ("subscribe_events", self._event_subs, event_ids)):
+            for item in subscribe.get(key, []):
+                _id = str(item['id'])
+                subs = index.setdefault(_id, {})
+                # 同一用户重复关注时取最高模式
+                subs[user_id] = max(subs.get(user_id, 0), self._mode_int(item.get('mode', 0)))
+                ids.add(_id)
+        self._user_index_keys[user_id] = (ticket_ids, event_ids)
+
+    def announce_targets(self, tickets, mode_of_stat, is_group=False):
+        """
+        根据倒排索引计算本轮变动场次的接收者，复杂度与变动场次数和命中的订阅数成正比。
+        
+        Args:
+            tickets: {ticket_id: {"categorized": stat, "event_id": event_id, ...}}
+            mode_of_stat: {stat: 接收该类提醒所需的最低模式}
+            is_group: 为True时计算群聊（群聊只有全局模式）
+        Returns:
+            (global_modes, personal)
+            global_modes: {id: mode}  全局通知模式大于0的用户/群
+            personal: {user_id: {event_id: {stat: set(ticket_id)}}}  通过关注剧目/场次命中的变动
+        """
+        buckets = self._global_groups if is_group else self._global_users
+        global_modes = {_id: mode for mode, ids in buckets.items() for _id in ids}
+        personal = {}
+        if is_group:
+            return global_modes, personal
+        for tid, ticket in tickets.items():
+            stat = ticket['categorized']
+            eid = str(ticket['event_id'])
+            need = mode_of_stat.get(stat, 99)
+            for subs in (self._ticket_subs.get(str(tid)), self._event_subs.get(eid)):
+                if not subs:
+                    continue
+                for user_id, mode in subs.items():
+                    if mode >= need:
+                        personal.setdefault(user_id, {}).setdefault(eid, {}).setdefault(stat, set()).add(tid)
+        return global_modes, personal
+
+    def event_subscriber_count(self, event_id, ticket_ids=()):
+        """单独关注该剧目或其中任一场次的用户数（不含只开启全局通知的用户）"""
+        users = set(self._event_subs.get(str(event_id), ()))
+        for tid in ticket_ids:
+            users.update(self._ticket_subs.get(str(tid), ()))
+        return len(users)
+    
     
         
+    # ---------------- 只读视图 ---------------- #
+    # users()/groups() 返回只读映射，users_list()/groups_list() 返回元组。
+    # 视图是增删用户/群时的快照，遍历过程中增删用户不会影响正在进行的遍历；
+    # 视图只在增删后首次访问时重建，其余时候直接复用。映射中的用户数据仍是原对象，只用于读取。
+
+    def _invalidate_views(self):
+        self._views = {}
+
+    def _view(self, key):
+        view = self._views.get(key)
+        if view is None:
+            value = self.data.get(key, {} if key in ("users", "groups") else [])
+            view = MappingProxyType(dict(value)) if isinstance(value, dict) else tuple(value)
+            self._views[key] = view
+        return view
+
     def users(self):
-        return deepcopy(self.data.get("users", {}))
+        return self._view("users")
         
     def users_list(self):
-        return deepcopy(self.data.get("users_list", []))
+        return self._view("users_list")
     
     def ops_list(self):
         return self.data.get("ops_list", [])
     
     def groups(self):
-        return deepcopy(self.data.get("groups", {}))
+        return self._view("groups")
         
     def groups_list(self):
-        return deepcopy(self.data.get("groups_list", []))
+        return self._view("groups_list")
+
+    def has_user(self, user_id):
+        return str(user_id) in self.data["users"]
+
+    def has_group(self, group_id):
+        return str(group_id) in self.data["groups"]
         
     def add_group(self, group_id):
         if not isinstance(group_id, str):
             group_id = str(group_id)
-        if group_id in self.data["groups_list"]:
+        if group_id in self.data["groups"]:
             return
+        self._invalidate_views()
         self.data["groups_list"].append(group_id)
         self.data["groups"][group_id] = {
             "activate": True,
             "create_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "attention_to_hulaquan": 0,
         }
+        self._reindex_global(group_id, is_group=True)
     
     def delete_group(self, group_id):
         if not isinstance(group_id, str):
             group_id = str(group_id)
-        if group_id in self.data["groups_list"]:
+        if group_id in self.data["groups"]:
+            self._invalidate_views()
             self.data["groups_list"].remove(group_id)
             del self.data["groups"][group_id]
+            self._reindex_global(group_id, is_group=True)
         
     def add_user(self, user_id):
         if not isinstance(user_id, str):
             user_id = str(user_id)
-        if user_id in self.data["users_list"]:
+        if user_id in self.data["users"]:
             return
+        self._invalidate_views()
         self.data["users_list"].append(user_id)
         self.data["users"][user_id] = USER_MODEL()
+        self.mark_dirty()
         return self.data["users"][user_id]
         
     def update_user_keys(self, user_id):
@@ -116,6 +253,7 @@ class UsersManager(BaseDataManager):
                     goto(origin[k], v)
             
         goto(user, USER_MODEL())
+        self.mark_dirty()
     
     def attention_to_hulaquan(self, user_id, default=0):
         """
@@ -131,14 +269,17 @@ class UsersManager(BaseDataManager):
         if "chats_count" not in self.data['users'][user_id]:
             self.data["users"][user_id]["chats_count"] = 0
         self.data["users"][user_id]["chats_count"] += 1
+        self.mark_dirty()
         return self.data["users"][user_id]
     
     def delete_user(self, user_id):
         if not isinstance(user_id, str):
             user_id = str(user_id)
-        if user_id in self.data["users_list"]:
+        if user_id in self.data["users"]:
+            self._invalidate_views()
             self.data["users_list"].remove(user_id)
             del self.data["users"][user_id]
+            self._reindex_user(user_id)
             
     def add_op(self, user_id):
         if not isinstance(user_id, str):
@@ -146,10 +287,11 @@ class UsersManager(BaseDataManager):
         if user_id in self.data["ops_list"]:
             
             return False
-        if user_id not in self.data["users_list"]:
+        if user_id not in self.data["users"]:
             self.add_user(user_id)
         self.data["ops_list"].append(user_id)
         self.data["users"][user_id]["is_op"] = True
+        self.mark_dirty()
         return True
         
     def de_op(self, user_id):
@@ -158,6 +300,7 @@ class UsersManager(BaseDataManager):
         if user_id in self.data["ops_list"]:
             self.data["ops_list"].remove(user_id)
             self.data["users"][user_id]["is_op"] = False
+            self.mark_dirty()
             return True
         return False
             
@@ -174,6 +317,7 @@ class UsersManager(BaseDataManager):
         tickets = self.data["users"][user_id]["subscribe"].setdefault("subscribe_tickets", [])
         before = len(tickets)
         self.data["users"][user_id]["subscribe"]["subscribe_tickets"] = [t for t in tickets if str(t['id']) != ticket_id]
+        self._reindex_user(user_id)
         return before != len(self.data["users"][user_id]["subscribe"]["subscribe_tickets"])
 
     def remove_event_subscribe(self, user_id, event_id):
@@ -182,6 +326,7 @@ class UsersManager(BaseDataManager):
         events = self.data["users"][user_id]["subscribe"].setdefault("subscribe_events", [])
         before = len(events)
         self.data["users"][user_id]["subscribe"]["subscribe_events"] = [e for e in events if str(e['id']) != event_id]
+        self._reindex_user(user_id)
         return before != len(self.data["users"][user_id]["subscribe"]["subscribe_events"])
     
     def switch_attention_to_hulaquan(self, user_id, mode=0, is_group=False):
@@ -197,18 +342,20 @@ class UsersManager(BaseDataManager):
             else:
                 self.add_group(user_id)
             self.data[key][user_id]["attention_to_hulaquan"] = mode
+        self._reindex_global(user_id, is_group=is_group)
         return mode
     
     def new_subscribe(self, user_id, is_subscribe=False):
         if not isinstance(user_id, str):
             user_id = str(user_id)
-        if user_id not in self.data["users_list"]:
+        if user_id not in self.data["users"]:
             self.add_user(user_id)
         self.data["users"][user_id]["subscribe"]["is_subscribe"] = True if self.data["users"][user_id]["subscribe"]["is_subscribe"] else is_subscribe
         self.data["users"][user_id]["subscribe"].setdefault("subscribe_time", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
         self.data["users"][user_id]["subscribe"].setdefault("subscribe_tickets", [])
         self.data["users"][user_id]["subscribe"].setdefault("subscribe_events", [])
         self.data["users"][user_id]["subscribe"].setdefault("subscribe_actors", [])  # 确保演员订阅字段存在
+        self.mark_dirty()
         return self.data["users"][user_id]["subscribe"]
    
     def add_ticket_subscribe(self, user_id, ticket_ids, mode, related_to_actors=None):
@@ -225,9 +372,9 @@ class UsersManager(BaseDataManager):
                              - ['actor1', 'actor2']: 因关注这些演员而订阅的场次
         """
         user_id = str(user_id)
-        self.data["users"][user_id]["subscribe"].setdefault("subscribe_tickets", [])
-        if user_id not in self.users_list():
+        if user_id not in self.data["users"]:
             self.add_user(user_id)
+        self.data["users"][user_id]["subscribe"].setdefault("subscribe_tickets", [])
         if isinstance(ticket_ids, int) or isinstance(ticket_ids, str):
             ticket_ids = [ticket_ids]
         
@@ -249,13 +396,14 @@ class UsersManager(BaseDataManager):
                 ticket_entry['related_to_actors'] = related_to_actors
             
             self.data["users"][user_id]["subscribe"]["subscribe_tickets"].append(ticket_entry)
+        self._reindex_user(user_id)
         return True
     
     def add_event_subscribe(self, user_id, event_ids, mode):
         user_id = str(user_id)
-        self.data["users"][user_id]["subscribe"].setdefault("subscribe_events", [])
-        if user_id not in self.users_list():
+        if user_id not in self.data["users"]:
             self.add_user(user_id)
+        self.data["users"][user_id]["subscribe"].setdefault("subscribe_events", [])
         if isinstance(event_ids, int) or isinstance(event_ids, str):
             event_ids = [event_ids]
         for i in event_ids:
@@ -264,6 +412,7 @@ class UsersManager(BaseDataManager):
                 'id': str(i),
                 'mode': mode,
                 })
+        self._reindex_user(user_id)
         return True
     
     def subscribe_tickets(self, user_id):
@@ -293,6 +442,7 @@ class UsersManager(BaseDataManager):
         for i in self.users_list():
             await bot.api.send_like(i, 10)
         self.data["todays_likes"].append(date)
+        self.mark_dirty()
         return True
     
     async def check_friend_status(self, bot: BasePlugin):
@@ -325,6 +475,7 @@ class UsersManager(BaseDataManager):
             if str(t['id']) == ticket_id:
                 t['mode'] = new_mode
                 break
+        self._reindex_user(user_id)
 
     def update_event_subscribe_mode(self, user_id, event_id, new_mode):
         """
@@ -337,6 +488,7 @@ class UsersManager(BaseDataManager):
             if str(e['id']) == event_id:
                 e['mode'] = new_mode
                 break
+        self._reindex_user(user_id)
     
     def migrate_event_subscriptions(self, from_event_id: str, to_event_id: str):
         """
@@ -354,6 +506,7 @@ class UsersManager(BaseDataManager):
                 if str(e['id']) == from_event_id:
                     e['id'] = to_event_id
                     migrated_count += 1
+                    self._reindex_user(user_id)
                     break
         
         return migrated_count
@@ -382,6 +535,7 @@ class UsersManager(BaseDataManager):
             if exclude_events:
                 actor_entry['exclude_events'] = [str(e) for e in exclude_events]
             actors.append(actor_entry)
+        self.mark_dirty()
         return True
     
     def remove_actor_subscribe(self, user_id, actor_name):
@@ -442,6 +596,7 @@ class UsersManager(BaseDataManager):
                 tickets_to_keep.append(ticket)
         
         self.data["users"][user_id]["subscribe"]["subscribe_tickets"] = tickets_to_keep
+        self._reindex_user(user_id)
         
         return {
             'actor_removed': actor_removed,
@@ -486,7 +641,7 @@ class UsersManager(BaseDataManager):
                     actor_lower = actor_name.lower()
                     if not any(a.strip().lower() == actor_lower for a in related_actors):
                         related_actors.append(actor_name)
-                
+                self.mark_dirty()
                 return True
         
         return False
@@ -501,5 +656,6 @@ class UsersManager(BaseDataManager):
         for a in actors:
             if a.get('actor', '').strip().lower() == actor_name:
                 a['mode'] = new_mode
+                self.mark_dirty()
                 break
 
@@ -0,0 +1,58 @@
+"""
+JSON 编解码
+
+数据管理器的持久化、缓存快照和 HTTP 响应解析统一走这里：
+安装了 orjson 时使用 orjson，否则退回标准库 json（使用 C 编码器的紧凑格式）。
+两种实现的输出都是 UTF-8、无多余空白，可以互相读取。
+
+    from plugins.AdminPlugin import codec
+    text = codec.dumps(data)
+    data = codec.loads(await resp.read())  # 自动去除 BOM
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = "orjson" if orjson else "json"
+# orjson.JSONDecodeError 是 json.JSONDecodeError 的子类，两种实现都可以用它捕获
+JSONDecodeError = json.JSONDecodeError
+
+_BOM = "\ufeff"
+_BOM_BYTES = _BOM.encode("utf-8")
+
+
+def dumps(obj, pretty=False) -> str:
+    """序列化为字符串；pretty 为 True 时缩进 2 格，便于人工查看"""
+    if orjson:
+        option = orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option).decode("utf-8")
+    if pretty:
+        return json.dumps(obj, ensure_ascii=False, indent=2)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def loads(data):
+    """反序列化 str/bytes，自动去除开头的 UTF-8 BOM"""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(data)
+        if data.startswith(_BOM_BYTES):
+            data = data[len(_BOM_BYTES):]
+        return orjson.loads(data) if orjson else json.loads(data.decode("utf-8"))
+    if data.startswith(_BOM):
+        data = data[1:]
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+def load_file(path):
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+def dump_file(obj, path, pretty=False):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(dumps(obj, pretty))
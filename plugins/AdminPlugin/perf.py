@@ -0,0 +1,198 @@
+"""
+运行耗时统计
+
+按名称记录耗时直方图、错误数和正在执行的数量，名称约定：
+
+- ``cmd:<命令名>``：user_command_wrapper 包装的命令
+- ``http:<host><路径>``：http_client 发出的请求（到收到响应头为止，路径中的数字替换为 N）
+- ``save:<数据管理器>``：BaseDataManager.save 实际写盘的保存
+
+用法::
+
+    from plugins.AdminPlugin.perf import perf
+
+    with perf.timer("cmd:hlq") as t:
+        ...
+        t.error = True  # 捕获了异常但仍要计为错误时
+
+    perf.report()  # 文本报告（p50/p95/p99）
+    perf.flush()   # 写入 data/perf_stats.json
+
+直方图使用对数分桶（相邻桶上界相差约 19%），百分位数取所在桶的上界，
+因此只占用固定内存，误差不超过一个桶宽。
+"""
+import bisect
+import math
+import os
+import time
+from datetime import datetime
+
+from plugins.AdminPlugin import codec
+from plugins.AdminPlugin.storage import write_json_file
+
+MIN_SECONDS = 0.001
+MAX_SECONDS = 600.0
+BUCKETS_PER_DOUBLING = 4
+STATS_FILE = "data/perf_stats.json"
+
+# 各桶的上界（秒）；超过 MAX_SECONDS 的计入最后一个桶
+_BOUNDS = [
+    MIN_SECONDS * 2 ** (i / BUCKETS_PER_DOUBLING)
+    for i in range(math.ceil(math.log2(MAX_SECONDS / MIN_SECONDS) * BUCKETS_PER_DOUBLING) + 1)
+]
+
+
+class LatencyHistogram:
+
+    def __init__(self):
+        self.counts = [0] * len(_BOUNDS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[min(bisect.bisect_left(_BOUNDS, seconds), len(_BOUNDS) - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p):
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * p / 100)
+        seen = 0
+        for bound, n in zip(_BOUNDS, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        # 只保存非空的桶：{桶序号: 数量}
+        return {"count": self.count, "total": round(self.total, 6), "max": round(self.max, 6),
+                "buckets": {i: n for i, n in enumerate(self.counts) if n}}
+
+
+class Metric:
+
+    def __init__(self):
+        self.histogram = LatencyHistogram()
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+
+class _Timer:
+    """同时支持 with 和 async with；在 with 块中可以设置 error = True"""
+
+    __slots__ = ("registry", "name", "error", "_start")
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+        self.error = False
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        self.registry.begin(self.name)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.end(self.name, time.perf_counter() - self._start, error=self.error or exc_type is not None)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+class PerfRegistry:
+
+    def __init__(self):
+        self.metrics = {}
+        self.started_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def _metric(self, name):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = Metric()
+        return metric
+
+    def timer(self, name):
+        return _Timer(self, name)
+
+    def begin(self, name):
+        metric = self._metric(name)
+        metric.in_flight += 1
+        metric.max_in_flight = max(metric.max_in_flight, metric.in_flight)
+
+    def end(self, name, seconds, error=False):
+        metric = self._metric(name)
+        metric.in_flight = max(0, metric.in_flight - 1)
+        self.record(name, seconds, error)
+
+    def record(self, name, seconds, error=False):
+        """记录一次已经结束的调用（不经过 timer 时使用）"""
+        metric = self._metric(name)
+        metric.histogram.add(seconds)
+        if error:
+            metric.errors += 1
+
+    def reset(self):
+        self.metrics.clear()
+        self.started_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def summary(self, prefix=None):
+        """
+        Returns:
+            dict: {name: {"count", "errors", "in_flight", "max_in_flight", "mean", "p50", "p95", "p99", "max"}}（秒）
+        """
+        result = {}
+        for name, metric in sorted(self.metrics.items()):
+            if prefix and not name.startswith(prefix):
+                continue
+            h = metric.histogram
+            result[name] = {
+                "count": h.count,
+                "errors": metric.errors,
+                "in_flight": metric.in_flight,
+                "max_in_flight": metric.max_in_flight,
+                "mean": round(h.total / h.count, 4) if h.count else 0.0,
+                "p50": round(h.percentile(50), 4),
+                "p95": round(h.percentile(95), 4),
+                "p99": round(h.percentile(99), 4),
+                "max": round(h.max, 4),
+            }
+        return result
+
+    def report(self, prefix=None, sort_by="p95", limit=30):
+        """按 sort_by 从大到小排列的文本报告"""
+        rows = sorted(self.summary(prefix).items(), key=lambda x: x[1].get(sort_by, 0), reverse=True)[:limit]
+        if not rows:
+            return "暂无耗时数据。"
+        lines = [f"耗时统计（自 {self.started_at} 起，单位 ms，按 {sort_by} 排序）："]
+        for name, s in rows:
+            lines.append(
+                f"{name}\n  次数 {s['count']} 错误 {s['errors']} 执行中 {s['in_flight']}（峰值 {s['max_in_flight']}）"
+                f" | p50 {s['p50'] * 1000:.0f} p95 {s['p95'] * 1000:.0f} p99 {s['p99'] * 1000:.0f} max {s['max'] * 1000:.0f}"
+            )
+        return "\n".join(lines)
+
+    def flush(self, path=STATS_FILE):
+        """把当前统计写入 path（紧凑 JSON，直方图只保存非空的桶）"""
+        data = {
+            "started_at": self.started_at,
+            "flushed_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "bounds": {"min": MIN_SECONDS, "buckets_per_doubling": BUCKETS_PER_DOUBLING},
+            "summary": self.summary(),
+            "histograms": {name: m.histogram.to_dict() for name, m in self.metrics.items()},
+        }
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        write_json_file(path, codec.dumps(data))
+
+
+perf = PerfRegistry()
@@ -0,0 +1,258 @@
+"""
+数据管理器的持久化后端
+
+BaseDataManager 通过 storage 对象读写 self.data，目前支持两种后端：
+
+- JsonStorage：默认后端，与原来一样把整个 data 写成一个 JSON 文件（默认紧凑格式，
+  先写临时文件再 os.replace 原子替换，替换前把旧文件硬链接为 .bak）
+- SqliteStorage：所有管理器共用一个 SQLite 数据库（WAL 模式），
+  每个顶层键（若值为字典，则细分到它的每个子键）存为一行，
+  保存时只写入内容发生变化的行
+
+通过环境变量 DATA_MANAGER_BACKEND=sqlite 切换到 SQLite。首次以 SQLite 启动时，
+若数据库中没有该管理器的数据而原 JSON 文件存在，会自动从 JSON 迁移一次（原文件保留不动，
+无法解析时改用 .bak 备份）。
+也可以手动迁移 data/data_manager 下的全部 JSON 文件::
+
+    python -m plugins.AdminPlugin.storage [data/data_manager/]
+"""
+import hashlib
+import os
+import shutil
+import sqlite3
+import sys
+import time
+
+from plugins.AdminPlugin import codec
+
+SQLITE_FILE_NAME = "data_managers.sqlite3"
+# sub 列：'' 表示整个顶层值；顶层值为字典时 '' 行的 value 为 NULL，子键存为 ':' + 子键
+DICT_PREFIX = ":"
+
+
+def storage_name(file_path):
+    """管理器在 SQLite 中的名称，取 JSON 文件名（不含扩展名）"""
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+
+def create_storage(backend, file_path, work_path):
+    if backend == "sqlite":
+        return SqliteStorage(os.path.join(work_path, SQLITE_FILE_NAME), storage_name(file_path), json_path=file_path)
+    if backend == "json":
+        return JsonStorage(file_path)
+    raise ValueError(f"未知的持久化后端: {backend}")
+
+
+def write_json_file(file_path, text, pretty=False):
+    """
+    把 JSON 文本写入 file_path。pretty 为 True 时先重新排版为缩进格式。
+    写入临时文件并 fsync 后用 os.replace 原子替换，任何时刻 file_path 都是完整的文件。
+    """
+    if pretty:
+        text = codec.dumps(codec.loads(text), pretty=True)
+    tmp_path = f"{file_path}.tmp{os.getpid()}"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(file_path):
+            _backup(file_path)
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _backup(file_path):
+    # 备份机制：替换前保留上一版文件为 .bak（优先硬链接，不复制数据）
+    backup_path = file_path + ".bak"
+    try:
+        if os.path.exists(backup_path):
+            os.remove(backup_path)
+        try:
+            os.link(file_path, backup_path)
+        except OSError:
+            shutil.copy2(file_path, backup_path)
+    except Exception as e:
+        print(f"备份原数据文件失败: {e}")
+
+
+class JsonStorage:
+
+    def __init__(self, file_path, pretty=False):
+        self.file_path = file_path
+        self.pretty = pretty
+
+    def exists(self):
+        return os.path.exists(self.file_path)
+
+    def load(self):
+        return codec.load_file(self.file_path)
+
+    def save(self, data):
+        self.save_snapshot(codec.dumps(data))
+
+    def save_snapshot(self, text):
+        """写入由 BaseDataManager 在事件循环中生成的 JSON 快照文本，可在工作线程中调用"""
+        write_json_file(self.file_path, text, self.pretty)
+
+    def close(self):
+        pass
+
+
+class SqliteStorage:
+
+    def __init__(self, db_path, name, json_path=None):
+        self.db_path = db_path
+        self.name = name
+        self.json_path = json_path
+        self._hashes = {}  # (key, sub) -> 上次写入内容的摘要
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS records ("
+                "manager TEXT NOT NULL, key TEXT NOT NULL, sub TEXT NOT NULL, value TEXT, "
+                "PRIMARY KEY (manager, key, sub))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS migrations ("
+                "manager TEXT PRIMARY KEY, source TEXT, migrated_at REAL)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _has_rows(self):
+        return self.conn.execute("SELECT 1 FROM records WHERE manager = ? LIMIT 1", (self.name,)).fetchone() is not None
+
+    def _migrated(self):
+        return self.conn.execute("SELECT 1 FROM migrations WHERE manager = ?", (self.name,)).fetchone() is not None
+
+    def exists(self):
+        if self._has_rows() or self._migrated():
+            return True
+        return bool(self.json_path) and os.path.exists(self.json_path)
+
+    def load(self):
+        if not self._has_rows() and not self._migrated() and self.json_path and os.path.exists(self.json_path):
+            return self.migrate_from_json(self.json_path)
+        data = {}
+        hashes = {}
+        rows = self.conn.execute(
+            "SELECT key, sub, value FROM records WHERE manager = ? ORDER BY rowid", (self.name,)
+        )
+        for key, sub, value in rows:
+            if sub == "":
+                data[key] = {} if value is None else codec.loads(value)
+            else:
+                data.setdefault(key, {})[sub[len(DICT_PREFIX):]] = codec.loads(value)
+            hashes[(key, sub)] = _digest(value)
+        self._hashes = hashes
+        return data
+
+    def migrate_from_json(self, json_path):
+        """
+        把 JSON 文件中的数据整体写入数据库，并记录迁移来源，之后不再重复迁移。
+        JSON 文件损坏（例如旧版本非原子写入时中断）而 .bak 备份存在时，改为从备份迁移。
+        """
+        try:
+            data = JsonStorage(json_path).load()
+        except codec.JSONDecodeError:
+            backup_path = json_path + ".bak"
+            if not os.path.exists(backup_path):
+                raise
+            print(f"{json_path} 无法解析，改为从备份 {backup_path} 迁移")
+            json_path = backup_path
+            data = JsonStorage(json_path).load()
+        self._hashes = {}
+        self.save(data)
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO migrations (manager, source, migrated_at) VALUES (?, ?, ?)",
+                (self.name, os.path.abspath(json_path), time.time()),
+            )
+        print(f"已将 {json_path} 迁移到 {self.db_path}（{self.name}）")
+        return data
+
+    def save(self, data):
+        """
+        只写入与上次保存/加载时内容不同的行，并删除已不存在的行
+
+        Returns:
+            int: 写入和删除的行数
+        """
+        rows = {}
+        for key, value in data.items():
+            key = str(key)
+            if isinstance(value, dict):
+                rows[(key, "")] = None
+                for sub, item in value.items():
+                    rows[(key, f"{DICT_PREFIX}{sub}")] = codec.dumps(item)
+            else:
+                rows[(key, "")] = codec.dumps(value)
+        hashes = {k: _digest(v) for k, v in rows.items()}
+        changed = [(self.name, k[0], k[1], rows[k]) for k, h in hashes.items() if self._hashes.get(k) != h]
+        removed = [(self.name, k[0], k[1]) for k in self._hashes.keys() - hashes.keys()]
+        if changed or removed:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO records (manager, key, sub, value) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (manager, key, sub) DO UPDATE SET value = excluded.value",
+                    changed,
+                )
+                self.conn.executemany(
+                    "DELETE FROM records WHERE manager = ? AND key = ? AND sub = ?", removed
+                )
+        self._hashes = hashes
+        return len(changed) + len(removed)
+
+    def save_snapshot(self, text):
+        return self.save(codec.loads(text))
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def _digest(text):
+    if text is None:
+        return b""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def migrate_json_files(work_path="data/data_manager/", db_path=None):
+    """
+    把 work_path 下所有管理器的 JSON 文件迁移到 SQLite（已迁移或已有数据的管理器跳过）
+
+    Returns:
+        list[str]: 本次迁移的管理器名称
+    """
+    db_path = db_path or os.path.join(work_path, SQLITE_FILE_NAME)
+    migrated = []
+    for file_name in sorted(os.listdir(work_path)):
+        if not file_name.endswith(".json"):
+            continue
+        json_path = os.path.join(work_path, file_name)
+        storage = SqliteStorage(db_path, storage_name(json_path), json_path=json_path)
+        try:
+            if storage._has_rows() or storage._migrated():
+                print(f"跳过 {file_name}：数据库中已有数据")
+                continue
+            storage.migrate_from_json(json_path)
+            migrated.append(storage.name)
+        finally:
+            storage.close()
+    return migrated
+
+
+if __name__ == "__main__":
+    migrate_json_files(*sys.argv[1:2])
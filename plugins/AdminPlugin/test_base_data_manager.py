@@ -0,0 +1,78 @@
+"""
+测试数据管理器的保存跳过逻辑
+"""
+import asyncio
+import threading
+
+from plugins.AdminPlugin.BaseDataManager import BaseDataManager
+
+
+class Counter(BaseDataManager):
+    save_debounce_seconds = None
+
+
+def make_manager(tmp_path):
+    # 数据管理器是单例，每个测试重新创建
+    if "_instance" in Counter.__dict__:
+        del Counter._instance
+    manager = Counter(str(tmp_path / "counter.json"))
+    manager.storage.save_snapshot = writes = _recorder(manager.storage.save_snapshot)
+    return manager, writes
+
+
+def _recorder(func):
+    def wrapper(text):
+        wrapper.texts.append(text)
+        return func(text)
+    wrapper.texts = []
+    return wrapper
+
+
+def test_unchanged_data_is_not_serialized(tmp_path, monkeypatch):
+    manager, writes = make_manager(tmp_path)
+    fail = lambda *args: (_ for _ in ()).throw(AssertionError("不应生成快照"))
+    monkeypatch.setattr(manager, "_structure_snapshot", fail)
+    monkeypatch.setattr(manager, "_snapshot", fail)
+    result = asyncio.run(manager.save())
+    assert result["skipped"] and writes.texts == []
+
+
+def test_marked_change_is_written(tmp_path):
+    manager, writes = make_manager(tmp_path)
+    manager.data["a"] = 1
+    manager.mark_dirty()
+    assert not asyncio.run(manager.save())["skipped"]
+    assert len(writes.texts) == 1 and not manager.is_dirty()
+    assert asyncio.run(manager.save())["skipped"]
+
+
+def test_force_save_catches_unmarked_change(tmp_path):
+    manager, writes = make_manager(tmp_path)
+    manager.data["a"] = 1  # 没有调用 mark_dirty
+    assert asyncio.run(manager.save())["skipped"]
+    assert not asyncio.run(manager.save(force=True))["skipped"]
+    # 摘要相同时 force 也跳过
+    assert asyncio.run(manager.save(force=True))["skipped"]
+    assert len(writes.texts) == 1
+
+
+def test_serialization_runs_in_worker_thread(tmp_path, monkeypatch):
+    manager, writes = make_manager(tmp_path)
+    snapshot = manager._snapshot
+    threads = []
+    monkeypatch.setattr(manager, "_snapshot", lambda data=None: threads.append(threading.get_ident()) or snapshot(data))
+    manager.data["a"] = {"x": 1}
+    manager.mark_dirty()
+
+    async def save_and_modify():
+        task = asyncio.ensure_future(manager.save())
+        await asyncio.sleep(0)
+        # 结构快照已经取走，之后的修改留到下一次保存
+        manager.data["a"]["y"] = 2
+        manager.data["b"] = 3
+        return await task, threading.get_ident()
+
+    result, loop_thread = asyncio.run(save_and_modify())
+    assert not result["skipped"]
+    assert threads and loop_thread not in threads
+    assert writes.texts == ['{"a":{"x":1}}']
@@ -0,0 +1,101 @@
+"""
+测试 SQLite 持久化后端与从 JSON 迁移
+"""
+import json
+import sqlite3
+
+import pytest
+
+from plugins.AdminPlugin import codec
+from plugins.AdminPlugin.storage import SqliteStorage, migrate_json_files
+
+DATA = {
+    "users": {"1": {"mode": 1, "tickets": ["a", "b"]}, "2": {"mode": 0, "tickets": []}},
+    "users_list": ["1", "2"],
+    "update_time": "2025-08-04 12:00:00",
+    "empty": {},
+}
+
+
+def make_storage(tmp_path, name="Users", json_path=None):
+    return SqliteStorage(str(tmp_path / "db.sqlite3"), name, json_path=json_path)
+
+
+def rows(tmp_path, name="Users"):
+    with sqlite3.connect(str(tmp_path / "db.sqlite3")) as conn:
+        return {(key, sub): value for key, sub, value in
+                conn.execute("SELECT key, sub, value FROM records WHERE manager = ?", (name,))}
+
+
+def test_roundtrip(tmp_path):
+    storage = make_storage(tmp_path)
+    assert not storage.exists()
+    storage.save(DATA)
+    storage.close()
+    reloaded = make_storage(tmp_path)
+    assert reloaded.exists()
+    assert reloaded.load() == DATA
+    # 其他管理器的数据互不影响
+    assert make_storage(tmp_path, "Other").load() == {}
+
+
+def test_only_dirty_rows_are_written(tmp_path):
+    storage = make_storage(tmp_path)
+    assert storage.save(DATA) == len(rows(tmp_path))
+    assert storage.save(json.loads(json.dumps(DATA))) == 0
+
+    data = json.loads(json.dumps(DATA))
+    data["users"]["1"]["mode"] = 3
+    del data["users"]["2"]
+    del data["update_time"]
+    before = rows(tmp_path)
+    # 修改 1 行，删除 2 行
+    assert storage.save_snapshot(codec.dumps(data)) == 3
+    after = rows(tmp_path)
+    assert codec.loads(after[("users", ":1")])["mode"] == 3
+    assert ("users", ":2") not in after and ("update_time", "") not in after
+    assert {k: v for k, v in after.items() if k != ("users", ":1")} == \
+        {k: v for k, v in before.items() if k not in {("users", ":1"), ("users", ":2"), ("update_time", "")}}
+    # 加载后的摘要与已写入的一致，没有变化时不再写入
+    reloaded = make_storage(tmp_path)
+    assert reloaded.load() == data
+    assert reloaded.save(data) == 0
+
+
+def test_load_migrates_json_once(tmp_path):
+    json_path = tmp_path / "Users.json"
+    json_path.write_text(json.dumps(DATA), encoding="utf-8")
+    storage = make_storage(tmp_path, json_path=str(json_path))
+    assert storage.exists()
+    assert storage.load() == DATA
+    # 迁移后改动 JSON 文件不会再次迁移
+    json_path.write_text(json.dumps({"users": {}}), encoding="utf-8")
+    assert make_storage(tmp_path, json_path=str(json_path)).load() == DATA
+
+
+def test_migrate_falls_back_to_backup(tmp_path):
+    json_path = tmp_path / "Users.json"
+    json_path.write_text('{"users": {"1": ', encoding="utf-8")
+    (tmp_path / "Users.json.bak").write_text(json.dumps(DATA), encoding="utf-8")
+    storage = make_storage(tmp_path, json_path=str(json_path))
+    assert storage.migrate_from_json(str(json_path)) == DATA
+    source = storage.conn.execute("SELECT source FROM migrations WHERE manager = 'Users'").fetchone()[0]
+    assert source.endswith("Users.json.bak")
+    assert make_storage(tmp_path).load() == DATA
+
+
+def test_migrate_without_backup_raises(tmp_path):
+    json_path = tmp_path / "Users.json"
+    json_path.write_text('{"users": ', encoding="utf-8")
+    with pytest.raises(codec.JSONDecodeError):
+        make_storage(tmp_path, json_path=str(json_path)).migrate_from_json(str(json_path))
+
+
+def test_migrate_json_files_skips_migrated(tmp_path):
+    for name in ("Users", "Alias"):
+        (tmp_path / f"{name}.json").write_text(json.dumps({"name": name}), encoding="utf-8")
+    (tmp_path / "notes.txt").write_text("", encoding="utf-8")
+    db_path = str(tmp_path / "db.sqlite3")
+    assert migrate_json_files(str(tmp_path), db_path) == ["Alias", "Users"]
+    assert migrate_json_files(str(tmp_path), db_path) == []
+    assert make_storage(tmp_path, "Alias").load() == {"name": "Alias"}
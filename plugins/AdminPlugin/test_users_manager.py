@@ -0,0 +1,118 @@
+"""
+测试订阅倒排索引：announce_targets / event_subscriber_count 与逐个用户扫描的结果一致
+"""
+from plugins.AdminPlugin.UsersManager import UsersManager
+
+MODE = {"add": 1, "new": 1, "pending": 1, "return": 2, "back": 3, "sold": 3}
+TICKETS = {
+    "t1": {"categorized": "new", "event_id": "e1"},
+    "t2": {"categorized": "return", "event_id": "e1"},
+    "t3": {"categorized": "back", "event_id": "e2"},
+    "t4": {"categorized": "sold", "event_id": "e3"},
+}
+
+
+def make_manager(tmp_path, monkeypatch):
+    # 数据管理器是单例，测试结束后恢复原来的实例
+    monkeypatch.delattr(UsersManager, "_instance", raising=False)
+    return UsersManager(str(tmp_path / "users.json"))
+
+
+def _max_mode(items, _id):
+    modes = [int(item["mode"]) for item in items if str(item["id"]) == _id]
+    return max(modes) if modes else None
+
+
+def scan_targets(manager, tickets, is_group=False):
+    """不使用索引，逐个用户/群扫描订阅数据"""
+    items = manager.data["groups" if is_group else "users"]
+    global_modes = {_id: int(item["attention_to_hulaquan"]) for _id, item in items.items()
+                    if int(item["attention_to_hulaquan"]) in (1, 2, 3)}
+    personal = {}
+    if is_group:
+        return global_modes, personal
+    for user_id, user in items.items():
+        subscribe = user["subscribe"]
+        for tid, ticket in tickets.items():
+            eid, stat = ticket["event_id"], ticket["categorized"]
+            for mode in (_max_mode(subscribe["subscribe_tickets"], tid), _max_mode(subscribe["subscribe_events"], eid)):
+                if mode is not None and mode >= MODE[stat]:
+                    personal.setdefault(user_id, {}).setdefault(eid, {}).setdefault(stat, set()).add(tid)
+    return global_modes, personal
+
+
+def scan_subscriber_count(manager, event_id, ticket_ids):
+    return sum(
+        1 for user in manager.data["users"].values()
+        if _max_mode(user["subscribe"]["subscribe_events"], event_id) is not None
+        or any(_max_mode(user["subscribe"]["subscribe_tickets"], tid) is not None for tid in ticket_ids)
+    )
+
+
+def assert_matches_scan(manager):
+    for is_group in (False, True):
+        assert manager.announce_targets(TICKETS, MODE, is_group) == scan_targets(manager, TICKETS, is_group)
+    for eid, tids in (("e1", ["t1", "t2"]), ("e2", ["t3"]), ("e3", ["t4"]), ("e9", [])):
+        assert manager.event_subscriber_count(eid, tids) == scan_subscriber_count(manager, eid, tids)
+
+
+def subscribe_all(manager):
+    manager.add_ticket_subscribe("1", "t1", 1)
+    manager.add_event_subscribe("1", "e2", 3)
+    manager.add_event_subscribe("2", ["e1"], "2")
+    manager.switch_attention_to_hulaquan("2", 1)
+    manager.switch_attention_to_hulaquan("3", 3)
+    # 同一场次重复关注时取最高模式
+    manager.add_ticket_subscribe("4", ["t1", "t4"], 1)
+    manager.add_ticket_subscribe("4", "t1", 3)
+    manager.switch_attention_to_hulaquan("g1", 2, is_group=True)
+
+
+def test_index_matches_scan(tmp_path, monkeypatch):
+    manager = make_manager(tmp_path, monkeypatch)
+    subscribe_all(manager)
+    assert_matches_scan(manager)
+    global_modes, personal = manager.announce_targets(TICKETS, MODE)
+    assert global_modes == {"2": 1, "3": 3}
+    # t4 只以模式 1 关注，不接收售出提醒
+    assert personal["4"] == {"e1": {"new": {"t1"}}}
+    assert manager.event_subscriber_count("e1", ["t1", "t2"]) == 3
+
+
+def test_index_follows_removal_and_resubscription(tmp_path, monkeypatch):
+    manager = make_manager(tmp_path, monkeypatch)
+    subscribe_all(manager)
+
+    manager.remove_ticket_subscribe("1", "t1")
+    manager.update_event_subscribe_mode("1", "e2", 1)
+    manager.switch_attention_to_hulaquan("3", 0)
+    assert_matches_scan(manager)
+    assert "1" not in manager.announce_targets(TICKETS, MODE)[1]
+
+    manager.delete_user("2")
+    manager.delete_user("4")
+    manager.delete_group("g1")
+    assert_matches_scan(manager)
+    assert manager.announce_targets(TICKETS, MODE) == ({}, {})
+    assert manager.event_subscriber_count("e1", ["t1", "t2"]) == 0
+
+    # 删除后重新关注
+    manager.add_ticket_subscribe("2", "t2", 2)
+    manager.switch_attention_to_hulaquan("2", 2)
+    manager.add_event_subscribe("1", "e2", 3)
+    assert_matches_scan(manager)
+    assert manager.announce_targets(TICKETS, MODE)[1] == {
+        "1": {"e2": {"back": {"t3"}}},
+        "2": {"e1": {"return": {"t2"}}},
+    }
+
+
+def test_index_is_rebuilt_on_load(tmp_path, monkeypatch):
+    manager = make_manager(tmp_path, monkeypatch)
+    subscribe_all(manager)
+    manager.storage.save(manager.data)
+    expected = manager.announce_targets(TICKETS, MODE)
+    monkeypatch.delattr(UsersManager, "_instance")
+    reloaded = UsersManager(str(tmp_path / "users.json"))
+    assert reloaded.announce_targets(TICKETS, MODE) == expected
+    assert_matches_scan(reloaded)
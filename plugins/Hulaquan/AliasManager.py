@@ -6,6 +6,8 @@ class AliasManager(BaseDataManager):
     功能：
     别名系统
     """
+    save_debounce_seconds = 30
+
     def __init__(self, file_path="data/data_manager/alias.json", *args, **kwargs):
         super().__init__(file_path, *args, **kwargs)
         # 新数据结构
@@ -35,6 +37,7 @@ class AliasManager(BaseDataManager):
         event_id = str(event_id)
         alias = alias.strip().lower()
         self.data["alias_to_event"][alias] = event_id
+        self.mark_dirty()
         # 不自动添加到 event_to_names
         return True
 
@@ -48,6 +51,7 @@ class AliasManager(BaseDataManager):
         if search_name not in self.data["event_to_names"][event_id]:
             self.data["event_to_names"][event_id].append(search_name)
         self.data["name_to_alias"][search_name] = event_id
+        self.mark_dirty()
         return True
 
     def delete_alias(self, alias):
@@ -59,6 +63,7 @@ class AliasManager(BaseDataManager):
             for k in list(self.data["no_response"].keys()):
                 if k.startswith(f"{alias}:"):
                     del self.data["no_response"][k]
+            self.mark_dirty()
             return True
         return False
 
@@ -70,13 +75,18 @@ class AliasManager(BaseDataManager):
             if not self.data["event_to_names"][event_id]:
                 del self.data["event_to_names"][event_id]
         self.data["name_to_alias"].pop(search_name, None)
+        self.mark_dirty()
         return True
 
     def set_no_response(self, alias, search_name, reset=False):
         key = f"{alias}:{search_name}"
         if reset:
-            self.data["no_response"][key] = 0
+            # 每次查询成功都会调用，计数本来就是 0 时不登记修改
+            if self.data["no_response"].get(key) != 0:
+                self.data["no_response"][key] = 0
+                self.mark_dirty()
         else:
+            self.mark_dirty()
             self.data["no_response"][key] = self.data["no_response"].get(key, 0) + 1
             if self.data["no_response"][key] >= 2:
                 self.delete_alias(alias)
@@ -109,14 +119,19 @@ class AliasManager(BaseDataManager):
             for k in list(self.data["no_response"].keys()):
                 if k.startswith(f"{alias}:"):
                     del self.data["no_response"][k]
+            self.mark_dirty()
             return True
         return False
 
     def set_no_response(self, alias, search_name, reset=False):
         key = f"{alias}:{search_name}"
         if reset:
-            self.data["no_response"][key] = 0
+            # 每次查询成功都会调用，计数本来就是 0 时不登记修改
+            if self.data["no_response"].get(key) != 0:
+                self.data["no_response"][key] = 0
+                self.mark_dirty()
         else:
+            self.mark_dirty()
             self.data["no_response"][key] = self.data["no_response"].get(key, 0) + 1
             if self.data["no_response"][key] >= 2:
                 self.delete(alias)
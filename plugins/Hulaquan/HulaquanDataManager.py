@@ -1,14 +1,21 @@
 from datetime import datetime, timedelta
 from plugins.Hulaquan.utils import *
 from plugins.Hulaquan import BaseDataManager
+from plugins.AdminPlugin import codec
 from collections import defaultdict
 from .Exceptions import *
+from .http_client import get_session, route
+from .ticket_state import TicketStateStore
+from .change_journal import ChangeJournal
+from .cast_cache import CastCache
+from .actor_index import ActorIndex
+from .title_index import TitleIndex
+from .date_index import TicketDateIndex
+from .cycle_trace import span, count
+from .refresh_scheduler import EventRefreshScheduler
 import aiohttp
-import os, shutil
-import copy
-import json
+import os
 import asyncio
-import re
 
 """
     更新思路：
@@ -32,6 +39,15 @@ class HulaquanDataManager(BaseDataManager):
         "update_time":datetime
     }
     """
+    # 增量刷新：每轮只重新获取推荐列表中 update_time/票数有变化的剧目详情，
+    # 每 full_refresh_every 轮做一次全量刷新兜底
+    incremental_refresh = True
+    full_refresh_every = 10
+    # 定时任务按 scheduler 为每个剧目计算的间隔刷新（见 refresh_scheduler.py），
+    # 关闭时回到每 scheduled_task_time 秒一轮的增量刷新
+    adaptive_refresh = True
+    EVENT_SIGNATURE_KEYS = ("update_time", "total_ticket", "left_ticket_count", "ticket_count")
+
     def __init__(self, file_path=None):
         super().__init__(file_path)
            
@@ -48,21 +64,72 @@ class HulaquanDataManager(BaseDataManager):
         self.data.setdefault("events", {})  # 确保有一个事件字典来存储数据
         self.data["pending_events"] = self.data.get("pending_events", {}) # 确保有一个pending_events来存储待办事件
         self.data["ticket_id_to_event_id"] = self.data.get("ticket_id_to_event_id", {})
+        self._event_signatures = {}  # event_id -> 推荐列表中的变化特征，不持久化，重启后首轮全量刷新
+        self._changed_event_ids = set()
+        self._refresh_round = 0
+        self.ticket_states = TicketStateStore()  # 上一轮的票务状态，用于比较
+        self.ticket_states.commit(self.data["events"], self.data.get("update_time"))
+        self.journal = ChangeJournal(
+            os.path.join(os.getcwd(), "update_data_cache"),
+            legacy_roots=[os.path.join(os.getcwd(), "error_announcement_cache")],
+        )  # 票务变动日志
+        self._refreshed_event_ids = []  # 最近一轮刷新了详情的剧目，变动日志只比较这些剧目
+        self.data.setdefault("cast_cache", {})
+        self.cast_cache = CastCache(self.data["cast_cache"])  # 场次卡司/城市解析缓存
+        self.actor_index = ActorIndex()  # 演员 -> 场次，随卡司缓存增量更新
+        self.cast_cache.on_update = self._on_cast_update
+        self._build_actor_index()
+        self.cast_cache.prune()
+        self.title_index = TitleIndex()  # 剧名检索索引
+        self.title_index.sync(self.data["events"])
+        self.date_index = TicketDateIndex()  # 开演日期 -> 场次，供 /date 查询
+        self.date_index.sync(self.data["events"])
+        self.scheduler = EventRefreshScheduler()  # 自适应刷新的调度状态
         self.update_ticket_dict_async()
 
+    def _build_actor_index(self):
+        for ticket_id, entry in self.cast_cache.data.items():
+            ticket = self.ticket(ticket_id)
+            if not ticket or ticket.get("start_time") != entry["start_time"]:
+                continue
+            if entry["cast"]:
+                self.actor_index.update(ticket_id, entry["cast"])
+
+    def _on_cast_update(self, ticket_id, cast):
+        """卡司缓存写入或失效时同步演员索引，并标记数据需要保存"""
+        self.actor_index.update(ticket_id, cast)
+        self.mark_dirty()
+
     async def _update_events_dict_async(self):
         data = await self.search_all_events_async()
         data_dic = {"events": {}, "update_time": ""}
         keys_to_extract = ["id", "title", "location", "start_time", "end_time", "update_time", "deadline", "create_time"]
+        old_events = self.data.get("events", {})
+        changed = set()
         for event in data:
             event_id = event['id'] = str(event['id'])
             Stats.register_event(event['title'], event_id)
             if event_id not in data_dic["events"]:
                 data_dic["events"][event_id] = {key: event.get(key, None) for key in keys_to_extract}
+                # 沿用旧的票务详情，是否需要重新获取由 _select_events_to_refresh 决定
+                old_tickets = old_events.get(event_id, {}).get("ticket_details")
+                if old_tickets is not None:
+                    data_dic["events"][event_id]["ticket_details"] = old_tickets
+                signature = tuple(event.get(key) for key in self.EVENT_SIGNATURE_KEYS)
+                if old_tickets is None or self._event_signatures.get(event_id) != signature:
+                    changed.add(event_id)
+                self._event_signatures[event_id] = signature
+        for event_id in set(self._event_signatures) - set(data_dic["events"]):
+            del self._event_signatures[event_id]
+        self._changed_event_ids = changed
         data_dic["update_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         self.data["events"] = data_dic["events"]
+        self.title_index.sync(self.data["events"])
+        self.date_index.sync(self.data["events"])
+        self.scheduler.on_list_refreshed(self.data["events"], changed)
         self.data["last_update_time"] = self.data.get("update_time", None)
         self.data["update_time"] = data_dic["update_time"]
+        self.mark_dirty()
         return data_dic
 
     async def search_all_events_async(self):
@@ -81,32 +148,55 @@ class HulaquanDataManager(BaseDataManager):
     async def search_events_data_by_recommendation_link_async(self, limit=12, page=0, timeMark=True, tags=None):
         recommendation_url = "https://clubz.cloudsation.com/site/getevent.html?filter=recommendation&access_token="
         try:
-            recommendation_url = recommendation_url + "&limit=" + str(limit) + "&page=" + str(page)
-            async with aiohttp.ClientSession() as session:
-                async with session.get(recommendation_url, timeout=8) as response:
-                    json_data = await response.text()
-                    json_data = json_data.encode().decode("utf-8-sig")  # 关键：去除BOM
-                    json_data = json.loads(json_data)
-                    if isinstance(json_data, bool):
-                        return False, False
-                    result = []
-                    for event in json_data["events"]:
-                        if not timeMark or (timeMark and event["timeMark"] > 0):
-                            if not tags or (tags and any(tag in event["tags"] for tag in tags)):
-                                result.append(event["basic_info"])
-                    return json_data["count"], result
+            recommendation_url = route(recommendation_url + "&limit=" + str(limit) + "&page=" + str(page))
+            session = await get_session(recommendation_url)
+            async with session.get(recommendation_url, timeout=8) as response:
+                json_data = codec.loads(await response.read())  # 关键：去除BOM
+                if isinstance(json_data, bool):
+                    return False, False
+                result = []
+                for event in json_data["events"]:
+                    if not timeMark or (timeMark and event["timeMark"] > 0):
+                        if not tags or (tags and any(tag in event["tags"] for tag in tags)):
+                            result.append(event["basic_info"])
+                return json_data["count"], result
         except Exception as e:
             return f"Error fetching recommendation: {e}", False
 
-    async def _update_events_data_async(self):
+    async def _update_events_data_async(self, adaptive=False):
         if self.updating:
             return self.data
         self.updating = True
+        self._refreshed_event_ids = []
         try:
-            await self._update_events_dict_async()
-            event_ids = list(self.events().keys())
-            # 并发批量更新
-            await asyncio.gather(*(self._update_ticket_details_async(eid) for eid in event_ids))
+            list_refreshed = not adaptive or self.scheduler.list_due()
+            if list_refreshed:
+                async with span("fetch_event_list"):
+                    await self._update_events_dict_async()
+            event_ids = self.scheduler.due() if adaptive else self._select_events_to_refresh()
+            count("events", len(self.events()))
+            count("detail_requests", len(event_ids))
+            self._refreshed_event_ids = event_ids
+            # 并发批量更新，单个剧目失败不影响其他剧目
+            async with span("fetch_details"):
+                results = await asyncio.gather(*(self._update_ticket_details_async(eid) for eid in event_ids),
+                                               return_exceptions=True)
+            errors = []
+            for eid, result in zip(event_ids, results):
+                if isinstance(result, BaseException) or not result:
+                    # 请求异常，或超时重试后放弃（返回空字典）
+                    self.scheduler.failed(eid)
+                    errors.append(result)
+            count("failed_requests", len(errors))
+            if errors and len(errors) == len(event_ids):
+                # 全部失败时按原来的方式抛出，由上新提醒报告给管理员；退避后下一轮不会立即重试
+                error = next((e for e in errors if isinstance(e, Exception)), None)
+                raise error or RequestTimeoutException(f"{len(errors)} 个剧目的详情请求全部超时")
+            if not list_refreshed and event_ids:
+                # 只刷新了部分剧目的详情，更新时间同样前移
+                self.data["last_update_time"] = self.data.get("update_time", None)
+                self.data["update_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                self.mark_dirty()
         except RequestTimeoutException:
             self.updating = False
             raise
@@ -116,12 +206,31 @@ class HulaquanDataManager(BaseDataManager):
         self.updating = False
         return self.data
 
+    def _select_events_to_refresh(self):
+        """
+        返回本轮需要重新获取票务详情的event_id列表：
+        1. 全量刷新轮次 / 关闭增量刷新时，返回全部剧目
+        2. 否则只返回推荐列表中有变化的剧目，以及含待开票场次的剧目（开票时上游不一定更新update_time）
+        """
+        full_sweep = (not self.incremental_refresh) or self._refresh_round % self.full_refresh_every == 0
+        self._refresh_round += 1
+        if full_sweep:
+            return list(self.events().keys())
+        event_ids = []
+        for eid, event in self.events().items():
+            if eid in self._changed_event_ids:
+                event_ids.append(eid)
+            elif any(t.get("status") == "pending" for t in event.get("ticket_details", {}).values()):
+                event_ids.append(eid)
+        return event_ids
+
     async def _update_ticket_details_async(self, event_id, data_dict=None):
         retry = 0
         while retry < 3:
             async with self.semaphore:
                 try:
-                    json_data = await self.search_event_by_id_async(event_id)
+                    async with span("fetch_detail", key=event_id):
+                        json_data = await self.search_event_by_id_async(event_id)
                     keys_to_extract = ["id","event_id","title", "start_time", "end_time","status","create_time","ticket_price","total_ticket", "left_ticket_count", "left_days", "valid_from"]
                     ticket_list = json_data["ticket_details"]
                     ticket_dump_list = {}
@@ -147,8 +256,19 @@ class HulaquanDataManager(BaseDataManager):
                         
                         if tid not in self.data['ticket_id_to_event_id'].keys():
                             self.data['ticket_id_to_event_id'][tid] = event_id
+                            self.mark_dirty()
+                    # 下架的场次移出演员索引，改期的场次需要重新解析卡司
+                    for tid, old_ticket in old_tickets.items():
+                        if tid not in ticket_dump_list:
+                            self.actor_index.discard(tid)
+                        elif old_ticket.get("start_time") != ticket_dump_list[tid]["start_time"]:
+                            self.cast_cache.invalidate(tid)
                     if data_dict is None:
                         self.data["events"][event_id]["ticket_details"] = ticket_dump_list
+                        self.date_index.update_event(event_id, ticket_dump_list)
+                        self.mark_dirty()
+                        self.scheduler.observe(event_id, self._tickets_changed(old_tickets, ticket_dump_list), ticket_dump_list,
+                                               User.event_subscriber_count(event_id, ticket_dump_list))
                         return self.data
                     else:
                         data_dict["events"][event_id]["ticket_details"] = ticket_dump_list
@@ -167,6 +287,16 @@ class HulaquanDataManager(BaseDataManager):
                     return {}
 
     
+    @staticmethod
+    def _tickets_changed(old_tickets, new_tickets):
+        """场次增减，或任一场次的余票 / 总票数 / 状态 / 开票时间变化"""
+        if old_tickets.keys() != new_tickets.keys():
+            return True
+        fields = TicketStateStore.FIELDS
+        return any(
+            old_tickets[tid].get(key) != ticket.get(key) for tid, ticket in new_tickets.items() for key in fields
+        )
+
     def events(self):
         return self.data["events"]
     
@@ -182,21 +312,14 @@ class HulaquanDataManager(BaseDataManager):
         if self.updating:
             # 当数据正在更新时，等到数据全部更新完再继续
             await self._wait_for_data_update()
-        data = self.events()
-        result = []
-        for eid, event in data.items():
-            title = event["title"]
-            if re.search(event_name, title, re.IGNORECASE):
-                result.append([eid, title])
-        return result
+        # 不再把输入当作正则：依次按完全相同、前缀、子串匹配，见 TitleIndex.search
+        return self.title_index.search(event_name)
     
     async def search_event_by_id_async(self, event_id):
-        event_url = f"https://clubz.cloudsation.com/event/getEventDetails.html?id={event_id}"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(event_url, timeout=15) as resp:
-                json_data = await resp.text()
-                json_data = json_data.encode().decode("utf-8-sig")  # 关键：去除BOM
-                return json.loads(json_data)
+        event_url = route(f"https://clubz.cloudsation.com/event/getEventDetails.html?id={event_id}")
+        session = await get_session(event_url)
+        async with session.get(event_url, timeout=15) as resp:
+            return codec.loads(await resp.read())  # 关键：去除BOM
         
     async def output_data_info(self):
         old_data = self.events()
@@ -207,22 +330,52 @@ class HulaquanDataManager(BaseDataManager):
 
 
     def get_max_ticket_content_length(self, tickets, ticket_title_key='title'):
-        max_len = 0
-        for ticket in tickets:
-            s = f"{ticket[ticket_title_key]} 余票{ticket['left_ticket_count']}/{ticket['total_ticket']}"
-            max_len = max(max_len, get_display_width(s))
-        return max_len
+        widths = get_display_widths(f"{ticket[ticket_title_key]} 余票{ticket['left_ticket_count']}/{ticket['total_ticket']}" for ticket in tickets)
+        return max(widths, default=0)
 
     # -------------------Query------------------------------ #         
     # ---------------------Announcement--------------------- #
-    async def compare_to_database_async(self):
-        old_data_all = copy.deepcopy(self.data)
-        new_data_all = await self._update_events_data_async()
+    async def compare_to_database_async(self, adaptive=False):
+        """
+        刷新数据并与上一轮比较。adaptive 为 True 时只刷新 scheduler 认为到期的剧目，
+        剧目列表也只在到期时获取，没有到期的剧目和列表时直接返回 None；
+        否则获取剧目列表并按 _select_events_to_refresh 增量刷新。
+        """
+        if adaptive and not self.refresh_due():
+            return None
+        # 旧数据取自票务状态版本库，只包含比较所需的字段
+        old_data_all = self.ticket_states.snapshot()
+        new_data_all = await self._update_events_data_async(adaptive)
+        error = None
         try:
             return await self.__compare_to_database(old_data_all, new_data_all)
         except Exception as e:
-            self.save_data_cache(old_data_all, new_data_all, "error_announcement_cache")
+            error = e
             raise  # 重新抛出异常，便于外层捕获和处理
+        finally:
+            self.ticket_states.commit(self.events(), self.data.get("update_time"), self._refreshed_event_ids)
+            await self._record_journal(error)
+            self.cast_cache.prune()
+
+    def refresh_due(self):
+        """自适应刷新时是否有到期的剧目或需要获取剧目列表（不占用每分钟的请求数）"""
+        return self.scheduler.seconds_until_due() <= 0
+
+    async def _record_journal(self, error=None):
+        """
+        把本轮刷新过的剧目的变动追加到变动日志，之前任意时刻的状态可用 self.journal.reconstruct(at) 还原。
+        写盘在工作线程中进行，写入失败只记录日志，不影响本轮的比较结果。
+        """
+        try:
+            records = self.journal.diff(self.events(), self._refreshed_event_ids, "error" if error else "update")
+            if error is not None:
+                records.append(self.journal.error_record(error))
+            if records:
+                await asyncio.to_thread(self.journal.write, records)
+        except Exception as e:
+            from ncatbot.utils.logger import get_log
+            log = get_log()
+            log.error(f"写入票务变动日志失败: {e}")
 
     async def __compare_to_database(self, old_data_all, new_data_all):
         """
@@ -247,7 +400,6 @@ class HulaquanDataManager(BaseDataManager):
             "prefix": {}
         }
         """
-        save_cache = False
         new_data = new_data_all.get("events", {})
         old_data = old_data_all.get("events", {})
         
@@ -255,28 +407,32 @@ class HulaquanDataManager(BaseDataManager):
         new_event_ids = set(new_data.keys()) - set(old_data.keys())
         if new_event_ids:
             # 虚拟事件迁移
-            await self.__migrate_virtual_events(new_event_ids, new_data)
+            async with span("migrate_virtual_events"):
+                await self.__migrate_virtual_events(new_event_ids, new_data)
             # 演员订阅自动匹配
-            actor_match_counts = await self.match_actors_in_new_events_and_subscribe(new_event_ids)
+            async with span("match_actors"):
+                actor_match_counts = await self.match_actors_in_new_events_and_subscribe(new_event_ids)
             if actor_match_counts:
                 from ncatbot.utils.logger import get_log
                 log = get_log()
                 log.info(f"新排期演员匹配完成，为 {len(actor_match_counts)} 个用户补充了票务订阅")
         
         comp_data = {}
-        for eid in new_data.keys():
-            comp = self.compare_tickets(old_data.get(eid, {}), new_data[eid].get("ticket_details", None))
-            if not comp:
-                continue
-            comp_data[eid] = comp
-            is_updated = True
-            if any(k in ["new", "add", "pending"] for k in comp.keys()):
-                save_cache = True
-            # fix
+        with span("diff"):
+            # 没有刷新的剧目沿用上一轮的票务详情，只需比较本轮刷新过的和新上架的剧目
+            for eid in dict.fromkeys([*self._refreshed_event_ids, *new_event_ids]):
+                if eid not in new_data:
+                    continue
+                comp = self.compare_tickets(old_data.get(eid, {}), new_data[eid].get("ticket_details", None))
+                if not comp:
+                    continue
+                comp_data[eid] = comp
+                is_updated = True
+                # fix
         
-        result = await self.__generate_compare_message_text(comp_data)
-        if save_cache:
-            self.save_data_cache(old_data_all, new_data_all, "update_data_cache")
+        async with span("generate_text"):
+            result = await self.__generate_compare_message_text(comp_data)
+        count("changed_tickets", len(result["tickets"]))
         return result
     
     async def __migrate_virtual_events(self, new_event_ids, new_data):
@@ -412,6 +568,7 @@ class HulaquanDataManager(BaseDataManager):
 
     def pending_events_check_in(self, eid, pending_message, title):
         if pending_message:
+            self.mark_dirty()
             cnt = 1
             for valid_from, m in pending_message.items():
                 cnt += 1
@@ -440,31 +597,6 @@ class HulaquanDataManager(BaseDataManager):
                                     
                     }
 
-    def save_data_cache(self, old_data_all, new_data_all, cache_folder_name):
-        cache_root = os.path.join(os.getcwd(), cache_folder_name)
-        os.makedirs(cache_root, exist_ok=True)
-                # 清理超过48小时的缓存
-        now = datetime.now()
-        for d in os.listdir(cache_root):
-            dir_path = os.path.join(cache_root, d)
-            if os.path.isdir(dir_path):
-                try:
-                            # 目录名格式为"2025-07-03_12-34-56"
-                    dir_time = datetime.strptime(d, "%Y-%m-%d_%H-%M-%S")
-                    if now - dir_time > timedelta(hours=48):
-                        shutil.rmtree(dir_path)
-                except Exception:
-                    continue
-                # 新建本次缓存
-        update_time_str = str(self.data['update_time']).replace(":", "-").replace(" ", "_")
-        cache_dir = os.path.join(cache_root, update_time_str)
-        os.makedirs(cache_dir, exist_ok=True)
-        with open(os.path.join(cache_dir, "old_data_all.json"), "w", encoding="utf-8") as f:
-            json.dump(old_data_all, f, ensure_ascii=False, indent=2)
-        with open(os.path.join(cache_dir, "new_data_all.json"), "w", encoding="utf-8") as f:
-            json.dump(new_data_all, f, ensure_ascii=False, indent=2)
-
-
     def compare_tickets(self, old_data_all, new_data):
         """
         简介::
@@ -557,18 +689,34 @@ class HulaquanDataManager(BaseDataManager):
     async def get_ticket_cast_and_city_async(self, eName, ticket, city=None):
         if not ticket['start_time']:
             return {"cast":[], "city":None}
+        cached = self.cast_cache.get(ticket.get('id'), ticket['start_time'], city)
+        if cached is not None:
+            if cached["cast"]:
+                ticket["cast"] = cached["cast"]
+                ticket['city'] = cached["city"]
+            return cached
         # 优先用别名系统检索名
         search_names = self.get_ordered_search_names(extract_text_in_brackets(eName, False), ticket['event_id'])
         for name in search_names:
-            response = await Saoju.search_for_musical_by_date_async(name, ticket['start_time'], city=city)
+            try:
+                response = await Saoju.search_for_musical_by_date_async(name, ticket['start_time'], city=city, raise_on_error=True)
+            except Exception as e:
+                # 请求失败不是“没有卡司”，不写入负缓存，已有的缓存保持不变，下次重新查询
+                from ncatbot.utils.logger import get_log
+                log = get_log()
+                log.warning(f"查询场次 {ticket.get('id')} 的卡司失败：{e}")
+                return {"cast":[], "city":None}
             if response:
                 Alias.set_no_response(eName, name, reset=True)
                 cast = response.get("cast", [])
                 ticket["cast"] = cast
                 ticket['city'] = response.get('city', None)
+                self.cast_cache.put(ticket.get('id'), ticket['start_time'], cast, ticket['city'], query_city=city)
                 return {"cast": cast, "city": ticket.get('city', None)}
             else:
                 Alias.set_no_response(eName, name, reset=False)
+        # 请求成功但未查到卡司时缓存一段时间，避免每次渲染都重新查询所有检索名
+        self.cast_cache.put(ticket.get('id'), ticket['start_time'], None, query_city=city)
         return {"cast":[], "city":None}
 
     async def get_cast_artists_str_async(self, eName, ticket, city=None):
@@ -589,49 +737,40 @@ class HulaquanDataManager(BaseDataManager):
         if self.updating:
             # 当数据正在更新时，等到数据全部更新完再继续
             await self._wait_for_data_update()
-        for eid, event in self.events().items():
-            try:
-                event_start = standardize_datetime(event["start_time"], with_second=False, return_str=False)
-                event_end = standardize_datetime(event["end_time"], with_second=False, return_str=False)
-            except Exception:
+        # 按剧目顺序取出当天的场次；已被删除的场次在 self.ticket 中查不到，直接跳过
+        order = {eid: i for i, eid in enumerate(self.events())}
+        entries = sorted(self.date_index.tickets_on(date_obj.strftime("%Y-%m-%d"), _city).items(),
+                         key=lambda item: order.get(item[1]["event_id"], len(order)))
+        for tid, entry in entries:
+            ticket = self.ticket(tid, entry["event_id"])
+            if not ticket:
                 continue
-            if not (event_start.date() <= date_obj.date() <= event_end.date()):
+            if ignore_sold_out and ticket.get("left_ticket_count", 0)==0:
                 continue
-            for ticket in event.get("ticket_details", {}).values():
-                if ignore_sold_out and ticket.get("left_ticket_count", 0)==0:
-                    continue
-                t_start = ticket.get("start_time")
-                if not t_start:
-                    continue
-                try:
-                    t_start = standardize_datetime(t_start, with_second=False, return_str=False)
-                except Exception:
-                    continue
-                if t_start.date() != date_obj.date():
+            t_start = entry["start"]
+            tInfo = extract_title_info(ticket.get("title", ""))
+            event_title = tInfo['title'][1:-1]
+            city = tInfo["city"]
+            event_city = city if city else (await self.get_ticket_city_async(event_title, ticket) or "未知城市")  # 传入的是部分标题
+            if _city:
+                if not event_city or _city not in event_city:
                     continue
-                tInfo = extract_title_info(ticket.get("title", ""))
-                event_title = tInfo['title'][1:-1]
-                city = tInfo["city"]
-                event_city = city if city else (await self.get_ticket_city_async(event_title, ticket) or "未知城市")  # 传入的是部分标题
-                if _city:
-                    if not event_city or _city not in event_city:
-                        continue
-                cast_str = await self.get_cast_artists_str_async(event_title, ticket, event_city) or "无卡司信息"
-                time_key = t_start.strftime("%H:%M")
-                if event_city not in result_by_city:
-                    result_by_city[event_city] = {}
-                    result_by_city[event_city][time_key] = []
-                    city_events_count[event_city] = 1
-                elif time_key not in result_by_city[event_city]:
-                    result_by_city[event_city][time_key] = []
-                city_events_count[event_city] += 1
-                result_by_city[event_city][time_key].append({
-                    "event_title": tInfo['title'] + " " + tInfo["price"] + (f"(原价：{tInfo['full_price']})" if tInfo["full_price"] else ""),
-                    "ticket_title": ticket.get("title", ""),
-                    "cast": cast_str,
-                    "left": ticket.get("left_ticket_count", "-"),
-                    "total": ticket.get("total_ticket", "-"),
-                })
+            cast_str = await self.get_cast_artists_str_async(event_title, ticket, event_city) or "无卡司信息"
+            time_key = t_start.strftime("%H:%M")
+            if event_city not in result_by_city:
+                result_by_city[event_city] = {}
+                result_by_city[event_city][time_key] = []
+                city_events_count[event_city] = 1
+            elif time_key not in result_by_city[event_city]:
+                result_by_city[event_city][time_key] = []
+            city_events_count[event_city] += 1
+            result_by_city[event_city][time_key].append({
+                "event_title": tInfo['title'] + " " + tInfo["price"] + (f"(原价：{tInfo['full_price']})" if tInfo["full_price"] else ""),
+                "ticket_title": ticket.get("title", ""),
+                "cast": cast_str,
+                "left": ticket.get("left_ticket_count", "-"),
+                "total": ticket.get("total_ticket", "-"),
+            })
         if not result_by_city:
             return f"{date} {_city or ''} 当天无呼啦圈学生票场次信息。"
         message = f"{date} {_city or ''} 呼啦圈学生票场次：\n"
@@ -708,7 +847,6 @@ class HulaquanDataManager(BaseDataManager):
         Returns:
             (str, bool, tuple): ✨ 32808《连壁》09-11 19:30￥199（原价￥299) 学生票 余票2/2 韩冰儿 胥子含, ,()
         """
-        max_ticket_info_count = self.get_max_ticket_content_length([ticket])
         if ticket['status'] == 'active' and ticket['left_ticket_count'] > 0:
             ticket_status = "✨" 
         elif ticket["status"] == 'pending':
@@ -717,7 +855,8 @@ class HulaquanDataManager(BaseDataManager):
             ticket_status = f"🕰️"
         else:
             ticket_status = "❌"
-        ticket_details = ljust_for_chinese(f"{ticket['title']} 余票{ticket['left_ticket_count']}/{ticket['total_ticket']}", max_ticket_info_count)
+        # 只有一个场次，按自身宽度对齐不需要补空格
+        ticket_details = f"{ticket['title']} 余票{ticket['left_ticket_count']}/{ticket['total_ticket']}"
         if show_ticket_id:
             ticket_details = ' ' + ticket['id'] + ticket_details
         no_saoju_data = False
@@ -758,9 +897,17 @@ class HulaquanDataManager(BaseDataManager):
             eid, tid = tup
             self.data['ticket_id_to_event_id'].pop(tid, None)
             self.delete_ticket(tid, eid)
+        if to_delete:
+            self.mark_dirty()
             
     def update_ticket_dict_async(self):
-        asyncio.create_task(self.__update_ticket_dict_async())
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 在事件循环之外导入（例如 python -m 运行压测脚本时导入插件包）不做清理，
+            # 过期场次在下一次加载或刷新时处理，不在导入时阻塞运行一个事件循环
+            return
+        loop.create_task(self.__update_ticket_dict_async())
     
     def ticket(self, ticket_id, event_id=None, default=None):
         try:
@@ -782,6 +929,7 @@ class HulaquanDataManager(BaseDataManager):
                     return None
             if event_id not in self.events():
                 return None
+            self.mark_dirty()
             return self.data['events'][event_id]["ticket_details"].pop(ticket_id, None)
         except (KeyError, Exception):
             return None
@@ -855,15 +1003,19 @@ class HulaquanDataManager(BaseDataManager):
     async def on_message_tickets_query(self, eName, ignore_sold_out=False, show_cast=True, refresh=False, show_ticket_id=False, extra_id=None):
         if self.updating:
             await self._wait_for_data_update()
-        eid, msg = await self.get_event_id_by_name(eName, extra_id=extra_id)
+        # 只读查询，剧名有错别字时直接按模糊匹配的结果查询（回复中会显示实际的剧名）
+        eid, msg = await self.get_event_id_by_name(eName, extra_id=extra_id, fuzzy=True)
         if eid is None:
             return msg or "未找到该剧目。"
         return await self.generate_tickets_query_message(eid, show_cast=show_cast, ignore_sold_out=ignore_sold_out, refresh=refresh, show_ticket_id=show_ticket_id)
 
-    async def get_event_id_by_name(self, eName, default="未找到该剧目", extra_id=None):
+    async def get_event_id_by_name(self, eName, default="未找到该剧目", extra_id=None, fuzzy=False):
         """
         统一处理event_name转event_id逻辑。
         返回 (event_id, None) 或 (None, 错误消息)
+
+        子串匹配不到时尝试模糊匹配（错别字、繁简体、拼音首字母）：fuzzy 为 True 时直接返回可信的唯一候选，
+        只应用于只读查询；否则只在错误消息中提示候选剧名，避免关注 / 别名等操作落到错误的剧目上。
         """
         queue = ""
         eName = eName.strip().lower()
@@ -880,6 +1032,17 @@ class HulaquanDataManager(BaseDataManager):
                         return result[extra_id-1][0], None
                 queue = [f"{i}. {event[1]}" for i, event in enumerate(result, start=1)]
             Alias.set_no_response(eName, search_name, reset=False)
+        if not queue:
+            # 只接受可信度足够高的唯一候选
+            match = self.title_index.best_match(eName)
+            if match:
+                eid, title, score = match
+                if fuzzy:
+                    from ncatbot.utils.logger import get_log
+                    log = get_log()
+                    log.info(f"剧名模糊匹配：{eName} -> {title}（{score}）")
+                    return eid, None
+                return None, f"{default}，你是不是要找：{title}？请使用完整剧名重新查询。"
         return None, f"找到多个匹配的剧名，请重新以唯一的关键词查询，或使用\n/hlq {eName} -下面的序号\n查询对应的剧：\n" + "\n".join(queue) if queue else default
 
 
@@ -952,9 +1115,6 @@ class HulaquanDataManager(BaseDataManager):
         返回:
             {ticket_id: event_id} 字典
         """
-        actor_lower = actor_name.strip().lower()
-        matched_tickets = {}
-        
         # 确定需要搜索的事件范围
         events_to_search = self.data.get("events", {})
         if include_eids:
@@ -964,23 +1124,35 @@ class HulaquanDataManager(BaseDataManager):
             exclude_eids_str = [str(e) for e in exclude_eids]
             events_to_search = {eid: event for eid, event in events_to_search.items() if eid not in exclude_eids_str}
         
-        # 遍历所有事件的所有场次
-        for event_id, event_data in events_to_search.items():
-            event_title = event_data.get('title', '')
+        # 只为卡司尚未解析过的场次查询卡司，其余直接查演员索引
+        await self.resolve_casts_async(events_to_search)
+        matched_tickets = {}
+        for ticket_id in sorted(self.actor_index.tickets_of(actor_name)):
+            event_id = self.data['ticket_id_to_event_id'].get(ticket_id)
+            if event_id in events_to_search and ticket_id in events_to_search[event_id].get('ticket_details', {}):
+                matched_tickets[ticket_id] = str(event_id)
+        return matched_tickets
+    
+    async def resolve_casts_async(self, events):
+        """
+        为 events 中还没有卡司的场次解析卡司（结果写入卡司缓存和演员索引）。
+        之前没查到卡司的场次在卡司缓存的负缓存过期前直接命中缓存，不会重复查询
+        
+        参数:
+            events: {event_id: event}
+        """
+        for event_id, event_data in events.items():
             tickets = event_data.get('ticket_details', {})
-            
+            unresolved = self.actor_index.unresolved(tickets.keys())
+            if not unresolved:
+                continue
+            event_title = event_data.get('title', '')
             for ticket_id, ticket_info in tickets.items():
-                # 获取该场次的卡司信息
-                cast_data = await self.get_ticket_cast_and_city_async(event_title, ticket_info)
-                cast_list = cast_data.get('cast', [])
-                
-                # 检查演员是否在卡司中
-                for cast_member in cast_list:
-                    if cast_member.get('artist', '').strip().lower() == actor_lower:
-                        matched_tickets[str(ticket_id)] = str(event_id)
-                        break
-        
-        return matched_tickets
+                if str(ticket_id) in unresolved:
+                    cast_data = await self.get_ticket_cast_and_city_async(event_title, ticket_info)
+                    if cast_data.get('cast') and not self.actor_index.is_resolved(ticket_id):
+                        # 命中了卡司缓存（未触发写入）时补充到索引
+                        self.actor_index.update(ticket_id, cast_data['cast'])
     
     async def match_actors_in_new_events_and_subscribe(self, new_event_ids):
         """
@@ -1004,44 +1176,36 @@ class HulaquanDataManager(BaseDataManager):
         if not all_users_actors:
             return {}
         
-        # 为每个新事件检索卡司并匹配
-        user_new_tickets = {}  # {user_id: [(ticket_id, mode, actor_name)]}
+        # 为新事件的场次解析卡司（同时写入演员索引）
+        new_events = {eid: self.data["events"][eid] for eid in new_event_ids if eid in self.data.get("events", {})}
+        await self.resolve_casts_async(new_events)
+        new_ticket_ids = {str(tid) for event in new_events.values() for tid in event.get('ticket_details', {})}
         
-        for event_id in new_event_ids:
-            event_data = self.data.get("events", {}).get(event_id)
-            if not event_data:
-                continue
-            
-            event_title = event_data.get('title', '')
-            tickets = event_data.get('ticket_details', {})
-            
-            # 为该事件的每个场次获取卡司
-            for ticket_id, ticket_info in tickets.items():
-                cast_data = await self.get_ticket_cast_and_city_async(event_title, ticket_info)
-                cast_list = cast_data.get('cast', [])
-                cast_actors_lower = [c.get('artist', '').strip().lower() for c in cast_list]
-                
-                # 匹配所有用户的演员订阅
-                for user_id, actors in all_users_actors.items():
-                    for actor_sub in actors:
-                        actor_name = actor_sub.get('actor', '').strip()
-                        actor_name_lower = actor_name.lower()
-                        mode = actor_sub.get('mode', 1)
-                        include_events = actor_sub.get('include_events', [])
-                        exclude_events = actor_sub.get('exclude_events', [])
-                        
-                        # 检查剧目筛选
-                        if include_events and event_id not in [str(e) for e in include_events]:
-                            continue
-                        if exclude_events and event_id in [str(e) for e in exclude_events]:
-                            continue
-                        
-                        # 检查演员是否在卡司中
-                        if actor_name_lower in cast_actors_lower:
-                            user_new_tickets.setdefault(user_id, [])
-                            # 同时记录场次ID、模式和演员名
-                            user_new_tickets[user_id].append((str(ticket_id), mode, actor_name))
-                            break  # 一个场次只为该用户添加一次
+        # 按演员查索引，只涉及订阅演员在新事件中的场次
+        actor_tickets = {}  # {actor_lower: {ticket_id}}
+        user_new_tickets = {}  # {user_id: [(ticket_id, mode, actor_name)]}
+        for user_id, actors in all_users_actors.items():
+            seen = set()  # 一个场次只为该用户添加一次
+            for actor_sub in actors:
+                actor_name = actor_sub.get('actor', '').strip()
+                actor_name_lower = actor_name.lower()
+                mode = actor_sub.get('mode', 1)
+                include_events = [str(e) for e in actor_sub.get('include_events', [])]
+                exclude_events = [str(e) for e in actor_sub.get('exclude_events', [])]
+                if actor_name_lower not in actor_tickets:
+                    actor_tickets[actor_name_lower] = self.actor_index.tickets_of(actor_name_lower) & new_ticket_ids
+                for tid in sorted(actor_tickets[actor_name_lower]):
+                    event_id = str(self.data['ticket_id_to_event_id'].get(tid))
+                    # 检查剧目筛选
+                    if include_events and event_id not in include_events:
+                        continue
+                    if exclude_events and event_id in exclude_events:
+                        continue
+                    if tid in seen:
+                        continue
+                    seen.add(tid)
+                    # 同时记录场次ID、模式和演员名
+                    user_new_tickets.setdefault(user_id, []).append((tid, mode, actor_name))
         
         # 为用户批量添加票务订阅
         user_counts = {}
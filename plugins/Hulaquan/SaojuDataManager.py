@@ -5,11 +5,14 @@ if __name__ == '__main__':
     sys.path.append("f:/MusicalBot")
     
 
-import aiohttp, asyncio, json
+import aiohttp, asyncio
 import pandas as pd
 from datetime import datetime, timedelta
 from plugins.Hulaquan import BaseDataManager
+from plugins.AdminPlugin import codec
 from plugins.Hulaquan.utils import *
+from plugins.Hulaquan.http_client import get_session, route
+from plugins.Hulaquan.Exceptions import RequestTimeoutException
 import requests
 from bs4 import BeautifulSoup
 
@@ -18,7 +21,14 @@ class SaojuDataManager(BaseDataManager):
     功能：
     1.存储/调取卡司排期数据
     2.根据卡司数据有效期刷新
+    3.后台预取未来若干天的排期，查询时不必等待扫剧接口
     """
+    DATA_MAX_HOURS = 1  # 日数据的有效期（小时），与 get_data_by_date_async 的默认值一致
+    PREFETCH_DAYS = 14  # 预取今天起的天数
+    PREFETCH_CONCURRENCY = 3  # 预取时同时请求的日期数
+    PREFETCH_AHEAD_MINUTES = 10  # 在数据过期前多少分钟提前刷新
+    PREFETCH_INTERVAL = 300  # 预取循环的检查间隔（秒）
+
     def __init__(self, file_path=None):
         super().__init__(file_path)
 
@@ -28,19 +38,22 @@ class SaojuDataManager(BaseDataManager):
         self.data.setdefault("date_dict", {})  # 确保有一个日期字典来存储数据
         self.data.setdefault("update_time_dict", {})  # 确保有一个更新时间字典来存储数据
         self.data["update_time_dict"].setdefault("date_dict", {})  # 确保有一个更新时间字典来存储数据
+        self._show_index = {}  # date -> 演出索引，不持久化，按需从 date_dict 构建
+        self._prefetch_task = None
+        self._fetching = {}  # date -> 正在进行的请求，合并同一天的并发请求
         self.refresh_expired_data()
 
     async def search_day_async(self, date):
-        url = "http://y.saoju.net/yyj/api/search_day/"
+        url = route("http://y.saoju.net/yyj/api/search_day/")
         data = {"date": date}
         max_retries = 5
         for attempt in range(max_retries):
             try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(url, params=data, timeout=10) as response:
-                        response.raise_for_status()
-                        json_response = await response.json()
-                        return json_response
+                session = await get_session(url)
+                async with session.get(url, params=data, timeout=10) as response:
+                    response.raise_for_status()
+                    json_response = codec.loads(await response.read())
+                    return json_response
             except aiohttp.ClientError as http_err:
                 print(f'SAOJU ERROR HTTP error occurred (attempt {attempt+1}): {http_err}')
             except Exception as err:
@@ -49,42 +62,139 @@ class SaojuDataManager(BaseDataManager):
         print('SAOJU ERROR: Failed to fetch data after 5 attempts.')
         return
 
-    async def get_data_by_date_async(self, date, update_delta_max_hours=1):
-        if date in list(self.data["date_dict"].keys()):
-            update_time = parse_datetime(self.data["update_time_dict"]["date_dict"].get(date, None))
-            if update_time:
-                if (datetime.now() - update_time) < timedelta(hours=update_delta_max_hours):
-                    return self.data["date_dict"][date]
-        data = await self.search_day_async(date)
+    async def get_data_by_date_async(self, date, update_delta_max_hours=DATA_MAX_HOURS):
+        if self._data_age(date) < timedelta(hours=update_delta_max_hours):
+            return self.data["date_dict"][date]
+        return await self.refresh_date_async(date)
+
+    def _data_age(self, date):
+        if date not in self.data["date_dict"]:
+            return timedelta.max
+        update_time = self.data["update_time_dict"]["date_dict"].get(date, None)
+        if not update_time:
+            return timedelta.max
+        return datetime.now() - parse_datetime(update_time)
+
+    async def refresh_date_async(self, date):
+        """重新请求某天的排期；同一天已有请求在进行时等待该请求的结果"""
+        task = self._fetching.get(date)
+        if task is None:
+            task = self._fetching[date] = asyncio.ensure_future(self.search_day_async(date))
+            task.add_done_callback(lambda _: self._fetching.pop(date, None))
+        data = await asyncio.shield(task)
         if data:
             self.data["date_dict"][date] = data["show_list"]
             self.data["update_time_dict"]["date_dict"][date] = dateTimeToStr(datetime.now())
+            self._show_index.pop(date, None)
+            self.mark_dirty()
             return data["show_list"]
         else:
             return None
 
+    async def prefetch_upcoming_async(self, days=None):
+        """
+        刷新今天起 days 天内缺失或即将过期的日数据，最多 PREFETCH_CONCURRENCY 个日期并发请求
+
+        Returns:
+            list[str]: 本次刷新的日期
+        """
+        days = self.PREFETCH_DAYS if days is None else days
+        refresh_before = timedelta(hours=self.DATA_MAX_HOURS) - timedelta(minutes=self.PREFETCH_AHEAD_MINUTES)
+        today = datetime.now()
+        dates = [dateToStr(today + timedelta(days=i)) for i in range(days)]
+        dates = [d for d in dates if self._data_age(d) >= refresh_before]
+        semaphore = asyncio.Semaphore(self.PREFETCH_CONCURRENCY)
+
+        async def fetch(date):
+            async with semaphore:
+                return await self.refresh_date_async(date)
+
+        results = await asyncio.gather(*(fetch(d) for d in dates), return_exceptions=True)
+        return [d for d, r in zip(dates, results) if r and not isinstance(r, Exception)]
+
+    async def _prefetch_loop(self, days):
+        while True:
+            try:
+                await self.prefetch_upcoming_async(days)
+                self.refresh_expired_data()
+            except Exception as e:
+                print(f"SAOJU ERROR 预取排期失败: {e}")
+            await asyncio.sleep(self.PREFETCH_INTERVAL)
+
+    def start_prefetcher(self, days=None):
+        """开启后台预取（需在事件循环中调用），已在运行时先停止再按新的天数开启"""
+        self.stop_prefetcher()
+        self._prefetch_task = asyncio.create_task(self._prefetch_loop(self.PREFETCH_DAYS if days is None else int(days)))
+
+    def stop_prefetcher(self):
+        if self._prefetch_task:
+            self._prefetch_task.cancel()
+            self._prefetch_task = None
+
 
-    async def search_for_musical_by_date_async(self, search_name, date_time, city=None):
+    async def search_for_musical_by_date_async(self, search_name, date_time, city=None, raise_on_error=False):
         # date_time: %Y-%m-%d %H:%M
+        # raise_on_error 为 True 时，当天排期获取失败抛出 RequestTimeoutException，以便与“没有这场演出”区分
         date_time = parse_datetime(date_time)
         _date = dateToStr(date_time)
         _time = timeToStr(date_time)
         data = await self.get_data_by_date_async(_date)
+        if data is None and raise_on_error:
+            raise RequestTimeoutException(f"获取扫剧 {_date} 的排期失败")
         if not data:
             return None
-        for i in range(len(data)):
-            musical = data[i]["musical"]
-            if ((city in data[i]["city"]) if city else True) and _time == data[i]["time"] and ((search_name in musical) if isinstance(search_name, str) else all(i in musical for i in search_name) if isinstance(search_name, list) else False):
-                return data[i]
+        index = self.get_show_index(_date)
+        if city and (_time, city) in index["by_time_city"]:
+            shows = index["by_time_city"][(_time, city)]
+            titles = index["titles"][(_time, city)]
+        else:
+            shows = index["by_time"].get(_time, [])
+            if city:
+                # 城市名不完全一致时按子串匹配
+                shows = [s for s in shows if city in s["show"]["city"]]
+            titles = None
+        if isinstance(search_name, str):
+            name = normalize_title(search_name)
+            if titles and name in titles:
+                return titles[name]
+            names = [name]
+        elif isinstance(search_name, list):
+            names = [normalize_title(i) for i in search_name]
+        else:
+            return None
+        for show in shows:
+            musical = show["_title"]
+            if all(i in musical for i in names):
+                return show["show"]
         return None
 
+    def get_show_index(self, date):
+        """
+        获取某天演出的索引（不存在时根据 date_dict 构建）::
+
+            {
+                "by_time": {time: [show...]},
+                "by_time_city": {(time, city): [show...]},
+                "titles": {(time, city): {规范化剧名: 原始演出数据}},
+            }
+
+        其中 show 为 {"show": 原始演出数据, "_title": 规范化剧名}，保持 date_dict 中的原有顺序
+        """
+        index = self._show_index.get(date)
+        if index is None:
+            index = self._show_index[date] = build_show_index(self.data["date_dict"].get(date) or [])
+        return index
+
     def refresh_expired_data(self):
         current_date = datetime.now()
         for date in list(self.data["update_time_dict"]["date_dict"].keys()):
             date_obj = parse_datetime(date)
-            if date_obj < current_date:
-                del self.data["date_dict"][date]
+            # 只清除今天之前的日期，今天的数据仍按有效期刷新
+            if date_obj.date() < current_date.date():
+                self.data["date_dict"].pop(date, None)
                 del self.data["update_time_dict"]["date_dict"][date]
+                self._show_index.pop(date, None)
+                self.mark_dirty()
 
     async def search_for_artist_async(self, search_name, date):
         date = dateToStr(date)
@@ -168,6 +278,8 @@ class SaojuDataManager(BaseDataManager):
         except:
             self.data['artists_map'] = await self.fetch_saoju_artist_list()
             updated = True
+        if updated:
+            self.mark_dirty()
         if updated and cast_name not in self.data['artists_map']:
             return False
         else:
@@ -211,7 +323,7 @@ class SaojuDataManager(BaseDataManager):
         
     
     async def fetch_saoju_artist_list(self):
-        data = json.loads(await fetch_page_async("http://y.saoju.net/yyj/api/artist/"))
+        data = codec.loads(await fetch_page_async("http://y.saoju.net/yyj/api/artist/"))
         name_to_pk = {item["fields"]["name"]: item["pk"] for item in data}
         return name_to_pk
 
@@ -251,10 +363,23 @@ class SaojuDataManager(BaseDataManager):
 
     
     
+def build_show_index(shows):
+    by_time, by_time_city, titles = {}, {}, {}
+    for show in shows:
+        entry = {"show": show, "_title": normalize_title(show["musical"])}
+        key = (show["time"], show["city"])
+        by_time.setdefault(show["time"], []).append(entry)
+        by_time_city.setdefault(key, []).append(entry)
+        # 同一时间同城同名只保留第一场，与顺序扫描的结果一致
+        titles.setdefault(key, {}).setdefault(entry["_title"], show)
+    return {"by_time": by_time, "by_time_city": by_time_city, "titles": titles}
+
+
 async def fetch_page_async(url):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            return await response.text()    
+    url = route(url)
+    session = await get_session(url)
+    async with session.get(url) as response:
+        return await response.text()    
     
 def match_artists_on_schedule(
     artists, 
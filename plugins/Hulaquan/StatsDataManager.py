@@ -45,12 +45,14 @@ class StatsDataManager(BaseDataManager):
     def on_command(self, command_name):
         self.data[ON_COMMAND_TIMES].setdefault(command_name, 0)
         self.data[ON_COMMAND_TIMES][command_name] += 1
+        self.mark_dirty()
         
     def get_on_command_times(self, command_name):
         return self.data[ON_COMMAND_TIMES][command_name]
     
     def new_id(self, id_key: str):
         self.data[id_key] += 1
+        self.mark_dirty()
         return str(self.data[id_key])
     
     def new_repo(self, title, date, price, seat, content, user_id, category, payable, img=None, event_id=None):
@@ -76,6 +78,7 @@ class StatsDataManager(BaseDataManager):
                                                                 REPORT_ID: report_id,
                                                                 REPORT_ERROR_DETAILS: {},
                                                             }
+        self.mark_dirty()
         self.add_in_latest_20_repos(report_id, event_id)
         return report_id
     
@@ -86,6 +89,7 @@ class StatsDataManager(BaseDataManager):
                     return False
                 repo = copy.deepcopy(event[report_id])
                 del event[report_id]
+                self.mark_dirty()
                 return self.generate_repo_report_messages([repo])
         return False
     
@@ -96,6 +100,7 @@ class StatsDataManager(BaseDataManager):
         while len(self.data[LATEST_20_REPOS]) >= maxLatestReposCount:
             self.data[LATEST_20_REPOS].pop(0)
         self.data[LATEST_20_REPOS].append(tpl)
+        self.mark_dirty()
         return tpl
     
     def show_latest_repos(self, count):
@@ -137,6 +142,7 @@ class StatsDataManager(BaseDataManager):
                 if content:
                     event[report_id]["content"] = content
                 repo = event[report_id]
+                self.mark_dirty()
                 self.add_in_latest_20_repos(report_id, eid)
                 return self.generate_repo_report_messages([repo])
         return False
@@ -181,22 +187,13 @@ class StatsDataManager(BaseDataManager):
         return messages
     
     def get_repos_list(self):
-        
-        def get_max_length(lst):
-            max_width = 0
-            for i in lst:
-                width = get_display_width(i)
-                if width > max_width:
-                    max_width = width
-            return max_width
-        
         messages = []
         title_list = []
         eid_list = list(self.data[HLQ_TICKETS_REPO].keys())
         for eid in eid_list:
             title = self.get_event_title(eid)
             title_list.append(title)
-        title_width = get_max_length(title_list)
+        title_width = max(get_display_widths(title_list), default=0)
         count_width = 4
         messages.append(f"{ljust_for_chinese('剧名', title_width)}{'repo数量'.ljust(count_width)}")
         cnt = {}
@@ -205,8 +202,9 @@ class StatsDataManager(BaseDataManager):
             title = title_list[i]
             cnt[title] = len(self.data[HLQ_TICKETS_REPO][eid])
         counts = sorted(cnt.items(), key=lambda x: x[1], reverse=True)
-        for title, i in counts:
-            messages.append(f"{ljust_for_chinese(title, title_width)}{str(i).ljust(count_width)}")
+        padded_titles = ljust_all_for_chinese([title for title, _ in counts], title_width)
+        for padded, (title, i) in zip(padded_titles, counts):
+            messages.append(f"{padded}{str(i).ljust(count_width)}")
         return messages
 
     def report_repo_error(self, report_id, report_user_id: str, error_reason=""):
@@ -218,6 +216,7 @@ class StatsDataManager(BaseDataManager):
         if report_user_id not in self.data[HLQ_TICKETS_REPO][event_id][report_id][REPORT_ERROR_DETAILS].keys():
             self.data[HLQ_TICKETS_REPO][event_id][report_id][REPORT_ERROR_DETAILS][report_user_id] = []
         self.data[HLQ_TICKETS_REPO][event_id][report_id][REPORT_ERROR_DETAILS][report_user_id].append(error_reason)
+        self.mark_dirty()
         times = self.check_error_times(event_id, report_id)
         if times >= maxErrorTimes:
             return "由于报错次数过多，已删除该report"
@@ -243,12 +242,14 @@ class StatsDataManager(BaseDataManager):
             if eid in self.data[HLQ_TICKETS_REPO]:
                 title = list(self.data[HLQ_TICKETS_REPO][eid].values())[0]['event_title']
             self.data[EVENT_ID_TO_EVENT_TITLE][eid] = {'title':title, 'create_time':now_time_str()}  # 修正为调用函数
+            self.mark_dirty()
             return eid
         elif not eid:
             if eid := self.get_event_id(title):
                 return eid
             event_id = self.new_id(LATEST_EVENT_ID)
             self.data[EVENT_ID_TO_EVENT_TITLE][event_id] = {'title':title, 'create_time':now_time_str()}  # 修正为调用函数
+            self.mark_dirty()
             return event_id
         else:
             return eid
@@ -267,6 +268,7 @@ class StatsDataManager(BaseDataManager):
             for report_id in list(self.data[HLQ_TICKETS_REPO][eid].keys()):
                 self.data[HLQ_TICKETS_REPO][eid][report_id]["event_title"] = title
             self.data[EVENT_ID_TO_EVENT_TITLE][eid] = {'title':title, 'create_time':now_time_str()}  # 修正为调用函数
+            self.mark_dirty()
             return title
         return self.data[EVENT_ID_TO_EVENT_TITLE][eid]['title']
 
@@ -279,6 +281,7 @@ class StatsDataManager(BaseDataManager):
             del self.data[EVENT_ID_TO_EVENT_TITLE][event_id]
             if event_id in self.data[HLQ_TICKETS_REPO]:
                 del self.data[HLQ_TICKETS_REPO][event_id]
+            self.mark_dirty()
             return True
         return False
     
@@ -303,6 +306,7 @@ class StatsDataManager(BaseDataManager):
             'is_active': True,
             'create_time': now_time_str()
         }
+        self.mark_dirty()
         return (virtual_id, True)
     
     def get_active_virtual_events(self):
@@ -317,6 +321,7 @@ class StatsDataManager(BaseDataManager):
         """将虚拟事件标记为已迁移（不活跃）"""
         if virtual_id in self.data[VIRTUAL_EVENTS]:
             self.data[VIRTUAL_EVENTS][virtual_id]['is_active'] = False
+            self.mark_dirty()
             return True
         return False
 
@@ -0,0 +1,59 @@
+"""
+演员 → 场次倒排索引
+
+根据已解析的卡司（见 cast_cache.py）维护 规范化演员名 -> {ticket_id}，
+关注演员和上新后的演员订阅匹配只需查询相关演员的场次，不必遍历所有场次逐个解析卡司。
+索引不持久化，启动时由卡司缓存重建，之后随卡司缓存的写入/失效增量更新。
+
+索引只包含查到了卡司的场次。没查到卡司的场次不算已解析：卡司常在开票几天后才公布，
+是否需要重新查询由卡司缓存的过期时间（MISS_TTL）决定，而不是由索引决定。
+"""
+
+
+def normalize_actor(name):
+    return (name or "").strip().lower()
+
+
+class ActorIndex:
+
+    def __init__(self):
+        self._actor_tickets = {}  # actor -> {ticket_id}
+        self._ticket_actors = {}  # ticket_id -> {actor}，只包含查到了卡司的场次
+
+    def update(self, ticket_id, cast):
+        """
+        更新场次的卡司；cast 为 None 或空列表表示卡司未知（之后需要重新解析），会从索引中移除该场次
+        """
+        ticket_id = str(ticket_id)
+        actors = {normalize_actor(c.get("artist")) for c in cast or ()} - {""} or None
+        old = self._ticket_actors.get(ticket_id)
+        if old == actors:
+            return
+        for actor in old or ():
+            tickets = self._actor_tickets.get(actor)
+            if tickets is not None:
+                tickets.discard(ticket_id)
+                if not tickets:
+                    del self._actor_tickets[actor]
+        if actors is None:
+            self._ticket_actors.pop(ticket_id, None)
+            return
+        self._ticket_actors[ticket_id] = actors
+        for actor in actors:
+            self._actor_tickets.setdefault(actor, set()).add(ticket_id)
+
+    def discard(self, ticket_id):
+        self.update(ticket_id, None)
+
+    def is_resolved(self, ticket_id):
+        return str(ticket_id) in self._ticket_actors
+
+    def unresolved(self, ticket_ids):
+        """返回 ticket_ids 中还没有卡司的场次（包括之前没查到卡司的场次）"""
+        return {str(tid) for tid in ticket_ids} - self._ticket_actors.keys()
+
+    def tickets_of(self, actor):
+        return set(self._actor_tickets.get(normalize_actor(actor), ()))
+
+    def actors_of(self, ticket_id):
+        return set(self._ticket_actors.get(str(ticket_id), ()))
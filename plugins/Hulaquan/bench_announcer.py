@@ -0,0 +1,278 @@
+"""
+上新提醒压测
+
+debug_announcer.AnnouncerDebugger 只能针对真实用户逐个模拟。这里生成 N 个用户 / 群聊，
+按真实比例混合全局通知模式、剧目 / 场次 / 演员关注，再用 M 个变动场次的模拟比较结果
+驱动 Hulaquan.on_hulaquan_announcer（消息经 MessageDispatcher 发给不联网的 api），
+报告扇出耗时、发出的消息数和每轮的内存分配。
+
+数据管理器在临时工作目录中运行，不会改动正式数据。
+
+用法::
+
+    # 1000/5000/20000 个用户，每轮 200 个变动场次
+    python -m plugins.Hulaquan.bench_announcer --users 1000,5000,20000 --tickets 200
+    # 模拟真实的发送限速（每秒 8 条）和每条 50ms 的 api 耗时
+    python -m plugins.Hulaquan.bench_announcer --users 2000 --rate 8 --api-latency 0.05
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from plugins.AdminPlugin import codec
+
+CATEGORY_WEIGHTS = {"new": 30, "add": 20, "return": 20, "back": 10, "sold": 15, "pending": 5}
+GLOBAL_MODE_WEIGHTS = {0: 50, 1: 30, 2: 15, 3: 5}  # 全局通知模式（attention_to_hulaquan）的分布
+SUBSCRIBE_MODE_WEIGHTS = {1: 60, 2: 30, 3: 10}  # 关注剧目 / 场次时选择的模式
+
+
+class StubApi:
+    """只记录消息的 api，post_private_msg / post_group_msg 与 ncatbot 的返回格式一致"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.reset()
+
+    def reset(self):
+        self.private = 0
+        self.group = 0
+        self.bytes = 0
+        self.first_at = None
+        self.last_at = None
+
+    async def _post(self, text):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        now = time.perf_counter()
+        self.first_at = self.first_at or now
+        self.last_at = now
+        self.bytes += len(text.encode("utf-8"))
+        return {"retcode": 0, "data": {"message_id": 0}, "message": ""}
+
+    async def post_private_msg(self, user_id, text):
+        self.private += 1
+        return await self._post(text)
+
+    async def post_group_msg(self, group_id, text):
+        self.group += 1
+        return await self._post(text)
+
+
+class StubBot:
+
+    def __init__(self, latency=0.0):
+        self.api = StubApi(latency)
+
+
+def _weighted(rng, weights, k=1):
+    return rng.choices(list(weights), weights=list(weights.values()), k=k)
+
+
+def make_catalog(n_events, tickets_per_event):
+    """{event_id: [ticket_id, ...]}"""
+    return {
+        str(9000 + e): [str((9000 + e) * 100 + t) for t in range(tickets_per_event)]
+        for e in range(n_events)
+    }
+
+
+def make_compare_result(catalog, n_tickets, rng):
+    """M 个变动场次的模拟 compare_to_database_async 结果，热门剧目（靠前的剧目）变动更多"""
+    from plugins.Hulaquan.debug_announcer import AnnouncerDebugger
+    debugger = AnnouncerDebugger(None)
+    event_ids = list(catalog)
+    popularity = [1 / (i + 1) for i in range(len(event_ids))]
+    all_tickets = [(eid, tid) for eid in event_ids for tid in catalog[eid]]
+    chosen = set()
+    while len(chosen) < min(n_tickets, len(all_tickets)):
+        eid = rng.choices(event_ids, weights=popularity)[0]
+        chosen.add((eid, rng.choice(catalog[eid])))
+    mock_tickets = [
+        debugger.create_mock_ticket(tid, eid, _weighted(rng, CATEGORY_WEIGHTS)[0], title=f"压测剧目{eid}",
+                                    date=f"2026-11-{int(tid) % 28 + 1:02d}", price=str(rng.choice([99, 199, 299])))
+        for eid, tid in sorted(chosen, key=lambda x: int(x[1]))
+    ]
+    return debugger.create_mock_result(mock_tickets)
+
+
+def reset_users(user_manager):
+    for key, empty in (("users", {}), ("users_list", []), ("groups", {}), ("groups_list", []), ("ops_list", [])):
+        user_manager.data[key] = type(empty)()
+    user_manager._build_subscribe_index()
+
+
+def populate_users(user_manager, catalog, n_users, n_groups, rng):
+    """
+    生成用户和群聊：全局模式按 GLOBAL_MODE_WEIGHTS 分布；每个用户关注 0~5 个剧目、0~8 个场次、0~3 个演员，
+    热门剧目被关注得更多；部分场次关注标记为因关注演员而产生（related_to_actors）
+    """
+    reset_users(user_manager)
+    event_ids = list(catalog)
+    popularity = [1 / (i + 1) for i in range(len(event_ids))]
+    for i in range(n_users):
+        user_id = str(10_000_000 + i)
+        user_manager.add_user(user_id)
+        user_manager.switch_attention_to_hulaquan(user_id, _weighted(rng, GLOBAL_MODE_WEIGHTS)[0])
+        n_events = min(len(event_ids), rng.choice([0, 0, 1, 1, 2, 3, 5]))
+        for eid in set(rng.choices(event_ids, weights=popularity, k=n_events)):
+            user_manager.add_event_subscribe(user_id, eid, _weighted(rng, SUBSCRIBE_MODE_WEIGHTS)[0])
+        actors = [f"演员{rng.randrange(200)}" for _ in range(rng.choice([0, 0, 0, 1, 2, 3]))]
+        if actors:
+            user_manager.add_actor_subscribe(user_id, actors, _weighted(rng, SUBSCRIBE_MODE_WEIGHTS)[0])
+        for _ in range(rng.choice([0, 0, 1, 2, 4, 8])):
+            eid = rng.choices(event_ids, weights=popularity)[0]
+            user_manager.add_ticket_subscribe(user_id, rng.choice(catalog[eid]), _weighted(rng, SUBSCRIBE_MODE_WEIGHTS)[0],
+                                              related_to_actors=actors[:1] if actors and rng.random() < 0.5 else None)
+    for i in range(n_groups):
+        group_id = str(90_000_000 + i)
+        user_manager.add_group(group_id)
+        user_manager.switch_attention_to_hulaquan(group_id, _weighted(rng, GLOBAL_MODE_WEIGHTS)[0], is_group=True)
+
+
+def _announcer_host(dispatcher):
+    # 借用 Hulaquan 的提醒逻辑，不需要完整的插件实例；跳过 user_command_wrapper（它会吞掉异常）
+    from plugins.Hulaquan.main import Hulaquan
+
+    class AnnouncerHost:
+        on_hulaquan_announcer = Hulaquan.on_hulaquan_announcer.__wrapped__
+        _Hulaquan__announce = Hulaquan._Hulaquan__announce
+        _Hulaquan__collect_announce = Hulaquan._Hulaquan__collect_announce
+        _Hulaquan__format_announce_messages = Hulaquan._Hulaquan__format_announce_messages
+
+        def __init__(self):
+            self.dispatcher = dispatcher
+            self.pending_registrations = 0
+
+        def register_pending_tickets_announcer(self):
+            self.pending_registrations += 1
+
+    return AnnouncerHost()
+
+
+async def run_cycle(host, hlq, api, result, trace_memory=True):
+    from plugins.Hulaquan.cycle_trace import tracer
+    async def fake_compare(adaptive=False):
+        return result
+
+    api.reset()
+    hlq.compare_to_database_async = fake_compare
+    if trace_memory:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    try:
+        await host.on_hulaquan_announcer()
+    finally:
+        del hlq.compare_to_database_async
+    wall = time.perf_counter() - start
+    messages = api.private + api.group
+    phases = tracer.recent(1)[0].phases()
+    return {
+        "wall": round(wall, 4),
+        # 从开始到第一条消息发出：计算接收者和生成消息的耗时
+        "first_send": round(api.first_at - start, 4) if api.first_at else None,
+        # cycle_trace 记录的阶段耗时：计算接收者并生成消息 / 等待全部发送完成
+        "fan_out": round(phases["fan_out"]["wall"], 4) if "fan_out" in phases else None,
+        "send": round(phases["send"]["wall"], 4) if "send" in phases else None,
+        "messages": messages,
+        "private": api.private,
+        "group": api.group,
+        "kb": round(api.bytes / 1024, 1),
+        "msgs_per_s": round(messages / wall, 1) if wall else None,
+        "peak_alloc_mb": round((tracemalloc.get_traced_memory()[1] - before) / 1024 / 1024, 2) if trace_memory else None,
+    }
+
+
+async def bench(args):
+    from plugins.Hulaquan.data_managers import User, Hlq
+    from plugins.Hulaquan.message_dispatcher import MessageDispatcher
+
+    rng = random.Random(args.seed)
+    bot = StubBot(args.api_latency)
+    rate = args.rate or 1e9  # 不限速时用一个足够大的速率
+    dispatcher = MessageDispatcher(bot, workers=args.workers, rate=rate, burst=rate, on_user_deleted=User.delete_user)
+    dispatcher.start()
+    host = _announcer_host(dispatcher)
+    catalog = make_catalog(args.events, args.tickets_per_event)
+    trace_memory = not args.no_tracemalloc
+    if trace_memory:
+        tracemalloc.start()
+    report = []
+    try:
+        for n_users in args.users:
+            n_groups = args.groups if args.groups is not None else max(1, n_users // 20)
+            start = time.perf_counter()
+            populate_users(User, catalog, n_users, n_groups, rng)
+            populate_time = time.perf_counter() - start
+            cycles = []
+            for i in range(args.cycles):
+                result = make_compare_result(catalog, args.tickets, rng)
+                cycles.append(await run_cycle(host, Hlq, bot.api, result, trace_memory))
+            walls = sorted(c["wall"] for c in cycles)
+            row = {
+                "users": n_users,
+                "groups": n_groups,
+                "changed_tickets": args.tickets,
+                "populate_s": round(populate_time, 2),
+                "mean_wall": round(sum(walls) / len(walls), 4),
+                "max_wall": walls[-1],
+                "mean_first_send": round(sum(c["first_send"] or 0 for c in cycles) / len(cycles), 4),
+                "mean_fan_out": round(sum(c["fan_out"] or 0 for c in cycles) / len(cycles), 4),
+                "mean_send": round(sum(c["send"] or 0 for c in cycles) / len(cycles), 4),
+                "mean_messages": round(sum(c["messages"] for c in cycles) / len(cycles), 1),
+                "mean_kb": round(sum(c["kb"] for c in cycles) / len(cycles), 1),
+                "peak_alloc_mb": max((c["peak_alloc_mb"] or 0) for c in cycles),
+                "cycles": cycles,
+            }
+            report.append(row)
+            print(f"用户 {n_users} / 群 {n_groups}：平均耗时 {row['mean_wall']:.3f}s（首条消息 {row['mean_first_send']:.3f}s，"
+                  f"生成 {row['mean_fan_out']:.3f}s，发送 {row['mean_send']:.3f}s）"
+                  f"，消息 {row['mean_messages']} 条 / {row['mean_kb']}KB"
+                  + (f"，分配峰值 {row['peak_alloc_mb']}MB" if trace_memory else ""))
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+        await dispatcher.stop(drain=False)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="呼啦圈上新提醒压测")
+    parser.add_argument("--users", default="1000,5000", help="用户数，逗号分隔时依次压测")
+    parser.add_argument("--groups", type=int, help="群聊数，默认为用户数的 1/20")
+    # 上新超过 400 条时提醒会被视为数据异常而跳过，因此变动场次不宜超过 1000 左右
+    parser.add_argument("--tickets", type=int, default=200, help="每轮的变动场次数")
+    parser.add_argument("--events", type=int, default=80, help="剧目数")
+    parser.add_argument("--tickets-per-event", type=int, default=30)
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument("--rate", type=float, default=0, help="发送限速（条/秒），0 表示不限速")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="每条消息的 api 耗时（秒）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-tracemalloc", action="store_true", help="不统计内存分配（tracemalloc 会拖慢运行）")
+    parser.add_argument("--json", help="把结果写入该文件")
+    args = parser.parse_args(argv)
+    args.users = [int(n) for n in args.users.split(",") if n.strip()]
+    if args.json:
+        args.json = os.path.abspath(args.json)
+
+    workdir = tempfile.mkdtemp(prefix="hlq-bench-")
+    os.makedirs(os.path.join(workdir, "data", "data_manager"))
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        report = asyncio.run(bench(args))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    if args.json:
+        codec.dump_file(report, args.json, pretty=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+刷新周期压测
+
+用 fixture_server.py 回放录制的接口数据，反复执行 HulaquanDataManager.compare_to_database_async，
+报告每轮的耗时、请求数和内存峰值，用于在上线新版本前发现性能退化。
+
+数据管理器在临时工作目录中运行（data/data_manager/ 为相对路径），不会改动正式数据；
+可以用 --data-dir 指定一份已有的数据目录作为初始状态（会先复制到临时目录）。
+
+用法::
+
+    # 先通过真实接口录制一轮
+    python -m plugins.Hulaquan.bench_refresh fixtures.json --record --cycles 1 --with-casts
+    # 回放压测：5 轮，每个请求 50ms 延迟，每轮 10% 的剧目余票变化
+    python -m plugins.Hulaquan.bench_refresh fixtures.json --cycles 5 --latency 0.05 --mutate 0.1
+    # 与之前保存的结果比较，平均耗时变慢超过 20% 时以退出码 1 结束
+    python -m plugins.Hulaquan.bench_refresh fixtures.json --json new.json --baseline old.json --tolerance 0.2
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from plugins.AdminPlugin import codec
+from plugins.Hulaquan import http_client
+from plugins.Hulaquan.fixture_server import FixtureServer
+
+
+def _max_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 为 KB，macOS 为字节
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+async def run_cycle(hlq, server, with_casts=False, trace_memory=True):
+    server.reset_stats()
+    if trace_memory:
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    error = None
+    try:
+        result = await hlq.compare_to_database_async()
+    except Exception as e:
+        # 例如注入的 503 使某个剧目的详情请求失败，整轮刷新中止
+        result, error = None, f"{type(e).__name__}: {e}"
+    refresh_time = time.perf_counter() - start
+    cast_time = 0.0
+    changed_events = (result or {}).get("events", {})
+    if with_casts and changed_events:
+        start = time.perf_counter()
+        await hlq.resolve_casts_async({eid: hlq.events()[eid] for eid in changed_events if eid in hlq.events()})
+        cast_time = time.perf_counter() - start
+    return {
+        "wall": round(refresh_time + cast_time, 4),
+        "refresh": round(refresh_time, 4),
+        "casts": round(cast_time, 4),
+        "requests": sum(server.requests.values()),
+        "requests_by_kind": dict(server.requests),
+        "injected_errors": server.errors,
+        "fixture_misses": server.misses,
+        "changed_tickets": sum(len(tids) for tids in changed_events.values()),
+        "error": error,
+        "peak_traced_mb": round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2) if trace_memory else None,
+    }
+
+
+def summarize(cycles):
+    # 第一轮为冷启动（全量刷新），单独列出，不计入平均值
+    warm = cycles[1:] or cycles
+    walls = sorted(c["wall"] for c in warm)
+    return {
+        "cycles": len(cycles),
+        "failed_cycles": sum(1 for c in cycles if c["error"]),
+        "cold_wall": cycles[0]["wall"],
+        "mean_wall": round(sum(walls) / len(walls), 4),
+        "p50_wall": walls[len(walls) // 2],
+        "max_wall": walls[-1],
+        "mean_requests": round(sum(c["requests"] for c in warm) / len(warm), 1),
+        "peak_traced_mb": max((c["peak_traced_mb"] or 0) for c in cycles),
+        "max_rss_mb": _max_rss_mb(),
+    }
+
+
+async def bench(args):
+    if args.record:
+        try:
+            fixtures = codec.load_file(args.fixtures)
+        except FileNotFoundError:
+            fixtures = {}
+        server = FixtureServer(fixtures, mode="record")
+    else:
+        server = FixtureServer.load(args.fixtures, latency=args.latency, jitter=args.jitter,
+                                    error_rate=args.error_rate, mutate=args.mutate, seed=args.seed)
+    await server.start()
+    for host, base in server.routes().items():
+        http_client.set_route(host, base)
+    trace_memory = not args.no_tracemalloc
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        # python -m 运行时导入插件包就会创建数据管理器（此时没有事件循环，Hlq 跳过过期场次的清理），
+        # 压测只使用回放的数据，不依赖该清理
+        from plugins.Hulaquan.data_managers import Hlq
+        cycles = []
+        for i in range(args.cycles):
+            cycle = await run_cycle(Hlq, server, with_casts=args.with_casts, trace_memory=trace_memory)
+            cycles.append(cycle)
+            print(f"[{i + 1}/{args.cycles}] 耗时 {cycle['wall']:.3f}s（刷新 {cycle['refresh']:.3f}s，卡司 {cycle['casts']:.3f}s）"
+                  f" 请求 {cycle['requests']} {cycle['requests_by_kind']} 变动场次 {cycle['changed_tickets']}"
+                  + (f" 内存峰值 {cycle['peak_traced_mb']}MB" if trace_memory else ""))
+            if cycle["error"]:
+                print(f"  ❌ 本轮刷新失败：{cycle['error']}")
+            if cycle["fixture_misses"]:
+                print(f"  ⚠️ {cycle['fixture_misses']} 个请求没有录制数据")
+            if args.interval and i + 1 < args.cycles:
+                await asyncio.sleep(args.interval)
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+        await server.stop()
+        await http_client.close_all()
+        if args.record:
+            server.save(args.fixtures)
+            print(f"已保存 {len(server.fixtures)} 条响应到 {args.fixtures}")
+    return {"summary": summarize(cycles), "cycles": cycles}
+
+
+def compare_with_baseline(report, baseline_path, tolerance):
+    baseline = codec.load_file(baseline_path)["summary"]
+    current = report["summary"]
+    ratio = current["mean_wall"] / baseline["mean_wall"] if baseline["mean_wall"] else 1.0
+    print(f"平均耗时 {current['mean_wall']}s，基线 {baseline['mean_wall']}s（{ratio:.2f}x）；"
+          f"平均请求数 {current['mean_requests']}，基线 {baseline['mean_requests']}")
+    return ratio <= 1 + tolerance
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="呼啦圈刷新周期压测")
+    parser.add_argument("fixtures", help="录制文件路径")
+    parser.add_argument("--record", action="store_true", help="通过真实接口运行并录制响应")
+    parser.add_argument("--cycles", type=int, default=5)
+    parser.add_argument("--interval", type=float, default=0.0, help="两轮之间的间隔（秒）")
+    parser.add_argument("--with-casts", action="store_true", help="每轮之后为变动场次解析卡司（访问扫剧接口）")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--mutate", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", help="作为初始状态的 data/data_manager 目录")
+    parser.add_argument("--no-tracemalloc", action="store_true", help="不统计内存峰值（tracemalloc 会拖慢运行）")
+    parser.add_argument("--json", help="把结果写入该文件")
+    parser.add_argument("--baseline", help="与之前 --json 保存的结果比较")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    args.fixtures = os.path.abspath(args.fixtures)
+    for name in ("json", "baseline", "data_dir"):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+    workdir = tempfile.mkdtemp(prefix="hlq-bench-")
+    data_dir = os.path.join(workdir, "data", "data_manager")
+    if args.data_dir:
+        shutil.copytree(args.data_dir, data_dir)
+    else:
+        os.makedirs(data_dir)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        report = asyncio.run(bench(args))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(codec.dumps(report["summary"], pretty=True))
+    if args.json:
+        codec.dump_file(report, args.json, pretty=True)
+    if args.baseline and not compare_with_baseline(report, args.baseline, args.tolerance):
+        print(f"平均耗时超过基线 {args.tolerance:.0%} 以上")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
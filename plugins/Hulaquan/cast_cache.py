@@ -0,0 +1,91 @@
+"""
+场次卡司/城市解析缓存
+
+get_ticket_cast_and_city_async 每次都要按别名系统的检索名逐个查询扫剧数据，
+渲染 /date、/hlq -c 和上新提醒时每个场次都会调用一次。这里按 ticket_id 缓存解析结果，
+数据保存在 HulaquanDataManager.data["cast_cache"] 中，重启后仍然有效::
+
+    {ticket_id: {"start_time": str, "query_city": str|None, "cast": list|None, "city": str|None, "t": float}}
+
+- start_time 与场次当前的开演时间不一致时视为失效（改期后重新解析）
+- 查到卡司的结果缓存 TTL 秒，与扫剧日数据的刷新间隔一致；已经开演的场次不再过期
+- 请求成功但未查到卡司（cast 为 None）同样缓存 MISS_TTL 秒，避免反复查询所有检索名；
+  请求失败时调用方不应写入缓存
+- 未查到卡司不会覆盖同一开演时间已查到的卡司（包括已过期的）：带城市条件时直接忽略，
+  不带城市条件时保留原卡司，TTL 秒后再重新查询
+- 带城市条件的查询：命中结果的城市包含查询城市即可复用；未命中只对相同的查询条件有效
+"""
+import time
+from datetime import datetime, timedelta
+
+TTL = 3600
+MISS_TTL = 1800
+KEEP_DAYS_AFTER_SHOW = 3  # 开演若干天后从缓存中清除
+
+
+class CastCache:
+
+    def __init__(self, data, ttl=TTL, miss_ttl=MISS_TTL):
+        self.data = data  # 持久化的缓存字典
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self.on_update = None  # (ticket_id, cast) -> None，写入时 cast 为卡司列表，未查到卡司或失效时为 None
+
+    def get(self, ticket_id, start_time, city=None, now=None):
+        """
+        Returns:
+            dict | None: 命中时返回 {"cast": list, "city": str|None}（未查到卡司时 cast 为空列表），
+                         未命中或已失效时返回 None
+        """
+        entry = self.data.get(str(ticket_id))
+        if not entry or entry["start_time"] != start_time:
+            return None
+        now = time.time() if now is None else now
+        age = now - entry["t"]
+        if entry["cast"] is None:
+            if age > self.miss_ttl or entry["query_city"] != city:
+                return None
+            return {"cast": [], "city": None}
+        if city and city not in (entry["city"] or ""):
+            return None
+        if age > self.ttl and not self._started(start_time, now):
+            return None
+        return {"cast": entry["cast"], "city": entry["city"]}
+
+    def put(self, ticket_id, start_time, cast, city=None, query_city=None, now=None):
+        """cast 为 None 表示请求成功但未查到卡司（负缓存）"""
+        ticket_id = str(ticket_id)
+        old = self.data.get(ticket_id)
+        if cast is None and old and old["cast"] is not None and old["start_time"] == start_time:
+            if not query_city:
+                # 扫剧暂时查不到这场演出时保留原卡司，过一个 TTL 再查
+                old["t"] = time.time() if now is None else now
+            # 按城市过滤没查到时不覆盖已有的不限城市的结果
+            return
+        self.data[ticket_id] = {
+            "start_time": start_time,
+            "query_city": query_city,
+            "cast": cast,
+            "city": city,
+            "t": time.time() if now is None else now,
+        }
+        if self.on_update:
+            # 未查到卡司不写入演员索引，负缓存过期后会重新查询
+            self.on_update(ticket_id, cast or None)
+
+    def invalidate(self, ticket_id):
+        self.data.pop(str(ticket_id), None)
+        if self.on_update:
+            self.on_update(str(ticket_id), None)
+
+    def prune(self, now=None):
+        """清除开演时间早于 KEEP_DAYS_AFTER_SHOW 天前的场次"""
+        cutoff = (datetime.fromtimestamp(time.time() if now is None else now)
+                  - timedelta(days=KEEP_DAYS_AFTER_SHOW)).strftime("%Y-%m-%d %H:%M")
+        for tid in [tid for tid, e in self.data.items() if (e["start_time"] or "") < cutoff]:
+            self.invalidate(tid)
+
+    @staticmethod
+    def _started(start_time, now):
+        # start_time 为 "%Y-%m-%d %H:%M" 格式，可直接按字符串比较
+        return start_time <= datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M")
@@ -0,0 +1,213 @@
+"""
+票务变动日志
+
+原先每次出现上新/补票/待开票时，都把完整的新旧数据各写一份带缩进的 JSON 到新目录，
+这里改为按天滚动的追加式日志，每轮只记录发生变化的场次::
+
+    update_data_cache/journal-2025-08-04.jsonl.gz
+
+文件由多个 gzip 成员拼接而成，每次 append 追加一个成员，解压后每行一条记录：
+
+    {"t": "...", "type": "checkpoint", "events": {event_id: {ticket_id: ticket}}}
+    {"t": "...", "type": "delta", "reason": "update", "set": {event_id: {ticket_id: ticket}},
+     "del": {event_id: [ticket_id, ...]}, "del_events": [event_id, ...]}
+    {"t": "...", "type": "error", "error": "...", "traceback": "..."}
+
+每个文件以 checkpoint 开头（进程重启后的第一条记录也是 checkpoint），
+因此 reconstruct(at) 只需从不晚于 at 的最近一个 checkpoint 开始回放。
+
+diff() 在事件循环中只比较本轮刷新过的剧目，生成记录；write() 负责压缩和写盘，
+调用方应放到工作线程中执行::
+
+    records = journal.diff(events, refreshed_event_ids)
+    await asyncio.to_thread(journal.write, records)
+
+旧版本按时间命名的缓存目录（"2025-08-04_21-51-56"，位于日志目录和 legacy_roots 中）
+超过保留时间后同样在 prune 时删除。
+"""
+import gzip
+import os
+import shutil
+import traceback
+from datetime import datetime, timedelta
+
+from plugins.AdminPlugin import codec
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+FILE_PREFIX = "journal-"
+FILE_SUFFIX = ".jsonl.gz"
+RETENTION_HOURS = 48
+LEGACY_DIR_FORMAT = "%Y-%m-%d_%H-%M-%S"
+
+
+def _event_tickets(event):
+    return {tid: dict(ticket) for tid, ticket in (event.get("ticket_details") or {}).items()}
+
+
+class ChangeJournal:
+
+    def __init__(self, root, retention_hours=RETENTION_HOURS, legacy_roots=()):
+        self.root = root
+        self.retention_hours = retention_hours
+        self.legacy_roots = tuple(legacy_roots)
+        self._state = None  # 最近一次写入日志时的票务状态 {event_id: {ticket_id: ticket}}
+        self._day = None  # 当前日志文件对应的日期
+
+    def _path(self, day):
+        return os.path.join(self.root, f"{FILE_PREFIX}{day}{FILE_SUFFIX}")
+
+    def _append(self, records, now):
+        os.makedirs(self.root, exist_ok=True)
+        text = "".join(codec.dumps(r) + "\n" for r in records)
+        data = gzip.compress(text.encode("utf-8"))
+        with open(self._path(now.strftime("%Y-%m-%d")), "ab") as f:
+            f.write(data)
+        return len(data)
+
+    def diff(self, events, event_ids=None, reason="update", now=None):
+        """
+        计算当前票务状态相对上一次记录的变化，只更新内存中的状态，不写盘
+
+        Args:
+            events: HulaquanDataManager.data["events"]
+            event_ids: 本轮刷新过的剧目，只比较这些剧目（以及已下架的剧目）；为 None 时比较全部剧目
+        Returns:
+            list: 需要写入的记录，没有变化时为空列表
+        """
+        now = now or datetime.now()
+        day = now.strftime("%Y-%m-%d")
+        if self._state is None or day != self._day:
+            # 每天（以及重启后）第一条记录为完整的 checkpoint
+            self._state = {eid: _event_tickets(event) for eid, event in events.items()}
+            self._day = day
+            return [{"t": now.strftime(TIME_FORMAT), "type": "checkpoint", "reason": reason, "events": self._state}]
+        old = self._state
+        changed, removed = {}, {}
+        for eid in (events if event_ids is None else event_ids):
+            event = events.get(eid)
+            if event is None:
+                continue
+            tickets = _event_tickets(event)
+            old_tickets = old.get(eid, {})
+            diff = {tid: t for tid, t in tickets.items() if old_tickets.get(tid) != t}
+            if diff:
+                changed[eid] = diff
+            gone = [tid for tid in old_tickets if tid not in tickets]
+            if gone:
+                removed[eid] = gone
+            old[eid] = tickets
+        removed_events = [eid for eid in old if eid not in events]
+        for eid in removed_events:
+            del old[eid]
+        if not (changed or removed or removed_events):
+            return []
+        record = {"t": now.strftime(TIME_FORMAT), "type": "delta", "reason": reason, "set": changed}
+        if removed:
+            record["del"] = removed
+        if removed_events:
+            record["del_events"] = removed_events
+        return [record]
+
+    def error_record(self, error, now=None):
+        now = now or datetime.now()
+        return {
+            "t": now.strftime(TIME_FORMAT),
+            "type": "error",
+            "error": f"{type(error).__name__}: {error}",
+            "traceback": "".join(traceback.format_exception(type(error), error, error.__traceback__)),
+        }
+
+    def write(self, records, now=None):
+        """
+        追加 records（diff / error_record 的结果），写入 checkpoint 时顺便清理过期文件
+
+        Returns:
+            int: 写入的字节数
+        """
+        if not records:
+            return 0
+        # 默认写入记录生成当天的文件（diff 与写盘之间可能跨过零点）
+        now = now or datetime.strptime(records[0]["t"], TIME_FORMAT)
+        written = self._append(records, now)
+        if any(r["type"] == "checkpoint" for r in records):
+            self.prune(now)
+        return written
+
+    def record(self, events, reason="update", now=None, event_ids=None):
+        """diff 并立即写入（同步），返回写入的字节数"""
+        return self.write(self.diff(events, event_ids, reason, now), now)
+
+    def record_error(self, error, now=None):
+        return self.write([self.error_record(error, now)], now)
+
+    def read(self, day):
+        """按顺序返回某天日志文件中的全部记录"""
+        path = self._path(day)
+        if not os.path.exists(path):
+            return []
+        with gzip.open(path, "rb") as f:
+            return [codec.loads(line) for line in f if line.strip()]
+
+    def days(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name[len(FILE_PREFIX):-len(FILE_SUFFIX)]
+            for name in os.listdir(self.root)
+            if name.startswith(FILE_PREFIX) and name.endswith(FILE_SUFFIX)
+        )
+
+    def reconstruct(self, at):
+        """
+        还原 at 时刻的票务状态
+
+        Args:
+            at: datetime 或 "%Y-%m-%d %H:%M:%S" 字符串
+        Returns:
+            dict | None: {"update_time": 最后一条生效记录的时间, "events": {event_id: {"ticket_details": {ticket_id: ticket}}}}，
+                         日志中没有不晚于 at 的 checkpoint 时返回 None
+        """
+        if isinstance(at, datetime):
+            at = at.strftime(TIME_FORMAT)
+        for day in reversed([d for d in self.days() if d <= at[:10]]):
+            records = [r for r in self.read(day) if r["t"] <= at]
+            start = max((i for i, r in enumerate(records) if r["type"] == "checkpoint"), default=None)
+            if start is None:
+                continue
+            state = {eid: dict(tickets) for eid, tickets in records[start]["events"].items()}
+            update_time = records[start]["t"]
+            for r in records[start + 1:]:
+                if r["type"] != "delta":
+                    continue
+                for eid, tickets in r.get("set", {}).items():
+                    state.setdefault(eid, {}).update(tickets)
+                for eid, tids in r.get("del", {}).items():
+                    for tid in tids:
+                        state.get(eid, {}).pop(tid, None)
+                for eid in r.get("del_events", []):
+                    state.pop(eid, None)
+                update_time = r["t"]
+            return {"update_time": update_time, "events": {eid: {"ticket_details": t} for eid, t in state.items()}}
+        return None
+
+    def prune(self, now=None):
+        """删除超过保留时间的日志文件（按文件日期判断）和旧版本的缓存目录"""
+        now = now or datetime.now()
+        cutoff = (now - timedelta(hours=self.retention_hours)).strftime("%Y-%m-%d")
+        for day in self.days():
+            if day < cutoff:
+                try:
+                    os.remove(self._path(day))
+                except OSError:
+                    continue
+        for root in (self.root, *self.legacy_roots):
+            if not os.path.isdir(root):
+                continue
+            for name in os.listdir(root):
+                path = os.path.join(root, name)
+                try:
+                    created = datetime.strptime(name, LEGACY_DIR_FORMAT)
+                except ValueError:
+                    continue
+                if os.path.isdir(path) and now - created > timedelta(hours=self.retention_hours):
+                    shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,242 @@
+"""
+上新提醒的分阶段耗时追踪
+
+每轮 on_hulaquan_announcer 记录一条 CycleTrace，包含各阶段的 span（开始时间与耗时）和计数，
+最近 TRACE_HISTORY 轮保存在环形缓冲区中，管理员可以用 /trace 查看。
+
+当前轮次通过 contextvars 传递，数据管理器中的代码直接调用模块级的 span / count，
+没有正在追踪的轮次时（例如 /hlq 查询触发的刷新、压测脚本）它们什么也不做::
+
+    from plugins.Hulaquan.cycle_trace import tracer, span, count
+
+    trace = tracer.start()
+    try:
+        async with span("fetch_event_list"):
+            ...
+        count("messages", 3)
+    finally:
+        tracer.finish(trace)
+
+同名的 span 可以出现多次（例如每个剧目一次详情请求），报告中按名称汇总次数、累计耗时、
+最慢的一次及其 key；并发执行的同名 span 的 wall 为从第一次开始到最后一次结束的时间。
+"""
+import contextvars
+import time
+from collections import deque
+from contextlib import nullcontext
+from datetime import datetime
+
+TRACE_HISTORY = 50
+
+PHASE_LABELS = {
+    "fetch_event_list": "获取剧目列表",
+    "fetch_details": "获取剧目详情",
+    "fetch_detail": "  单个剧目详情请求",
+    "diff": "比较票务变动",
+    "migrate_virtual_events": "虚拟事件迁移",
+    "match_actors": "演员订阅匹配",
+    "generate_text": "生成变动文本",
+    "fan_out": "计算接收者并生成消息",
+    "send": "发送消息",
+}
+COUNTER_LABELS = {
+    "events": "剧目",
+    "detail_requests": "详情请求",
+    "failed_requests": "失败请求",
+    "changed_tickets": "变动场次",
+    "recipients": "接收者",
+    "messages": "消息",
+}
+
+_current = contextvars.ContextVar("hulaquan_cycle_trace", default=None)
+_NULL_SPAN = nullcontext()
+
+
+class _Span:
+    """同时支持 with 和 async with"""
+
+    __slots__ = ("trace", "name", "key", "_start")
+
+    def __init__(self, trace, name, key=None):
+        self.trace = trace
+        self.name = name
+        self.key = key
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        self.trace.spans.append((self.name, self._start - self.trace._t0, end - self._start, self.key))
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+class CycleTrace:
+
+    def __init__(self, seq, **meta):
+        self.seq = seq
+        self.meta = meta
+        self.started_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self._t0 = time.perf_counter()
+        self.spans = []  # [(name, 相对开始时间, 耗时, key)]
+        self.counters = {}
+        self.duration = None
+        self.status = "running"
+        self.error = None
+
+    def span(self, name, key=None):
+        return _Span(self, name, key)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def finish(self, status="ok", error=None):
+        self.duration = time.perf_counter() - self._t0
+        self.status = status
+        self.error = error
+
+    def phases(self):
+        """
+        按名称汇总 span，按第一次开始的时间排序
+
+        Returns:
+            dict: {name: {"count", "total", "wall", "max", "max_key", "start"}}（秒）
+        """
+        result = {}
+        for name, start, duration, key in self.spans:
+            p = result.get(name)
+            if p is None:
+                p = result[name] = {"count": 0, "total": 0.0, "max": 0.0, "max_key": None, "start": start, "end": 0.0}
+            p["count"] += 1
+            p["total"] += duration
+            if duration >= p["max"]:
+                p["max"], p["max_key"] = duration, key
+            p["start"] = min(p["start"], start)
+            p["end"] = max(p["end"], start + duration)
+        for p in result.values():
+            p["wall"] = p.pop("end") - p["start"]
+        return dict(sorted(result.items(), key=lambda x: x[1]["start"]))
+
+    def slowest_phase(self):
+        # 单个剧目详情请求包含在 fetch_details 中，不单独比较
+        phases = {k: v for k, v in self.phases().items() if k != "fetch_detail"}
+        if not phases:
+            return None
+        return max(phases.items(), key=lambda x: x[1]["wall"])
+
+    def to_dict(self):
+        return {
+            "seq": self.seq,
+            "started_at": self.started_at,
+            "duration": round(self.duration, 4) if self.duration is not None else None,
+            "status": self.status,
+            "error": self.error,
+            "meta": self.meta,
+            "counters": self.counters,
+            "phases": {
+                name: {k: (round(v, 4) if isinstance(v, float) else v) for k, v in p.items()}
+                for name, p in self.phases().items()
+            },
+        }
+
+    def summary_line(self):
+        duration = f"{self.duration:.2f}s" if self.duration is not None else "进行中"
+        line = f"#{self.seq} {self.started_at} {duration} {self.status}"
+        slowest = self.slowest_phase()
+        if slowest:
+            name, p = slowest
+            line += f" | 最慢：{PHASE_LABELS.get(name, name)} {p['wall']:.2f}s"
+        changed = self.counters.get("changed_tickets")
+        if changed is not None:
+            line += f" | 变动 {changed}"
+        return line
+
+    def format(self):
+        lines = [self.summary_line()]
+        if self.error:
+            lines.append(f"错误：{self.error}")
+        if self.counters:
+            lines.append(" / ".join(f"{COUNTER_LABELS.get(k, k)} {v}" for k, v in self.counters.items()))
+        for name, p in self.phases().items():
+            line = f"{PHASE_LABELS.get(name, name)}：{p['wall']:.3f}s（+{p['start']:.3f}s 开始）"
+            if p["count"] > 1:
+                line += f"，{p['count']} 次，累计 {p['total']:.3f}s，最慢 {p['max']:.3f}s"
+                if p["max_key"] is not None:
+                    line += f"（{p['max_key']}）"
+            lines.append(line)
+        return "\n".join(lines)
+
+
+class CycleTracer:
+    """保存最近 maxlen 轮追踪记录的环形缓冲区"""
+
+    def __init__(self, maxlen=TRACE_HISTORY):
+        self.traces = deque(maxlen=maxlen)
+        self._seq = 0
+        self._tokens = {}
+
+    def start(self, **meta):
+        """开始新的一轮并设为当前轮次（只对当前任务及其之后创建的子任务生效）"""
+        self._seq += 1
+        trace = CycleTrace(self._seq, **meta)
+        self.traces.append(trace)
+        self._tokens[trace.seq] = _current.set(trace)
+        return trace
+
+    def finish(self, trace, status="ok", error=None):
+        trace.finish(status, error)
+        token = self._tokens.pop(trace.seq, None)
+        if token is not None:
+            try:
+                _current.reset(token)
+            except ValueError:
+                # 在其他上下文中结束时无法还原，直接清空
+                _current.set(None)
+
+    def recent(self, n=None):
+        traces = list(self.traces)
+        return traces[-n:] if n else traces
+
+    def get(self, seq):
+        for trace in self.traces:
+            if trace.seq == seq:
+                return trace
+        return None
+
+    def slowest(self):
+        finished = [t for t in self.traces if t.duration is not None]
+        return max(finished, key=lambda t: t.duration, default=None)
+
+    def report(self, n=10):
+        traces = self.recent(n)
+        if not traces:
+            return "暂无上新提醒的追踪记录。"
+        lines = [f"最近 {len(traces)} 轮上新提醒（共保存 {len(self.traces)} 轮，/trace <序号> 查看详情）："]
+        lines.extend(t.summary_line() for t in reversed(traces))
+        return "\n".join(lines)
+
+
+def current_trace():
+    return _current.get()
+
+
+def span(name, key=None):
+    """在当前轮次中记录一个阶段，没有正在追踪的轮次时不做任何事"""
+    trace = _current.get()
+    return trace.span(name, key) if trace is not None else _NULL_SPAN
+
+
+def count(name, n=1):
+    trace = _current.get()
+    if trace is not None:
+        trace.count(name, n)
+
+
+tracer = CycleTracer()
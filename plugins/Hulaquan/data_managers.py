@@ -17,8 +17,13 @@ Hlq = HulaquanDataManager()
 
 managers: list[BaseDataManager] = [User, Stats, Saoju, Hlq, Alias]
 async def save_all(on_close=False):
+    """保存所有数据管理器，没有调用过 mark_dirty 的管理器会被跳过；关闭时强制按快照摘要检查（见 BaseDataManager.save）"""
     success = 1
+    written = []
     for manager in managers:
-        result = await manager.save(on_close)
+        result = await manager.save(on_close, force=on_close)
         success *= int(result['success'])
+        if result['success'] and not result.get('skipped'):
+            written.append(manager.__class__.__name__)
+    log.info(f"数据保存：写入 {written or '无'}，其余无变化已跳过")
     return bool(success)
\ No newline at end of file
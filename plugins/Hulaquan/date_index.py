@@ -0,0 +1,64 @@
+"""
+按日期索引场次
+
+/date 原先遍历全部剧目和场次，并对每个场次重新解析开演时间。
+这里在写入 ticket_details 时按开演日期建立索引，保存解析好的开演时间和标题中的城市::
+
+    date("YYYY-MM-DD") -> {ticket_id: {"event_id", "start": datetime, "city": str|None}}
+
+查询时只需取出当天的场次再渲染。索引不持久化，启动时由已有数据重建。
+"""
+from plugins.Hulaquan.utils import standardize_datetime, extract_title_info
+
+
+class TicketDateIndex:
+
+    def __init__(self):
+        self._by_date = {}  # date -> {ticket_id: entry}
+        self._event_tickets = {}  # event_id -> {ticket_id: date}
+
+    def update_event(self, event_id, tickets):
+        """用 event 当前的 ticket_details 替换该剧目在索引中的全部场次"""
+        event_id = str(event_id)
+        self.remove_event(event_id)
+        dates = {}
+        for ticket_id, ticket in (tickets or {}).items():
+            start = ticket.get("start_time")
+            if not start:
+                continue
+            try:
+                start = standardize_datetime(start, with_second=False, return_str=False)
+            except Exception:
+                continue
+            date = start.strftime("%Y-%m-%d")
+            city = extract_title_info(ticket.get("title", "")).get("city")
+            self._by_date.setdefault(date, {})[str(ticket_id)] = {"event_id": event_id, "start": start, "city": city}
+            dates[str(ticket_id)] = date
+        if dates:
+            self._event_tickets[event_id] = dates
+
+    def remove_event(self, event_id):
+        for ticket_id, date in self._event_tickets.pop(str(event_id), {}).items():
+            tickets = self._by_date.get(date)
+            if tickets is not None:
+                tickets.pop(ticket_id, None)
+                if not tickets:
+                    del self._by_date[date]
+
+    def sync(self, events):
+        """移除已不存在的剧目，并为尚未建立索引的剧目建立索引"""
+        for event_id in [eid for eid in self._event_tickets if eid not in events]:
+            self.remove_event(event_id)
+        for event_id, event in events.items():
+            if event_id not in self._event_tickets and event.get("ticket_details"):
+                self.update_event(event_id, event["ticket_details"])
+
+    def tickets_on(self, date, city=None):
+        """
+        Returns:
+            dict: {ticket_id: entry}；指定 city 时只保留标题中的城市包含 city 或标题中没有城市的场次
+        """
+        tickets = self._by_date.get(date, {})
+        if city:
+            return {tid: e for tid, e in tickets.items() if not e["city"] or city in e["city"]}
+        return dict(tickets)
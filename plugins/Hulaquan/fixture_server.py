@@ -0,0 +1,251 @@
+"""
+呼啦圈 / 扫剧接口的录制回放服务器
+
+压测和调试时代替 clubz.cloudsation.com 与 y.saoju.net：
+
+- record：把请求转发到真实接口，并按请求保存响应（getevent.html、getEventDetails.html、
+  search_day、演员列表和演员页面都会被记录）
+- replay：只用录下的响应作答，可以设置延迟、错误率，以及每轮随机修改部分剧目的余票
+
+请求经 http_client.set_route 转到本服务器，地址格式为 ``http://127.0.0.1:<port>/<原host>/<原路径>``::
+
+    # 录制：启动后让机器人（或 bench_refresh.py --record）通过本服务器访问接口
+    python -m plugins.Hulaquan.fixture_server record fixtures.json --port 8765
+    # 回放
+    python -m plugins.Hulaquan.fixture_server replay fixtures.json --latency 0.05 --error-rate 0.01 --mutate 0.1
+    # 机器人使用回放数据
+    HTTP_CLIENT_ROUTES=clubz.cloudsation.com=http://127.0.0.1:8765/clubz.cloudsation.com,y.saoju.net=http://127.0.0.1:8765/y.saoju.net
+
+录制文件为 JSON：{请求键: {"status": int, "content_type": str, "body": str}}，
+请求键为 ``host/path?排序后的参数``（忽略 access_token）。
+"""
+import argparse
+import asyncio
+import random
+from collections import Counter
+from datetime import datetime
+from urllib.parse import urlencode
+
+import aiohttp
+from aiohttp import web
+
+from plugins.AdminPlugin import codec
+
+UPSTREAM_SCHEMES = {
+    "clubz.cloudsation.com": "https",
+    "y.saoju.net": "http",
+}
+IGNORED_PARAMS = {"access_token"}
+EVENT_LIST_PATH = "site/getevent.html"
+EVENT_DETAILS_PATH = "event/getEventDetails.html"
+
+
+def request_key(host, path, query):
+    params = sorted((k, v) for k, v in query.items() if k not in IGNORED_PARAMS)
+    return f"{host}/{path}" + (f"?{urlencode(params)}" if params else "")
+
+
+def _kind(path):
+    # 用于统计请求数，例如 "getevent.html"、"search_day"、"artist"
+    parts = [p for p in path.split("/") if p]
+    if not parts:
+        return "/"
+    if "artist" in parts:
+        return "artist_list" if parts[-1] == "artist" and "api" in parts else "artist"
+    return parts[-1]
+
+
+class FixtureServer:
+
+    def __init__(self, fixtures=None, mode="replay", latency=0.0, jitter=0.0, error_rate=0.0, mutate=0.0, seed=0):
+        """
+        Args:
+            fixtures: 已录制的响应，record 模式下新录制的响应也写入这里
+            latency / jitter: 每个请求的延迟为 latency + uniform(0, jitter) 秒
+            error_rate: 以该概率返回 503
+            mutate: 每次请求剧目列表时，以该概率选中剧目并修改其余票，同时更新剧目的 update_time，
+                    让增量刷新能发现变化
+        """
+        self.fixtures = fixtures if fixtures is not None else {}
+        self.mode = mode
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.mutate = mutate
+        self.random = random.Random(seed)
+        self.requests = Counter()  # 按接口统计的请求数
+        self.errors = 0
+        self.misses = 0  # 回放时没有录制数据的请求
+        self._round = 0
+        self._mutated_round = {}  # event_id -> 最近一次被选中修改的轮次
+        self._left_tickets = {}  # event_id -> {ticket_id: (轮次, 修改后的余票)}
+        self._event_updates = {}  # event_id -> 修改后的 update_time
+        self._runner = None
+        self._session = None
+        self.port = None
+
+    # ---------------- 启停 ---------------- #
+
+    async def start(self, host="127.0.0.1", port=0):
+        app = web.Application()
+        app.router.add_get("/{host}/{path:.*}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        return self
+
+    async def stop(self):
+        if self._session:
+            await self._session.close()
+            self._session = None
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def base_url(self, host):
+        return f"http://127.0.0.1:{self.port}/{host}"
+
+    def routes(self):
+        return {host: self.base_url(host) for host in UPSTREAM_SCHEMES}
+
+    def reset_stats(self):
+        self.requests.clear()
+        self.errors = 0
+        self.misses = 0
+
+    def save(self, path):
+        codec.dump_file(self.fixtures, path)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        return cls(codec.load_file(path), **kwargs)
+
+    # ---------------- 请求处理 ---------------- #
+
+    async def _handle(self, request):
+        host, path = request.match_info["host"], request.match_info["path"]
+        self.requests[_kind(path)] += 1
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.errors += 1
+            return web.Response(status=503, text="fixture_server: injected error")
+        key = request_key(host, path, request.query)
+        if self.mode == "record":
+            entry = self.fixtures[key] = await self._fetch_upstream(host, path, request.query)
+        else:
+            entry = self.fixtures.get(key)
+            if entry is None:
+                self.misses += 1
+                return web.Response(status=404, text=f"fixture_server: no fixture for {key}")
+        body = entry["body"]
+        if self.mutate and entry["status"] == 200:
+            if path == EVENT_LIST_PATH:
+                body = self._mutate_event_list(body)
+            elif path == EVENT_DETAILS_PATH:
+                body = self._mutate_event_details(request.query.get("id"), body)
+        return web.Response(status=entry["status"], body=body.encode("utf-8"), content_type=entry["content_type"],
+                            charset="utf-8")
+
+    async def _fetch_upstream(self, host, path, query):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+        url = f"{UPSTREAM_SCHEMES.get(host, 'https')}://{host}/{path}"
+        async with self._session.get(url, params=dict(query)) as resp:
+            return {
+                "status": resp.status,
+                "content_type": resp.content_type or "text/plain",
+                "body": await resp.text(encoding="utf-8", errors="replace"),
+            }
+
+    # ---------------- 余票变动 ---------------- #
+
+    def _mutate_event_list(self, body):
+        try:
+            data = codec.loads(body)
+            events = data["events"]
+        except (codec.JSONDecodeError, KeyError, TypeError):
+            return body
+        # 每次请求剧目列表视为新的一轮
+        self._round += 1
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        for event in events:
+            info = event.get("basic_info", {})
+            eid = str(info.get("id"))
+            if self.random.random() < self.mutate:
+                self._event_updates[eid] = now
+                self._mutated_round[eid] = self._round
+            if eid in self._event_updates:
+                info["update_time"] = self._event_updates[eid]
+        return codec.dumps(data)
+
+    def _mutate_event_details(self, event_id, body):
+        event_id = str(event_id)
+        if event_id not in self._mutated_round:
+            return body
+        try:
+            data = codec.loads(body)
+            tickets = data["ticket_details"]
+        except (codec.JSONDecodeError, KeyError, TypeError):
+            return body
+        round_ = self._mutated_round[event_id]
+        state = self._left_tickets.setdefault(event_id, {})  # ticket_id -> (轮次, 余票)
+        for ticket in tickets:
+            tid = str(ticket.get("id"))
+            total = ticket.get("total_ticket") or 0
+            # 同一轮内重复请求得到相同的余票；新一轮中约一半场次的余票发生变化
+            if tid not in state or state[tid][0] != round_:
+                rng = random.Random(f"{event_id}-{tid}-{round_}")
+                if tid not in state or rng.random() < 0.5:
+                    state[tid] = (round_, rng.randint(0, total) if total else 0)
+                else:
+                    state[tid] = (round_, state[tid][1])
+            ticket["left_ticket_count"] = state[tid][1]
+        return codec.dumps(data)
+
+
+async def _serve(args):
+    if args.mode == "record":
+        try:
+            fixtures = codec.load_file(args.fixtures)
+        except FileNotFoundError:
+            fixtures = {}
+        server = FixtureServer(fixtures, mode="record")
+    else:
+        server = FixtureServer.load(args.fixtures, latency=args.latency, jitter=args.jitter,
+                                    error_rate=args.error_rate, mutate=args.mutate, seed=args.seed)
+    await server.start(args.host, args.port)
+    print(f"fixture_server ({args.mode}) 监听 {args.host}:{server.port}")
+    print("HTTP_CLIENT_ROUTES=" + ",".join(f"{h}={b}" for h, b in server.routes().items()))
+    try:
+        await asyncio.Event().wait()
+    finally:
+        if args.mode == "record":
+            server.save(args.fixtures)
+            print(f"已保存 {len(server.fixtures)} 条响应到 {args.fixtures}")
+        await server.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="呼啦圈 / 扫剧接口的录制回放服务器")
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("fixtures", help="录制文件路径")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的固定延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="额外的随机延迟上限（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 503 的概率")
+    parser.add_argument("--mutate", type=float, default=0.0, help="每轮修改余票的剧目比例")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+进程级共享的 HTTP 客户端
+
+所有数据管理器（呼啦圈 / 扫剧）的网络请求都通过这里获取 aiohttp.ClientSession，
+按 host 维护独立的连接池，复用 keep-alive 连接并缓存 DNS 解析结果，
+避免每次请求都重新建立 TCP 连接。
+
+用法::
+
+    from plugins.Hulaquan.http_client import get_session
+    session = await get_session(url)
+    async with session.get(url, timeout=8) as resp:
+        ...
+
+插件关闭时调用 ``await close_all()`` 释放所有连接。
+
+调试/压测时可以用 ``set_route(host, base)`` 或环境变量 ``HTTP_CLIENT_ROUTES``
+（``host=base,host=base``）把某个 host 的请求转到本地的 fixture_server.py，
+发请求前用 ``route(url)`` 改写地址。
+
+每个请求从发出到收到响应头的耗时记入 perf，名称为 ``http:<host><路径>``
+（路径中的数字替换为 N，避免每个剧目 / 演员各占一项）。
+"""
+import asyncio
+import os
+import re
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from plugins.AdminPlugin.perf import perf
+
+# 每个 host 的最大并发连接数，未列出的 host 使用 DEFAULT_LIMIT_PER_HOST
+HOST_LIMITS = {
+    "clubz.cloudsation.com": 10,
+    "y.saoju.net": 5,
+}
+DEFAULT_LIMIT_PER_HOST = 4
+KEEPALIVE_TIMEOUT = 60  # 空闲连接保留时间（秒）
+DNS_CACHE_TTL = 600  # DNS 缓存时间（秒）
+DEFAULT_TIMEOUT = 30  # 请求未指定 timeout 时的总超时（秒）
+
+_sessions: dict[str, aiohttp.ClientSession] = {}
+_closing: set[asyncio.Task] = set()  # 正在关闭的旧 session，保留引用直到关闭完成
+_lock = None
+# host -> 替代的地址前缀，例如 "clubz.cloudsation.com" -> "http://127.0.0.1:8765/clubz.cloudsation.com"
+_routes: dict[str, str] = dict(
+    item.split("=", 1) for item in os.environ.get("HTTP_CLIENT_ROUTES", "").split(",") if "=" in item
+)
+
+
+def _host_of(url):
+    return urlsplit(url).hostname or ""
+
+
+def set_route(host, base=None):
+    """把 host 的请求转到 base（不含结尾的 /），base 为 None 时取消转发"""
+    if base is None:
+        _routes.pop(host, None)
+    else:
+        _routes[host] = base.rstrip("/")
+
+
+def route(url):
+    """按 set_route 的设置改写 url，没有设置转发时原样返回"""
+    if not _routes:
+        return url
+    parts = urlsplit(url)
+    base = _routes.get(parts.hostname or "")
+    if base is None:
+        return url
+    return base + (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+
+
+def set_host_limit(host, limit):
+    """
+    修改某个 host 的连接数上限。已创建的连接池会在下次 get_session 时按新上限重建。
+    """
+    HOST_LIMITS[host] = int(limit)
+    session = _sessions.pop(host, None)
+    if session and not session.closed:
+        task = asyncio.create_task(session.close())
+        _closing.add(task)
+        task.add_done_callback(_closing.discard)
+
+
+_DIGITS = re.compile(r"\d+")
+
+
+def _metric_name(url):
+    return f"http:{url.host}{_DIGITS.sub('N', url.path)}"
+
+
+async def _on_request_start(session, ctx, params):
+    ctx.perf_start = time.perf_counter()
+    ctx.perf_name = _metric_name(params.url)
+    perf.begin(ctx.perf_name)
+
+
+async def _on_request_end(session, ctx, params):
+    perf.end(ctx.perf_name, time.perf_counter() - ctx.perf_start, error=params.response.status >= 500)
+
+
+async def _on_request_exception(session, ctx, params):
+    perf.end(ctx.perf_name, time.perf_counter() - ctx.perf_start, error=True)
+
+
+def _trace_config():
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(_on_request_start)
+    trace.on_request_end.append(_on_request_end)
+    trace.on_request_exception.append(_on_request_exception)
+    return trace
+
+
+def _new_session(host):
+    connector = aiohttp.TCPConnector(
+        limit=HOST_LIMITS.get(host, DEFAULT_LIMIT_PER_HOST),
+        limit_per_host=HOST_LIMITS.get(host, DEFAULT_LIMIT_PER_HOST),
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        use_dns_cache=True,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=DEFAULT_TIMEOUT),
+        trace_configs=[_trace_config()],
+    )
+
+
+async def get_session(url) -> aiohttp.ClientSession:
+    """
+    获取 url 所属 host 的共享 session，不存在或已关闭时新建。
+    session 必须在事件循环中创建，因此这里是协程。
+    """
+    global _lock
+    host = _host_of(url)
+    session = _sessions.get(host)
+    if session is not None and not session.closed:
+        return session
+    if _lock is None:
+        _lock = asyncio.Lock()
+    async with _lock:
+        session = _sessions.get(host)
+        if session is None or session.closed:
+            session = _sessions[host] = _new_session(host)
+        return session
+
+
+async def close_all():
+    """关闭所有共享 session，供插件 on_close 调用"""
+    sessions = list(_sessions.values())
+    _sessions.clear()
+    for session in sessions:
+        if not session.closed:
+            await session.close()
+    if _closing:
+        await asyncio.gather(*_closing, return_exceptions=True)
+    # 给底层 SSL 连接留出关闭时间，避免 "Unclosed connection" 警告
+    await asyncio.sleep(0.25)
@@ -4,12 +4,16 @@ import functools
 from ncatbot.plugin import BasePlugin, CompatibleEnrollment, Event
 from ncatbot.core import GroupMessage, PrivateMessage, BaseMessage
 from .Exceptions import RequestTimeoutException
+from . import http_client
+from .message_dispatcher import MessageDispatcher
 from plugins.Hulaquan.data_managers import Saoju, Stats, Alias, Hlq, User, save_all
 from plugins.Hulaquan.StatsDataManager import StatsDataManager, maxLatestReposCount
 from plugins.Hulaquan.SaojuDataManager import SaojuDataManager
 from plugins.Hulaquan.AliasManager import AliasManager
 from plugins.Hulaquan.HulaquanDataManager import HulaquanDataManager
 from plugins.AdminPlugin.UsersManager import UsersManager
+from plugins.AdminPlugin.perf import perf
+from .cycle_trace import tracer, span, count
 from .user_func_help import *
 from .utils import parse_text_to_dict_with_mandatory_check, standardize_datetime, dateTimeToStr
 from ncatbot.utils.logger import get_log
@@ -74,20 +78,26 @@ def user_command_wrapper(command_name):
             @functools.wraps(func)
             async def wrapper(this, *args, **kwargs):
                 Stats.on_command(command_name)
-                try:
-                    return await func(this, *args, **kwargs)
-                except Exception as e:
-                    # 避免循环报错：先记录日志，再尝试通知
-                    log.error(f"{command_name} 命令异常: {e}")
-                    import traceback
-                    log.error(traceback.format_exc())
-                    
-                    # 安全地通知管理员（避免再次触发错误）
+                with perf.timer(f"cmd:{command_name}") as timer:
                     try:
-                        await this.on_traceback_message(f"{command_name} 命令异常: {e}", announce_admin=True)
-                    except Exception as notify_error:
-                        # 如果通知失败，只记录日志，不再继续
-                        log.error(f"通知管理员失败: {notify_error}")
+                        return await func(this, *args, **kwargs)
+                    except Exception as e:
+                        timer.error = True
+                        # 避免循环报错：先记录日志，再尝试通知
+                        log.error(f"{command_name} 命令异常: {e}")
+                        import traceback
+                        log.error(traceback.format_exc())
+                    
+                        # 安全地通知管理员（避免再次触发错误）
+                        try:
+                            await this.on_traceback_message(f"{command_name} 命令异常: {e}", announce_admin=True)
+                        except Exception as notify_error:
+                            # 如果通知失败，只记录日志，不再继续
+                            log.error(f"通知管理员失败: {notify_error}")
+                    finally:
+                        # 命令可能修改了订阅/别名，合并为一次延迟保存（无变化时不会写盘）
+                        User.request_save()
+                        Alias.request_save()
             return wrapper
         return decorator
 
@@ -131,9 +141,12 @@ class Hulaquan(BasePlugin):
         self._hulaquan_announcer_task = None
         self._hulaquan_announcer_interval = 120
         self._hulaquan_announcer_running = False
+        self.dispatcher = MessageDispatcher(self, on_user_deleted=User.delete_user)
         self.register_hulaquan_announcement_tasks()
         self.register_hlq_query()
+        Hlq.scheduler.max_requests_per_minute = self.data["config"].get("refresh_requests_per_minute") or None
         self.start_hulaquan_announcer(self.data["config"].get("scheduled_task_time"))
+        Saoju.start_prefetcher(self.data["config"].get("saoju_prefetch_days"))
         asyncio.create_task(User.update_friends_list(self))
         
     async def on_unload(self):
@@ -143,17 +156,27 @@ class Hulaquan(BasePlugin):
     async def on_close(self, *arg, **kwd):
         self.remove_scheduled_task("呼啦圈上新提醒")
         self.stop_hulaquan_announcer()
+        Saoju.stop_prefetcher()
+        await self.dispatcher.stop()
         await self.save_data_managers(on_close=True)
+        await http_client.close_all()
         return await super().on_close(*arg, **kwd)
     
     async def _hulaquan_announcer_loop(self):
         while self._hulaquan_announcer_running:
+            adaptive = Hlq.adaptive_refresh
             try:
-                await self.on_hulaquan_announcer()
+                # 定时任务不经过 user_command_wrapper：不计入命令统计，也不触发订阅/别名的延迟保存
+                await self._hulaquan_announce_cycle(adaptive=adaptive)
             except Exception as e:
                 await self.on_traceback_message(f"呼啦圈定时任务异常: {e}")
             try:
-                await asyncio.sleep(int(self._hulaquan_announcer_interval))
+                if adaptive:
+                    # 睡到下一个剧目到期（或需要获取剧目列表）为止，至少间隔 MIN_INTERVAL 秒
+                    delay = Hlq.scheduler.seconds_until_due()
+                    await asyncio.sleep(max(Hlq.scheduler.MIN_INTERVAL, min(delay, int(self._hulaquan_announcer_interval))))
+                else:
+                    await asyncio.sleep(int(self._hulaquan_announcer_interval))
             except Exception as e:
                 await self.on_traceback_message(f"定时任务sleep异常: {e}")
             
@@ -164,6 +187,8 @@ class Hulaquan(BasePlugin):
             return  # 已经在运行
         self._hulaquan_announcer_running = True
         self._hulaquan_announcer_interval = int(self._hulaquan_announcer_interval)
+        # 自适应刷新时 scheduled_task_time 为获取剧目列表的间隔
+        Hlq.scheduler.list_interval = self._hulaquan_announcer_interval
         self._hulaquan_announcer_task = asyncio.create_task(self._hulaquan_announcer_loop())
         log.info("呼啦圈检测定时任务已开启")
 
@@ -240,6 +265,24 @@ class Hulaquan(BasePlugin):
             on_change=self.on_change_schedule_hulaquan_task_interval,
         )
         
+        self.register_config(
+            key="refresh_requests_per_minute",
+            default=0,
+            description="自适应刷新每分钟最多的剧目详情请求数（0 为按剧目数和检测间隔计算）",
+            value_type=int,
+            allowed_values=[0, 10, 20, 30, 60, 120],
+            on_change=self.on_change_refresh_requests_per_minute,
+        )
+        
+        self.register_config(
+            key="saoju_prefetch_days",
+            default=SaojuDataManager.PREFETCH_DAYS,
+            description="后台预取扫剧排期的天数",
+            value_type=int,
+            allowed_values=[0, 3, 7, 14, 21, 30],
+            on_change=self.on_change_saoju_prefetch_days,
+        )
+        
         self.register_admin_func(
             name="保存数据（管理员）",
             handler=self.save_data_managers,
@@ -250,6 +293,26 @@ class Hulaquan(BasePlugin):
             metadata={"category": "utility"}
         )
         
+        self.register_admin_func(
+            name="耗时统计（管理员）",
+            handler=self.on_perf_report,
+            prefix="/perf",
+            description="查看命令、网络请求和保存的耗时统计（管理员）",
+            usage="/perf [名称前缀] [-e 按错误数排序] [-reset 清空统计]",
+            examples=["/perf", "/perf cmd:", "/perf http:", "/perf -reset"],
+            metadata={"category": "debug"}
+        )
+        
+        self.register_admin_func(
+            name="上新提醒耗时追踪（管理员）",
+            handler=self.on_trace_report,
+            prefix="/trace",
+            description="查看最近几轮上新提醒各阶段的耗时（管理员）",
+            usage="/trace [序号] [-slow 最慢的一轮]",
+            examples=["/trace", "/trace 12", "/trace -slow"],
+            metadata={"category": "debug"}
+        )
+        
         self.register_admin_func(
             name="广播消息（管理员）",
             handler=self.on_broadcast,
@@ -489,7 +552,7 @@ class Hulaquan(BasePlugin):
     
     # 呼啦圈刷新    
     @user_command_wrapper("hulaquan_announcer")
-    async def on_hulaquan_announcer(self, test=False, manual=False, announce_admin_only=False):
+    async def on_hulaquan_announcer(self, test=False, manual=False, announce_admin_only=False, adaptive=False):
         """
         用户可以选择关注ticketID、eventID
         针对全部events/某eventID/某ticketID，有几种关注模式：
@@ -499,8 +562,14 @@ class Hulaquan(BasePlugin):
             3 额外关注票增/票减
             
         功能逻辑：
-            1.先从hlq获取所有更新数据
+            1.先从hlq获取所有更新数据（adaptive 为 True 时只刷新到期的剧目，见 refresh_scheduler.py）
         """
+        return await self._hulaquan_announce_cycle(test, manual, announce_admin_only, adaptive)
+
+    async def _hulaquan_announce_cycle(self, test=False, manual=False, announce_admin_only=False, adaptive=False):
+        if adaptive and not Hlq.refresh_due():
+            # 没有到期的剧目和剧目列表：不刷新，也不记入 /trace
+            return None
         MODE = {
             "add": 1,
             "new": 1,
@@ -509,9 +578,24 @@ class Hulaquan(BasePlugin):
             "back": 3,
             "sold": 3,
         }
-        start_time = time.time()
+        # 各阶段耗时记入 cycle_trace，管理员可以用 /trace 查看最近几轮
+        trace = tracer.start(manual=manual, test=test, admin_only=announce_admin_only, adaptive=adaptive)
+        status, error = "cancelled", None
         try:
-            result = await Hlq.compare_to_database_async()
+            result = await self.__announce(MODE, announce_admin_only, adaptive)
+            status = "ok" if result else "skipped"
+            return result
+        except Exception as e:
+            status, error = "error", f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            tracer.finish(trace, status, error)
+
+    async def __announce(self, MODE, announce_admin_only=False, adaptive=False):
+        try:
+            result = await Hlq.compare_to_database_async(adaptive=adaptive)
+            if result is None:
+                return
             event_id_to_ticket_ids = result["events"]
             event_msgs = result["events_prefixes"]
             PREFIXES = result["prefix"]
@@ -523,66 +607,76 @@ class Hulaquan(BasePlugin):
             log.error(f"呼啦圈数据刷新出现异常，存在{len(categorized['new'])}条数据刷新")
             if not announce_admin_only:
                 return
-        elapsed_time = round(time.time() - start_time, 2)
-        if not announce_admin_only:
-            _users = User.users()
-        else:
-            _users = {User.admin_id: User.users()[User.admin_id]}
-        for user_id, user in _users.items():
-            messages = self.__generate_announce_text(MODE, event_id_to_ticket_ids, event_msgs, PREFIXES, categorized, tickets, user_id, user)
-            for i in messages:
-                m = "\n\n".join(i)
-                r = await self.api.post_private_msg(user_id, m)
-                if r['retcode'] == 1200:
-                    User.delete_user(user_id)
-                    break
-        if not announce_admin_only:
-            for group_id, group in User.groups().items():
-                messages = self.__generate_announce_text(MODE, event_id_to_ticket_ids, event_msgs, PREFIXES, categorized, tickets, group_id, group, is_group=True)
+        with span("fan_out"):
+            # 通过订阅倒排索引按变动场次计算接收者，只在全局模式下收消息的用户共用同一份消息
+            global_modes, personal = User.announce_targets(tickets, MODE)
+            if announce_admin_only:
+                global_modes = {k: v for k, v in global_modes.items() if k == User.admin_id}
+                personal = {k: v for k, v in personal.items() if k == User.admin_id}
+            global_messages = {}  # all_mode -> messages
+            sending = []
+            recipients = list(dict.fromkeys([*personal, *global_modes]))
+            for user_id in recipients:
+                all_mode = global_modes.get(user_id, 0)
+                if user_id in personal:
+                    announce = self.__collect_announce(MODE, event_id_to_ticket_ids, categorized, tickets, all_mode, personal[user_id])
+                    messages = self.__format_announce_messages(announce, event_msgs, PREFIXES, tickets)
+                else:
+                    if all_mode not in global_messages:
+                        announce = self.__collect_announce(MODE, event_id_to_ticket_ids, categorized, tickets, all_mode)
+                        global_messages[all_mode] = self.__format_announce_messages(announce, event_msgs, PREFIXES, tickets)
+                    messages = global_messages[all_mode]
+                # 由发送器并发限速发送，retcode == 1200 时会删除用户并跳过其余消息
                 for i in messages:
-                    m = "\n\n".join(i)
-                    await self.api.post_group_msg(group_id, m)
+                    sending.append(self.dispatcher.send_private(user_id, "\n\n".join(i), delete_missing=True))
+            if not announce_admin_only:
+                group_modes, _ = User.announce_targets(tickets, MODE, is_group=True)
+                recipients.extend(group_modes)
+                for group_id, all_mode in group_modes.items():
+                    if all_mode not in global_messages:
+                        announce = self.__collect_announce(MODE, event_id_to_ticket_ids, categorized, tickets, all_mode)
+                        global_messages[all_mode] = self.__format_announce_messages(announce, event_msgs, PREFIXES, tickets)
+                    for i in global_messages[all_mode]:
+                        sending.append(self.dispatcher.send_group(group_id, "\n\n".join(i)))
+        count("recipients", len(recipients))
+        count("messages", len(sending))
+        async with span("send"):
+            await asyncio.gather(*sending)
         if len(categorized["pending"]) > 0:
             self.register_pending_tickets_announcer()
         return True
 
     def __generate_announce_text(self, MODE, event_id_to_ticket_ids, event_msgs, PREFIXES, categorized, tickets, user_id, user, is_group=False):
-        announce = {} # event_id: {ticket_id: msg}, ...
-        all_mode = int(user.get("attention_to_hulaquan", 0))
+        """为单个用户/群生成提醒消息（调试工具使用，定时推送走 announce_targets 批量计算）"""
+        all_mode = User._mode_int(user.get("attention_to_hulaquan", 0))
+        personal = None
         if not is_group:
-            fo_events = User.subscribe_events(user_id)
-            fo_tickets = User.subscribe_tickets(user_id)
-            for event in fo_events:
-                eid = event['id']
-                e_mode = int(event['mode'])
-                if eid in event_id_to_ticket_ids:
-                    announce.setdefault(eid, {})
-                    for tid in event_id_to_ticket_ids[eid]:
-                        ticket = tickets[tid]
-                        stat = ticket['categorized']
-                        if e_mode >= MODE.get(stat, 99):
-                            announce[eid].setdefault(stat, set())
-                            announce[eid][stat].add(tid)
-            for t in fo_tickets:
-                tid = t['id']
-                e_mode = int(t['mode'])
-                if tid in tickets.keys():
-                    ticket = tickets[tid]
-                    eid = ticket['event_id']
-                    stat = ticket['categorized']
-                    if e_mode >= MODE.get(stat, 99):
-                        announce.setdefault(eid, {})
-                        announce[eid].setdefault(stat, set())
-                        announce[eid][stat].add(tid)
+            _, personal = User.announce_targets(tickets, MODE)
+            personal = personal.get(str(user_id))
+        announce = self.__collect_announce(MODE, event_id_to_ticket_ids, categorized, tickets, all_mode, personal)
+        return self.__format_announce_messages(announce, event_msgs, PREFIXES, tickets)
+
+    def __collect_announce(self, MODE, event_id_to_ticket_ids, categorized, tickets, all_mode, personal=None):
+        """
+        合并全局模式命中的变动与通过关注剧目/场次命中的变动
+        返回 {event_id: {stat: set(ticket_id)}}，按本轮变动的剧目顺序排列
+        """
+        announce = {}
+        if personal:
+            for eid, stats in personal.items():
+                for stat, tid_s in stats.items():
+                    announce.setdefault(eid, {}).setdefault(stat, set()).update(tid_s)
         for stat, tid_s in categorized.items():
             if all_mode >= MODE.get(stat, 99):
                 for tid in tid_s:
                     ticket = tickets[tid]
-                    eid = ticket['event_id']
+                    eid = str(ticket['event_id'])
                     stat = ticket['categorized']
-                    announce.setdefault(eid, {})
-                    announce[eid].setdefault(stat, set())
-                    announce[eid][stat].add(tid)
+                    announce.setdefault(eid, {}).setdefault(stat, set()).add(tid)
+        order = {str(eid): i for i, eid in enumerate(event_id_to_ticket_ids)}
+        return dict(sorted(announce.items(), key=lambda x: order.get(x[0], len(order))))
+
+    def __format_announce_messages(self, announce, event_msgs, PREFIXES, tickets):
         messages = []
         for eid, stats in announce.items():
             if not len(stats.keys()):
@@ -625,17 +719,20 @@ class Hulaquan(BasePlugin):
     @user_command_wrapper("pending_announcer")
     async def on_pending_tickets_announcer(self, eid:str, message: str, valid_from:str):
         message = f"【即将开票】呼啦圈开票提醒：\n{message}"
+        sending = []
         for user_id, user in User.users().items():
             mode = user.get("attention_to_hulaquan")
             if mode == "1" or mode == "2":
-                await self.api.post_private_msg(user_id, message)
+                sending.append(self.dispatcher.send_private(user_id, message))
         for group_id, group in User.groups().items():
             mode = group.get("attention_to_hulaquan")
             if mode == "1" or mode == "2":
-                await self.api.post_group_msg(group_id, message)
+                sending.append(self.dispatcher.send_group(group_id, message))
+        await asyncio.gather(*sending)
         del Hlq.data["pending_events"][valid_from][eid]
         if len(Hlq.data["pending_events"][valid_from]) == 0:
             del Hlq.data["pending_events"][valid_from]
+        Hlq.mark_dirty()
             
     @user_command_wrapper("switch_mode")
     async def on_switch_scheduled_check_task(self, msg: BaseMessage, group_switch_verify=False):
@@ -734,6 +831,20 @@ class Hulaquan(BasePlugin):
         self.start_hulaquan_announcer(interval=int(value))
         await msg.reply_text(f"已修改至{value}秒更新一次")
     
+    async def on_change_refresh_requests_per_minute(self, value, msg: BaseMessage):
+        if not User.is_op(msg.user_id):
+            await msg.reply_text(f"修改失败，暂无修改刷新频率的权限")
+            return
+        Hlq.scheduler.max_requests_per_minute = int(value) or None
+        await msg.reply_text(f"已修改为每分钟最多{Hlq.scheduler.budget()}次详情请求")
+    
+    async def on_change_saoju_prefetch_days(self, value, msg: BaseMessage):
+        if not User.is_op(msg.user_id):
+            await msg.reply_text(f"修改失败，暂无修改预取天数的权限")
+            return
+        Saoju.start_prefetcher(days=int(value))
+        await msg.reply_text(f"已修改为预取{value}天的扫剧排期")
+    
     def _get_help(self):
         """自动生成帮助文档"""
         text = {"user":"", "admin":""}
@@ -1005,11 +1116,40 @@ class Hulaquan(BasePlugin):
         status = "成功" if success else "失败"
             
         log.info("🟡呼啦圈数据保存"+status)
+        try:
+            perf.flush()
+        except Exception as e:
+            log.error(f"耗时统计写入失败: {e}")
         if msg:
             await msg.reply_text("保存"+status)
         else:
             pass
     
+    async def on_perf_report(self, msg: BaseMessage):
+        """管理员查看耗时统计：/perf [名称前缀] [-e] [-reset]"""
+        args = self.extract_args(msg)
+        if "-reset" in args["mode_args"]:
+            perf.flush()
+            perf.reset()
+            await msg.reply_text("已清空耗时统计（清空前的数据已写入文件）")
+            return
+        prefix = args["text_args"][0] if args["text_args"] else None
+        sort_by = "errors" if "-e" in args["mode_args"] else "p95"
+        await msg.reply_text(perf.report(prefix, sort_by=sort_by))
+    
+    async def on_trace_report(self, msg: BaseMessage):
+        """管理员查看上新提醒的分阶段耗时：/trace [序号] [-slow]"""
+        args = self.extract_args(msg)
+        if "-slow" in args["mode_args"]:
+            trace = tracer.slowest()
+        elif args["text_args"]:
+            seq = args["text_args"][0].lstrip("#")
+            trace = tracer.get(int(seq)) if seq.isdigit() else None
+        else:
+            await msg.reply_text(tracer.report())
+            return
+        await msg.reply_text(trace.format() if trace else "没有找到该轮的追踪记录。")
+    
     @user_command_wrapper("broadcast")
     async def on_broadcast(self, msg: BaseMessage):
         """管理员广播消息到所有用户和群聊"""
@@ -1055,37 +1195,27 @@ class Hulaquan(BasePlugin):
         # 添加广播标识
         full_message = f"📢 系统广播\n━━━━━━━━━━━━━━━━\n{message}"
         
-        # 向所有用户发送
+        # 向所有用户发送（由发送器并发限速发送，失败会自动重试）
         await original_msg.reply_text("📤 开始向用户发送...")
-        for user_id in User.users_list():
-            try:
-                r = await self.api.post_private_msg(user_id, full_message)
-                if r.get('retcode') == 0:
-                    success_users += 1
-                else:
-                    failed_users += 1
-                    log.warning(f"向用户 {user_id} 发送广播失败: {r.get('retcode')}")
-                # 避免发送过快
-                await asyncio.sleep(0.5)
-            except Exception as e:
+        user_ids = User.users_list()
+        results = await asyncio.gather(*(self.dispatcher.send_private(user_id, full_message) for user_id in user_ids))
+        for user_id, r in zip(user_ids, results):
+            if r.get('retcode') == 0:
+                success_users += 1
+            else:
                 failed_users += 1
-                log.error(f"向用户 {user_id} 发送广播异常: {e}")
+                log.warning(f"向用户 {user_id} 发送广播失败: {r.get('retcode')}")
         
         # 向所有群聊发送
         await original_msg.reply_text("📤 开始向群聊发送...")
-        for group_id in User.groups_list():
-            try:
-                r = await self.api.post_group_msg(group_id, full_message)
-                if r.get('retcode') == 0:
-                    success_groups += 1
-                else:
-                    failed_groups += 1
-                    log.warning(f"向群聊 {group_id} 发送广播失败: {r.get('retcode')}")
-                # 避免发送过快
-                await asyncio.sleep(0.5)
-            except Exception as e:
+        group_ids = User.groups_list()
+        results = await asyncio.gather(*(self.dispatcher.send_group(group_id, full_message) for group_id in group_ids))
+        for group_id, r in zip(group_ids, results):
+            if r.get('retcode') == 0:
+                success_groups += 1
+            else:
                 failed_groups += 1
-                log.error(f"向群聊 {group_id} 发送广播异常: {e}")
+                log.warning(f"向群聊 {group_id} 发送广播失败: {r.get('retcode')}")
         
         # 发送结果统计
         result_msg = [
@@ -1839,6 +1969,8 @@ class Hulaquan(BasePlugin):
             info.append(f"检测间隔: {self._hulaquan_announcer_interval} 秒")
             if self._hulaquan_announcer_task:
                 info.append(f"任务完成: {'是' if self._hulaquan_announcer_task.done() else '否'}")
+            if Hlq.adaptive_refresh:
+                info.append(Hlq.scheduler.status(title_of=lambda eid: Hlq.title(event_id=eid, event_name_only=True)))
             await msg.reply_text("\n".join(info))
             
         elif command == "user":
@@ -0,0 +1,235 @@
+"""
+并发、限速的消息发送器
+
+上新提醒、开票提醒和广播原先逐条 await 发送，用户多时排在后面的用户要等很久。
+MessageDispatcher 用固定数量的 worker 并发发送：
+1. 同一接收者的消息总是落在同一个 worker 的队列中，保证顺序
+2. 所有 worker 共享一个令牌桶，整体速率不超过 RATE 条/秒
+3. 网络异常（TRANSPORT_ERRORS）或返回 TRANSIENT_RETCODES 中的 retcode 时按指数退避重试，
+   其他 retcode 直接返回给调用方；api 返回的不是字典时记录日志并按失败（retcode -1）处理。
+   退避等待不占用 worker：该接收者的消息转入单独的重试任务，按顺序发送，worker 继续发送其他接收者的消息
+4. send_private(..., delete_missing=True) 的私聊返回 retcode == 1200（非好友/用户不存在）时调用
+   on_user_deleted，并丢弃在此之前已排队的、发给该用户的其余消息。
+   只有上新提醒这样使用（与原先的行为一致）；广播、开票提醒等只把失败结果返回给调用方，不删除用户
+
+用法::
+
+    dispatcher = MessageDispatcher(plugin, on_user_deleted=User.delete_user)
+    futures = [dispatcher.send_private(user_id, text, delete_missing=True) for text in messages]
+    results = await asyncio.gather(*futures)  # 每个结果都是 api 的返回字典
+"""
+import asyncio
+import time
+import zlib
+from collections import deque
+
+import aiohttp
+from ncatbot.utils.logger import get_log
+
+log = get_log()
+
+RATE = 8.0  # 每秒最多发送的消息数
+BURST = 16  # 令牌桶容量（允许的瞬时突发条数）
+WORKERS = 4
+MAX_RETRIES = 3
+BACKOFF = 1.0  # 首次重试等待秒数，之后每次翻倍
+USER_DELETED_RETCODE = 1200
+# 可以重试的 retcode：超时、限流和服务端暂时不可用
+TRANSIENT_RETCODES = frozenset({1408, 1429, 1500, 1502, 1503, 1504})
+# 可以重试的异常：连接断开、超时等网络错误
+TRANSPORT_ERRORS = (asyncio.TimeoutError, OSError, aiohttp.ClientError)
+
+
+class TokenBucket:
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class MessageDispatcher:
+
+    def __init__(self, bot, workers=WORKERS, rate=RATE, burst=BURST,
+                 max_retries=MAX_RETRIES, backoff=BACKOFF, on_user_deleted=None):
+        self.bot = bot
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.on_user_deleted = on_user_deleted
+        self._bucket = TokenBucket(rate, burst)
+        self._queues = []
+        self._tasks = []
+        self._deleted_at = {}  # (kind, target_id) -> 判定为已删除的时间
+        self._queued = {}  # future -> 入队时间，按入队顺序排列，用于清理 _deleted_at
+        self._retrying = {}  # (kind, target_id) -> 等待重试及排在其后的消息
+        self._retry_tasks = set()
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queues = [asyncio.Queue() for _ in range(self.workers)]
+        self._tasks = [asyncio.create_task(self._worker(q)) for q in self._queues]
+
+    async def stop(self, drain=True):
+        """停止所有 worker；drain 为 True 时先发完已排队的消息"""
+        if not self._tasks:
+            return
+        if drain:
+            await self.join()
+        tasks = [*self._tasks, *self._retry_tasks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for queue in self._queues:
+            while not queue.empty():
+                *_, future, _, _ = queue.get_nowait()
+                if not future.done():
+                    future.cancel()
+        self._tasks = []
+        self._queues = []
+        self._queued.clear()
+        self._deleted_at.clear()
+
+    async def join(self):
+        """等待当前已排队的消息（包括等待重试的消息）全部处理完"""
+        while True:
+            await asyncio.gather(*(q.join() for q in self._queues))
+            if not self._retry_tasks:
+                return
+            await asyncio.gather(*self._retry_tasks, return_exceptions=True)
+
+    def send_private(self, user_id, text, delete_missing=False):
+        """delete_missing 为 True 时，retcode == 1200 视为用户已删除，见模块说明"""
+        return self._submit("private", str(user_id), text, delete_missing)
+
+    def send_group(self, group_id, text):
+        return self._submit("group", str(group_id), text)
+
+    def _submit(self, kind, target_id, text, delete_missing=False):
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        enqueued_at = time.monotonic()
+        self._queued[future] = enqueued_at
+        # 按接收者分片，同一接收者的消息由同一个 worker 顺序发送
+        shard = zlib.crc32(f"{kind}:{target_id}".encode()) % len(self._queues)
+        self._queues[shard].put_nowait((kind, target_id, text, future, enqueued_at, delete_missing))
+        return future
+
+    def _prune_deleted(self):
+        # 早于所有排队消息的删除记录不会再命中
+        oldest = next(iter(self._queued.values()), None)
+        if oldest is None:
+            self._deleted_at.clear()
+            return
+        for key in [k for k, t in self._deleted_at.items() if t < oldest]:
+            del self._deleted_at[key]
+
+    async def _worker(self, queue):
+        while True:
+            item = await queue.get()
+            try:
+                key = (item[0], item[1])
+                if key in self._retrying:
+                    # 该接收者有消息在退避等待重试，之后的消息由同一个重试任务按顺序发送
+                    self._retrying[key].append(item)
+                elif not await self._deliver(item, 0):
+                    self._retrying[key] = deque([item])
+                    task = asyncio.create_task(self._retry(key))
+                    self._retry_tasks.add(task)
+                    task.add_done_callback(self._retry_tasks.discard)
+            finally:
+                queue.task_done()
+
+    async def _retry(self, key):
+        """按顺序发送同一接收者等待中的消息：队首的消息退避重试，发送完成（或放弃）后再发下一条"""
+        pending = self._retrying[key]
+        attempt = 1
+        try:
+            while pending:
+                if attempt:
+                    await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+                if await self._deliver(pending[0], attempt):
+                    pending.popleft()
+                    attempt = 0
+                else:
+                    attempt += 1
+        except asyncio.CancelledError:
+            for item in pending:
+                self._resolve(item[3])
+            raise
+        finally:
+            del self._retrying[key]
+
+    async def _deliver(self, item, attempt):
+        """发送一次（第 attempt 次重试）；需要退避重试时返回 False，否则设置 future 的结果并返回 True"""
+        kind, target_id, text, future, enqueued_at, delete_missing = item
+        try:
+            deleted_at = self._deleted_at.get((kind, target_id))
+            if deleted_at is not None and enqueued_at <= deleted_at:
+                # 接收者在这条消息排队后被判定为已删除，不再发送
+                result = {"retcode": USER_DELETED_RETCODE, "data": None, "message": "skipped"}
+            else:
+                result, transient = await self._send_once(kind, target_id, text, delete_missing, attempt)
+                if transient and attempt < self.max_retries:
+                    return False
+        except asyncio.CancelledError:
+            self._resolve(future)
+            raise
+        except Exception as e:
+            log.error(f"消息发送器异常 {kind}:{target_id}: {e}")
+            result = {"retcode": -1, "data": None, "message": str(e)}
+        self._resolve(future, result)
+        return True
+
+    def _resolve(self, future, result=None):
+        # result 为 None 时取消 future
+        if not future.done():
+            if result is None:
+                future.cancel()
+            else:
+                future.set_result(result)
+        self._queued.pop(future, None)
+        if self._deleted_at:
+            self._prune_deleted()
+
+    async def _send_once(self, kind, target_id, text, delete_missing, attempt):
+        """返回 (api 的返回字典, 是否可以重试)"""
+        await self._bucket.acquire()
+        try:
+            if kind == "private":
+                result = await self.bot.api.post_private_msg(target_id, text)
+            else:
+                result = await self.bot.api.post_group_msg(target_id, text)
+        except TRANSPORT_ERRORS as e:
+            log.warning(f"向{kind} {target_id} 发送消息异常（第{attempt + 1}次）: {e}")
+            return {"retcode": -1, "data": None, "message": str(e)}, True
+        if not isinstance(result, dict):
+            log.error(f"向{kind} {target_id} 发送消息返回了无法识别的结果: {result!r}")
+            return {"retcode": -1, "data": None, "message": f"unexpected result: {result!r}"}, False
+        retcode = result.get("retcode")
+        if retcode == 0:
+            return result, False
+        if retcode == USER_DELETED_RETCODE and delete_missing and kind == "private":
+            self._deleted_at[(kind, target_id)] = time.monotonic()
+            if self.on_user_deleted:
+                self.on_user_deleted(target_id)
+            return result, False
+        if retcode not in TRANSIENT_RETCODES:
+            log.warning(f"向{kind} {target_id} 发送消息失败: retcode={retcode}")
+            return result, False
+        log.warning(f"向{kind} {target_id} 发送消息失败（第{attempt + 1}次）: retcode={retcode}")
+        return result, True
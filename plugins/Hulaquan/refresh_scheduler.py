@@ -0,0 +1,205 @@
+"""
+按剧目自适应的票务刷新调度
+
+原先每 scheduled_task_time 秒刷新一次，所有剧目共用同一个间隔：即将开票的剧目反应太慢，
+长期没有变化的剧目又被反复请求。这里为每个剧目单独计算下次刷新的时间：
+
+- 即将开票 / 刚开票：某个场次的 valid_from 前 OPENING_LEAD 秒到之后 OPENING_TAIL 秒内，每 HOT_INTERVAL 秒一次；
+  待开票场次的开票时间更晚时，下次刷新不晚于进入该时间窗口的时刻
+- 最近有余票变动（回流 / 补票）：ACTIVE_INTERVAL 起，距上次变动每过 CHANGE_HALF_LIFE 秒间隔翻倍，
+  近期变动越频繁（heat 越高）间隔越短
+- 临近演出：最近一场在 PROXIMITY_STEPS 列出的时间内时，间隔不超过对应的值
+- 关注人数：单独关注该剧目或其场次的用户越多，间隔越短
+- 其余剧目每 MAX_INTERVAL 秒刷新一次，代替原先每隔 full_refresh_every 轮的全量刷新
+
+剧目列表每 list_interval 秒获取一次（默认沿用 scheduled_task_time），列表中 update_time / 票数
+有变化的剧目立即刷新。每分钟的详情请求数不超过 budget()：默认为剧目数 × 60 / list_interval，
+即与原先每 list_interval 秒全量刷新一次的请求量相同，可用 max_requests_per_minute 指定；
+超出时优先刷新逾期最久的剧目，首次刷新和失败的请求同样计入。
+
+请求失败的剧目调用 failed()，下次刷新时间按 FAILURE_BACKOFF 指数退避（不超过 MAX_INTERVAL），
+避免上游持续出错时同一个剧目每轮都被选中。
+
+调度状态只保存在内存中，重启后所有剧目在第一轮刷新一次。
+"""
+import math
+import time
+from collections import deque
+from datetime import datetime
+
+from plugins.Hulaquan.utils import standardize_datetime
+
+
+class EventRefreshScheduler:
+
+    HOT_INTERVAL = 5
+    ACTIVE_INTERVAL = 15
+    MIN_INTERVAL = 5
+    MAX_INTERVAL = 1800
+    OPENING_LEAD = 600  # 开票前多少秒开始高频刷新
+    OPENING_TAIL = 300  # 开票后继续高频刷新的时间（开票后余票变化最快）
+    CHANGE_HALF_LIFE = 600
+    FAILURE_BACKOFF = 30  # 第 n 次连续失败后 FAILURE_BACKOFF * 2 ** (n - 1) 秒再试
+    # (距离最近一场演出的秒数, 最长刷新间隔)
+    PROXIMITY_STEPS = ((86400, 300), (3 * 86400, 900))
+
+    def __init__(self, list_interval=300, max_requests_per_minute=None):
+        self.list_interval = list_interval
+        self.max_requests_per_minute = max_requests_per_minute  # None 时按剧目数计算，见 budget()
+        self.next_list_at = 0.0
+        self._state = {}  # event_id -> 调度状态，见 _new_state
+        self._requests = deque()  # 最近 60 秒内计入限制的详情请求的时间
+
+    @staticmethod
+    def _new_state():
+        return {"next": 0.0, "interval": 0.0, "reason": "首次刷新", "last_poll": None,
+                "last_change": None, "heat": 0.0, "subscribers": 0, "failures": 0}
+
+    def budget(self):
+        """每分钟最多的详情请求数"""
+        if self.max_requests_per_minute:
+            return self.max_requests_per_minute
+        return max(1, math.ceil(len(self._state) * 60 / max(1, self.list_interval)))
+
+    # ---------------- 剧目列表 ---------------- #
+
+    def list_due(self, now=None):
+        return (now or time.time()) >= self.next_list_at
+
+    def on_list_refreshed(self, events, changed_event_ids=(), now=None):
+        """获取剧目列表后调用：加入新剧目、移除下架剧目，列表显示有变化的剧目立即刷新"""
+        now = now or time.time()
+        self.next_list_at = now + self.list_interval
+        for eid in set(self._state) - set(events):
+            del self._state[eid]
+        for eid in events:
+            self._state.setdefault(eid, self._new_state())
+        for eid in changed_event_ids:
+            state = self._state.get(eid)
+            if state is not None and state["last_poll"] is not None:
+                state["next"] = min(state["next"], now)
+                state["reason"] = "列表有变化"
+
+    # ---------------- 选择本轮刷新的剧目 ---------------- #
+
+    def due(self, now=None):
+        """返回本轮需要刷新详情的剧目，按逾期时间从长到短排列，受每分钟请求数限制"""
+        now = now or time.time()
+        while self._requests and self._requests[0] <= now - 60:
+            self._requests.popleft()
+        budget = max(0, self.budget() - len(self._requests))
+        result = []
+        for eid, state in sorted(self._state.items(), key=lambda x: x[1]["next"]):
+            if state["next"] > now or len(result) >= budget:
+                break
+            self._requests.append(now)
+            result.append(eid)
+        return result
+
+    def seconds_until_due(self, now=None):
+        """距离下一个剧目到期（请求数已达上限时为最早一次请求移出统计窗口）或下一次获取剧目列表的秒数"""
+        now = now or time.time()
+        next_at = min([self.next_list_at, *(s["next"] for s in self._state.values())])
+        if self._requests and len(self._requests) >= self.budget():
+            next_at = max(next_at, min(self.next_list_at, self._requests[0] + 60))
+        return max(0.0, next_at - now)
+
+    # ---------------- 刷新后更新间隔 ---------------- #
+
+    def observe(self, event_id, changed, tickets, subscribers=0, now=None):
+        """
+        剧目详情刷新后调用，更新变动频率并计算下次刷新时间
+
+        Args:
+            changed: 本次刷新是否有场次的余票 / 状态发生变化（新上架的场次也算）
+            tickets: 刷新后的 ticket_details
+            subscribers: 单独关注该剧目或其场次的用户数
+        """
+        now = now or time.time()
+        state = self._state.setdefault(str(event_id), self._new_state())
+        if state["last_poll"] is not None:
+            state["heat"] *= 0.5 ** ((now - state["last_poll"]) / self.CHANGE_HALF_LIFE)
+            if changed:
+                state["heat"] += 1
+                state["last_change"] = now
+        state["last_poll"] = now
+        state["failures"] = 0
+        state["subscribers"] = subscribers
+        interval, reason, wake_at = self.interval_for(state, tickets, now)
+        state["interval"] = interval
+        state["reason"] = reason
+        state["next"] = min(now + interval, wake_at) if wake_at else now + interval
+
+    def failed(self, event_id, now=None):
+        """剧目详情请求失败后调用，按连续失败次数指数退避"""
+        now = now or time.time()
+        state = self._state.get(str(event_id))
+        if state is None:
+            return
+        state["failures"] += 1
+        state["interval"] = min(self.MAX_INTERVAL, self.FAILURE_BACKOFF * 2 ** (state["failures"] - 1))
+        state["reason"] = f"请求失败 {state['failures']} 次"
+        state["next"] = now + state["interval"]
+
+    def interval_for(self, state, tickets, now):
+        """
+        Returns:
+            (interval, reason, wake_at): 刷新间隔（秒）、原因，以及必须刷新的时刻（开票窗口开始，没有时为 None）
+        """
+        interval, reason = self.MAX_INTERVAL, "无变化"
+        wake_at = None
+        nearest_show = None
+        for ticket in (tickets or {}).values():
+            # 开票后场次变为 active，valid_from 仍保留，因此开票后的时间窗口对所有场次都检查
+            opening = self._timestamp(ticket.get("valid_from"))
+            if opening is not None:
+                if opening - self.OPENING_LEAD <= now <= opening + self.OPENING_TAIL:
+                    return self.HOT_INTERVAL, "即将开票", None
+                if opening > now and ticket.get("status") == "pending":
+                    start = opening - self.OPENING_LEAD
+                    wake_at = start if wake_at is None else min(wake_at, start)
+            start = self._timestamp(ticket.get("start_time"))
+            if start is not None and start > now and (nearest_show is None or start < nearest_show):
+                nearest_show = start
+        if state["last_change"] is not None:
+            since = now - state["last_change"]
+            active = self.ACTIVE_INTERVAL * 2 ** (since / self.CHANGE_HALF_LIFE) / max(1.0, state["heat"])
+            if active < interval:
+                interval, reason = active, "近期有余票变动"
+        if nearest_show is not None:
+            for within, limit in self.PROXIMITY_STEPS:
+                if nearest_show - now <= within:
+                    if limit < interval:
+                        interval, reason = limit, "临近演出"
+                    break
+        if state["subscribers"]:
+            interval /= 1 + math.log2(1 + state["subscribers"]) / 2
+        return max(self.MIN_INTERVAL, min(self.MAX_INTERVAL, interval)), reason, wake_at
+
+    @staticmethod
+    def _timestamp(value):
+        if not value or value in ("NG", "null", "未知"):
+            return None
+        try:
+            return standardize_datetime(str(value), return_str=False).timestamp()
+        except Exception:
+            return None
+
+    # ---------------- 状态查看 ---------------- #
+
+    def status(self, limit=10, title_of=None, now=None):
+        """刷新最频繁的 limit 个剧目的状态文本，title_of(event_id) 用于显示剧名"""
+        now = now or time.time()
+        polled = [(eid, s) for eid, s in self._state.items() if s["last_poll"] is not None]
+        lines = [
+            f"自适应刷新：{len(self._state)} 个剧目，{len(polled)} 个已刷新，"
+            f"最近一分钟详情请求 {len(self._requests)}/{self.budget()}，"
+            f"剧目列表每 {self.list_interval} 秒获取一次"
+        ]
+        for eid, s in sorted(polled, key=lambda x: x[1]["interval"])[:limit]:
+            title = title_of(eid) if title_of else eid
+            next_in = max(0, s["next"] - now)
+            last = datetime.fromtimestamp(s["last_change"]).strftime("%H:%M:%S") if s["last_change"] else "无"
+            lines.append(f"{title}：每 {s['interval']:.0f}s（{s['reason']}），{next_in:.0f}s 后刷新，"
+                         f"上次变动 {last}，关注 {s['subscribers']} 人")
+        return "\n".join(lines)
@@ -0,0 +1,35 @@
+"""
+测试演员 → 场次倒排索引
+"""
+from plugins.Hulaquan.actor_index import ActorIndex
+
+
+def cast(*artists):
+    return [{"role": "", "artist": a} for a in artists]
+
+
+def test_update_and_lookup_normalizes_names():
+    index = ActorIndex()
+    index.update("1", cast(" 张三 ", "Li Si"))
+    index.update(2, cast("张三"))
+    assert index.tickets_of("张三") == {"1", "2"}
+    assert index.tickets_of("li si") == {"1"}
+    assert index.actors_of("1") == {"张三", "li si"}
+
+
+def test_recast_moves_ticket_between_actors():
+    index = ActorIndex()
+    index.update("1", cast("张三"))
+    index.update("1", cast("李四"))
+    assert index.tickets_of("张三") == set()
+    assert index.tickets_of("李四") == {"1"}
+
+
+def test_unknown_cast_is_unresolved():
+    index = ActorIndex()
+    index.update("1", cast("张三"))
+    for unknown in (None, [], cast("")):
+        index.update("2", unknown)
+        assert index.unresolved(["1", "2"]) == {"2"}
+    index.discard("1")
+    assert not index.is_resolved("1") and index.tickets_of("张三") == set()
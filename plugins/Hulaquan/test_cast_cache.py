@@ -0,0 +1,93 @@
+"""
+测试卡司缓存与演员索引
+"""
+from plugins.Hulaquan.actor_index import ActorIndex
+from plugins.Hulaquan.cast_cache import CastCache
+
+START = "2099-01-01 19:30"
+CAST = [{"role": "主角", "artist": "张三"}]
+
+
+def make_cache():
+    index = ActorIndex()
+    cache = CastCache({}, ttl=3600, miss_ttl=1800)
+    cache.on_update = index.update
+    return cache, index
+
+
+def test_miss_is_not_resolved():
+    """没查到卡司的场次不写入演员索引，仍视为未解析"""
+    cache, index = make_cache()
+    cache.put("1", START, None, now=0)
+    assert index.unresolved(["1"]) == {"1"}
+    assert cache.get("1", START, now=10) == {"cast": [], "city": None}
+
+
+def test_expired_miss_then_cast_found():
+    """负缓存过期后重新查询，查到的卡司写入演员索引"""
+    cache, index = make_cache()
+    cache.put("1", START, None, now=0)
+    assert cache.get("1", START, now=1801) is None
+    cache.put("1", START, CAST, city="上海", now=1801)
+    assert index.tickets_of("张三") == {"1"}
+    assert index.unresolved(["1"]) == set()
+
+
+def test_empty_cast_is_not_resolved():
+    cache, index = make_cache()
+    cache.put("1", START, [], now=0)
+    assert index.unresolved(["1"]) == {"1"}
+
+
+def test_invalidate_removes_from_index():
+    cache, index = make_cache()
+    cache.put("1", START, CAST, now=0)
+    cache.invalidate("1")
+    assert index.tickets_of("张三") == set()
+    assert cache.get("1", START, now=0) is None
+
+
+def test_changed_start_time_invalidates():
+    cache, _ = make_cache()
+    cache.put("1", START, CAST, now=0)
+    assert cache.get("1", "2099-01-02 19:30", now=0) is None
+
+
+def test_city_filter():
+    cache, _ = make_cache()
+    cache.put("1", START, CAST, city="上海", now=0)
+    assert cache.get("1", START, city="上海", now=0)["cast"] == CAST
+    assert cache.get("1", START, city="北京", now=0) is None
+
+
+def test_miss_keeps_existing_cast():
+    """查不到卡司时不覆盖同一开演时间已查到（包括已过期）的卡司"""
+    cache, index = make_cache()
+    cache.put("1", START, CAST, city="上海", now=0)
+    cache.put("1", START, None, query_city="北京", now=10)
+    assert cache.get("1", START, now=10)["cast"] == CAST
+    assert cache.get("1", START, now=3601) is None
+    cache.put("1", START, None, now=3601)
+    assert cache.get("1", START, now=3602)["cast"] == CAST
+    assert index.tickets_of("张三") == {"1"}
+
+
+def test_failed_request_is_not_cached(monkeypatch):
+    """扫剧请求失败时不写入负缓存，已有的缓存保持不变"""
+    import asyncio
+    from plugins.Hulaquan import HulaquanDataManager as module
+    from plugins.Hulaquan.data_managers import Hlq
+
+    async def fail(*args, **kwargs):
+        raise module.RequestTimeoutException()
+
+    cache, _ = make_cache()
+    cache.put("2", START, CAST, now=0)
+    monkeypatch.setattr(Hlq, "cast_cache", cache)
+    monkeypatch.setattr(Hlq, "get_ordered_search_names", lambda *args: ["剧名"])
+    monkeypatch.setattr(module.Saoju, "search_for_musical_by_date_async", fail)
+    for tid in ("1", "2"):
+        ticket = {"id": tid, "event_id": "e", "start_time": START}
+        assert asyncio.run(Hlq.get_ticket_cast_and_city_async("剧名", ticket)) == {"cast": [], "city": None}
+    assert "1" not in cache.data
+    assert cache.data["2"]["cast"] == CAST and cache.data["2"]["t"] == 0
@@ -0,0 +1,80 @@
+"""
+测试票务变动日志
+"""
+import os
+from datetime import datetime, timedelta
+
+from plugins.Hulaquan.change_journal import ChangeJournal
+
+NOW = datetime(2025, 8, 4, 12, 0, 0)
+
+
+def make_events(**tickets):
+    """make_events(e1={"t1": 3}) -> {"e1": {"ticket_details": {"t1": {"left_ticket_count": 3}}}}"""
+    return {
+        eid: {"ticket_details": {tid: {"left_ticket_count": n} for tid, n in ts.items()}}
+        for eid, ts in tickets.items()
+    }
+
+
+def test_first_record_is_checkpoint(tmp_path):
+    journal = ChangeJournal(str(tmp_path))
+    records = journal.diff(make_events(e1={"t1": 3}), ["e1"], now=NOW)
+    assert [r["type"] for r in records] == ["checkpoint"]
+    assert records[0]["events"] == {"e1": {"t1": {"left_ticket_count": 3}}}
+
+
+def test_delta_only_compares_given_events(tmp_path):
+    journal = ChangeJournal(str(tmp_path))
+    journal.diff(make_events(e1={"t1": 3}, e2={"t2": 1}), now=NOW)
+    events = make_events(e1={"t1": 2}, e2={"t2": 0})
+    records = journal.diff(events, ["e1"], now=NOW + timedelta(seconds=5))
+    assert records[0]["set"] == {"e1": {"t1": {"left_ticket_count": 2}}}
+    # 没有变化时不产生记录
+    assert journal.diff(events, ["e1"], now=NOW + timedelta(seconds=10)) == []
+
+
+def test_removed_tickets_and_events(tmp_path):
+    journal = ChangeJournal(str(tmp_path))
+    journal.diff(make_events(e1={"t1": 3, "t2": 1}, e2={"t3": 1}), now=NOW)
+    # 下架的剧目不需要在 event_ids 中；e1 未刷新，其中的场次不比较
+    records = journal.diff(make_events(e1={"t1": 3}), [], now=NOW + timedelta(seconds=5))
+    assert records[0]["set"] == {} and "del" not in records[0]
+    assert records[0]["del_events"] == ["e2"]
+    records = journal.diff(make_events(e1={"t1": 3}), ["e1"], now=NOW + timedelta(seconds=10))
+    assert records[0]["del"] == {"e1": ["t2"]} and "del_events" not in records[0]
+
+
+def test_write_and_reconstruct(tmp_path):
+    journal = ChangeJournal(str(tmp_path))
+    journal.record(make_events(e1={"t1": 3}), now=NOW)
+    journal.record(make_events(e1={"t1": 1}), now=NOW + timedelta(minutes=1), event_ids=["e1"])
+    before = journal.reconstruct(NOW + timedelta(seconds=30))
+    after = journal.reconstruct(NOW + timedelta(minutes=2))
+    assert before["events"]["e1"]["ticket_details"]["t1"]["left_ticket_count"] == 3
+    assert after["events"]["e1"]["ticket_details"]["t1"]["left_ticket_count"] == 1
+    assert journal.reconstruct(NOW - timedelta(minutes=1)) is None
+
+
+def test_error_record_keeps_traceback(tmp_path):
+    journal = ChangeJournal(str(tmp_path))
+    try:
+        raise ValueError("bad response")
+    except ValueError as e:
+        journal.record_error(e, now=NOW)
+    record = journal.read("2025-08-04")[0]
+    assert record["error"] == "ValueError: bad response"
+    assert "Traceback" in record["traceback"] and "test_error_record_keeps_traceback" in record["traceback"]
+
+
+def test_prune_removes_old_files_and_legacy_dirs(tmp_path):
+    root, legacy = tmp_path / "update_data_cache", tmp_path / "error_announcement_cache"
+    journal = ChangeJournal(str(root), retention_hours=48, legacy_roots=[str(legacy)])
+    journal.record(make_events(e1={"t1": 3}), now=NOW - timedelta(days=3))
+    for name in ("2025-08-01_10-00-00", "2025-08-04_10-00-00", "notes"):
+        (legacy / name).mkdir(parents=True)
+    (root / "2025-07-30_09-00-00").mkdir()
+    journal.record(make_events(e1={"t1": 3}), now=NOW)  # 新的一天写入 checkpoint 时清理
+    assert journal.days() == ["2025-08-04"]
+    assert sorted(os.listdir(legacy)) == ["2025-08-04_10-00-00", "notes"]
+    assert not (root / "2025-07-30_09-00-00").exists()
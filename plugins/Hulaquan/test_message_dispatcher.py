@@ -0,0 +1,99 @@
+"""
+测试并发限速的消息发送器
+"""
+import asyncio
+
+from plugins.Hulaquan.message_dispatcher import MessageDispatcher
+
+
+class FakeApi:
+
+    def __init__(self, replies=None):
+        # replies: {target_id: [retcode、异常或原样返回的字符串, ...]}，用完后返回 0
+        self.replies = replies or {}
+        self.sent = []
+
+    async def _post(self, target_id, text):
+        self.sent.append((target_id, text))
+        queue = self.replies.get(target_id)
+        reply = queue.pop(0) if queue else 0
+        if isinstance(reply, Exception):
+            raise reply
+        if isinstance(reply, str):
+            return reply
+        return {"retcode": reply, "data": None}
+
+    post_private_msg = post_group_msg = _post
+
+
+class FakeBot:
+
+    def __init__(self, api):
+        self.api = api
+
+
+def run(replies, send, workers=2, backoff=0):
+    async def main():
+        api = FakeApi(replies)
+        deleted = []
+        dispatcher = MessageDispatcher(FakeBot(api), workers=workers, rate=1000, burst=1000, backoff=backoff,
+                                       on_user_deleted=deleted.append)
+        results = await send(dispatcher)
+        await dispatcher.stop()
+        return api, deleted, results, dispatcher
+    return asyncio.run(main())
+
+
+def test_transport_error_and_transient_retcode_are_retried():
+    api, _, results, _ = run(
+        {"1": [ConnectionResetError("reset"), 1503]},
+        lambda d: d.send_private("1", "hi"),
+    )
+    assert results["retcode"] == 0
+    assert len(api.sent) == 3
+
+
+def test_other_retcode_is_not_retried():
+    api, _, results, _ = run({"1": [1400]}, lambda d: d.send_group("1", "hi"))
+    assert results["retcode"] == 1400
+    assert len(api.sent) == 1
+
+
+def test_missing_user_is_deleted_only_when_requested():
+    async def send(d):
+        results = await asyncio.gather(d.send_private("1", "a"), d.send_private("2", "b", delete_missing=True),
+                                       d.send_private("2", "c", delete_missing=True))
+        await d.join()
+        pending.update(d._deleted_at)
+        return results
+    pending = {}
+    api, deleted, results, _ = run({"1": [1200], "2": [1200]}, send)
+    assert deleted == ["2"]
+    assert [r["retcode"] for r in results] == [1200, 1200, 1200]
+    assert results[2]["message"] == "skipped"
+    assert ("2", "c") not in api.sent
+    # 所有排队的消息处理完后删除记录被清理
+    assert pending == {}
+
+
+def test_unexpected_result_is_a_failure():
+    api, _, results, _ = run({"1": ["ok"]}, lambda d: d.send_private("1", "hi"))
+    assert results["retcode"] == -1
+    assert len(api.sent) == 1
+
+
+def test_backoff_does_not_block_other_recipients():
+    async def send(d):
+        first = d.send_private("1", "a")
+        second = d.send_private("1", "b")
+        other = d.send_private("2", "c")
+        await other
+        # 单个 worker：接收者 1 退避期间，接收者 2 的消息已经发出
+        sent_before_retry = list(d.bot.api.sent)
+        return await asyncio.gather(first, second), sent_before_retry
+
+    api, _, (results, sent_before_retry), _ = run({"1": [1503]}, send, workers=1, backoff=0.05)
+    assert sent_before_retry == [("1", "a"), ("2", "c")]
+    # 同一接收者的消息仍然按顺序发送
+    assert api.sent == [("1", "a"), ("2", "c"), ("1", "a"), ("1", "b")]
+    assert [r["retcode"] for r in results] == [0, 0]
@@ -0,0 +1,91 @@
+"""
+测试自适应刷新的间隔与请求数限制
+"""
+from datetime import datetime
+
+from plugins.Hulaquan.refresh_scheduler import EventRefreshScheduler
+
+NOW = datetime(2025, 8, 4, 12, 0, 0).timestamp()
+
+
+def at(seconds):
+    return datetime.fromtimestamp(NOW + seconds).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def ticket(start_in=30 * 86400, valid_from_in=None, status="active"):
+    return {"start_time": at(start_in), "valid_from": at(valid_from_in) if valid_from_in is not None else None,
+            "status": status}
+
+
+def interval(tickets, **state):
+    s = EventRefreshScheduler._new_state()
+    s.update(state)
+    return EventRefreshScheduler().interval_for(s, tickets, NOW)
+
+
+def test_quiet_event_uses_max_interval():
+    assert interval({"1": ticket()})[:2] == (EventRefreshScheduler.MAX_INTERVAL, "无变化")
+
+
+def test_opening_window_is_hot():
+    assert interval({"1": ticket(valid_from_in=60, status="pending")})[:2] == (5, "即将开票")
+    assert interval({"1": ticket(valid_from_in=-120)})[:2] == (5, "即将开票")
+
+
+def test_pending_opening_sets_wake_time():
+    _, _, wake_at = interval({"1": ticket(valid_from_in=3600, status="pending")})
+    assert wake_at == NOW + 3600 - EventRefreshScheduler.OPENING_LEAD
+
+
+def test_proximity_steps():
+    assert interval({"1": ticket(start_in=3600)})[:2] == (300, "临近演出")
+    assert interval({"1": ticket(start_in=2 * 86400)})[:2] == (900, "临近演出")
+    assert interval({"1": ticket(start_in=5 * 86400)})[1] == "无变化"
+
+
+def test_recent_change_and_subscribers_shorten_interval():
+    recent, reason, _ = interval({"1": ticket()}, last_change=NOW - 60, heat=1.0)
+    assert reason == "近期有余票变动" and 15 <= recent < 30
+    watched, _, _ = interval({"1": ticket()}, last_change=NOW - 60, heat=1.0, subscribers=3)
+    assert watched < recent
+
+
+def test_budget_derived_from_event_count():
+    scheduler = EventRefreshScheduler(list_interval=300)
+    scheduler.on_list_refreshed({str(i): {} for i in range(100)}, now=NOW)
+    assert scheduler.budget() == 20
+    # 首次刷新同样计入限制
+    assert len(scheduler.due(now=NOW)) == 20
+    assert scheduler.due(now=NOW + 30) == []
+    assert scheduler.seconds_until_due(now=NOW + 30) == 30
+    assert len(scheduler.due(now=NOW + 60)) == 20
+    scheduler.max_requests_per_minute = 50
+    assert len(scheduler.due(now=NOW + 120)) == 50
+
+
+def test_failures_back_off_and_count_against_budget():
+    scheduler = EventRefreshScheduler(list_interval=60)
+    scheduler.on_list_refreshed({"1": {}, "2": {}}, now=NOW)
+    assert scheduler.due(now=NOW) == ["1", "2"]
+    scheduler.failed("1", now=NOW)
+    scheduler.observe("2", False, {"x": ticket()}, now=NOW)
+    assert scheduler.due(now=NOW + 10) == []
+    assert scheduler.due(now=NOW + 60) == ["1"]
+    scheduler.failed("1", now=NOW + 60)
+    assert scheduler._state["1"]["next"] == NOW + 60 + 2 * EventRefreshScheduler.FAILURE_BACKOFF
+    # 成功后清零
+    scheduler.observe("1", False, {"x": ticket()}, now=NOW + 200)
+    assert scheduler._state["1"]["failures"] == 0
+
+
+def test_adaptive_compare_skips_when_nothing_due(monkeypatch):
+    """没有到期的剧目和剧目列表时不生成快照、不提交票务状态"""
+    import asyncio
+    from plugins.Hulaquan.data_managers import Hlq
+
+    scheduler = EventRefreshScheduler()
+    scheduler.next_list_at = float("inf")
+    monkeypatch.setattr(Hlq, "scheduler", scheduler)
+    version = Hlq.ticket_states.version
+    assert asyncio.run(Hlq.compare_to_database_async(adaptive=True)) is None
+    assert Hlq.ticket_states.version == version
@@ -0,0 +1,32 @@
+"""
+测试票务状态版本库的按剧目提交
+"""
+from plugins.Hulaquan.ticket_state import TicketStateStore
+
+
+def event(**tickets):
+    return {"ticket_details": {tid: {"id": tid, "left_ticket_count": left} for tid, left in tickets.items()}}
+
+
+def left(store, eid, tid):
+    return store.ticket(tid, eid)["left_ticket_count"]
+
+
+def test_partial_commit_only_rebuilds_refreshed_events():
+    store = TicketStateStore()
+    store.commit({"a": event(t1=1), "b": event(t2=2)})
+    old = store.snapshot()
+    events = {"a": event(t1=0), "b": event(t2=0)}
+    store.commit(events, event_ids=["a"])
+    assert left(store, "a", "t1") == 0
+    assert left(store, "b", "t2") == 2  # 没有刷新的剧目沿用上一版本
+    # 之前取出的快照不受影响
+    assert old["events"]["a"]["ticket_details"]["t1"]["left_ticket_count"] == 1
+
+
+def test_partial_commit_adds_new_and_drops_removed_events():
+    store = TicketStateStore()
+    store.commit({"a": event(t1=1), "b": event(t2=2)})
+    store.commit({"a": event(t1=1), "c": {}}, event_ids=[])
+    assert set(store.snapshot()["events"]) == {"a", "c"}
+    assert store.event("c") == {}
@@ -0,0 +1,72 @@
+"""
+测试剧名检索索引与模糊匹配的阈值
+"""
+import pytest
+
+from plugins.Hulaquan import title_index
+from plugins.Hulaquan.title_index import FUZZY_MARGIN, FUZZY_THRESHOLD, TitleIndex
+
+EVENTS = {
+    "1": {"title": "《海雾》上海站"},
+    "2": {"title": "《海雾》北京站"},
+    "3": {"title": "《近在咫尺》"},
+    "4": {"title": "《基督山伯爵》"},
+    "5": {"title": "《(C)C 剧场》"},
+}
+
+
+@pytest.fixture
+def index():
+    index = TitleIndex()
+    index.sync(EVENTS)
+    return index
+
+
+def test_substring_and_exact(index):
+    assert [eid for eid, _ in index.search("海雾")] == ["1", "2"]
+    assert [eid for eid, _ in index.search("近在咫尺")] == ["3"]
+    # 查询中的特殊字符不当作正则
+    assert [eid for eid, _ in index.search("(c)")] == ["5"]
+
+
+def test_prefix_narrows_substring_matches():
+    index = TitleIndex()
+    index.sync({"1": {"title": "《爱上基督》"}, "2": {"title": "《基督山伯爵》"}, "3": {"title": "基督山 音乐会"}})
+    assert index.prefix("基督山") == ["2", "3"]
+    # 有以查询开头的剧名时只返回这些剧目，否则按子串匹配
+    assert [eid for eid, _ in index.search("基督")] == ["2", "3"]
+    assert [eid for eid, _ in index.search("上基督")] == ["1"]
+    assert [eid for eid, _ in index.search("基督山伯爵")] == ["2"]
+
+
+def test_sync_handles_rename_and_removal(index):
+    index.sync({"1": {"title": "《海雾》杭州站"}, "3": {"title": "《近在咫尺》"}})
+    assert [eid for eid, _ in index.search("杭州")] == ["1"]
+    assert index.search("北京") == [] and len(index) == 2
+
+
+def test_typo_above_threshold_is_accepted(index):
+    eid, title, score = index.best_match("基督山伯节")
+    assert eid == "4" and score >= FUZZY_THRESHOLD
+
+
+def test_low_score_is_rejected(index):
+    assert all(score < FUZZY_THRESHOLD for *_, score in index.fuzzy("歌剧魅影"))
+    assert index.best_match("歌剧魅影") is None
+
+
+def test_ambiguous_candidates_are_rejected(index):
+    ranked = index.fuzzy("海雾上京站")
+    assert ranked[0][2] - ranked[1][2] < FUZZY_MARGIN
+    assert index.best_match("海雾上京站") is None
+
+
+def test_pinyin_initials(index):
+    pytest.importorskip("pypinyin")
+    assert index.best_match("jzzc")[0] == "3"
+
+
+def test_traditional_chinese(index):
+    if title_index._t2s is None:
+        pytest.skip("opencc 未安装")
+    assert index.best_match("海霧上海站")[0] == "1"
@@ -0,0 +1,68 @@
+"""
+票务状态版本库
+
+compare_to_database_async 每轮只需要比较场次的余票/总票数等少量字段，
+这里按剧目保存上一轮提交时每个场次的精简状态，代替对整个数据集做 deepcopy。
+每次 commit 都生成新的字典并递增版本号，之前取出的快照不会被修改。
+"""
+
+
+class TicketStateStore:
+
+    FIELDS = ("id", "total_ticket", "left_ticket_count", "status", "valid_from")
+
+    def __init__(self):
+        self.version = 0
+        self.update_time = None
+        self._events = {}  # event_id -> {"ticket_details": {ticket_id: state}}
+
+    def commit(self, events, update_time=None, event_ids=None):
+        """
+        根据当前的 events 数据生成新版本的票务状态
+
+        Args:
+            events: HulaquanDataManager.data["events"]
+            update_time: 本次数据的更新时间
+            event_ids: 本轮刷新过的剧目，只重新生成这些剧目（以及新上架剧目）的状态，
+                       其余剧目沿用上一版本，已下架的剧目移除；为 None 时全部重新生成
+        Returns:
+            int: 新的版本号
+        """
+        if event_ids is None:
+            states = {}
+            event_ids = events
+        else:
+            states = {eid: state for eid, state in self._events.items() if eid in events}
+            event_ids = {*event_ids, *(eid for eid in events if eid not in states)}
+        for eid in event_ids:
+            event = events.get(eid)
+            if event is not None:
+                states[eid] = self._event_state(event)
+        self._events = states
+        self.update_time = update_time
+        self.version += 1
+        return self.version
+
+    def _event_state(self, event):
+        tickets = event.get("ticket_details")
+        if tickets is None:
+            # 与原数据保持一致：剧目存在但没有票务详情
+            return {}
+        fields = self.FIELDS
+        return {"ticket_details": {
+            tid: {key: ticket.get(key) for key in fields} for tid, ticket in tickets.items()
+        }}
+
+    def snapshot(self):
+        """
+        返回当前版本的只读快照，结构与 HulaquanDataManager.data 中比较所需的部分一致::
+
+            {"version": int, "update_time": str, "events": {event_id: {"ticket_details": {ticket_id: state}}}}
+        """
+        return {"version": self.version, "update_time": self.update_time, "events": self._events}
+
+    def event(self, event_id, default=None):
+        return self._events.get(str(event_id), default)
+
+    def ticket(self, ticket_id, event_id):
+        return self._events.get(str(event_id), {}).get("ticket_details", {}).get(str(ticket_id))
@@ -0,0 +1,233 @@
+"""
+剧名检索索引
+
+search_eventID_by_name_async 原先对每个剧目执行 re.search(用户输入, 剧名)，
+输入中的特殊字符（如括号、问号）会被当作正则。这里为剧名建立索引：
+
+- 规范化剧名（忽略大小写和空白）以及去掉书名号后的剧名
+- 单字和二元字串（bigram）的倒排表，子串查询先取候选再逐个确认
+
+查询依次按完全相同、前缀和子串匹配（按剧目顺序），返回第一个有结果的层级：
+有剧名与查询完全相同时只返回这些剧目，否则有剧名（或书名号中的剧名）以查询开头时只返回这些剧目，
+都没有时与原先的子串匹配一致。
+
+子串查不到时可以用 best_match 做模糊匹配：按二元字串相似度和编辑距离给候选剧目打分，
+安装了 opencc 时繁体输入按简体匹配，安装了 pypinyin 时支持拼音首字母（如 "hw" -> 《海雾》）。
+"""
+import heapq
+import re
+from collections import Counter
+
+from plugins.Hulaquan.utils import normalize_title
+
+try:
+    from opencc import OpenCC
+    _t2s = OpenCC("t2s").convert
+except ImportError:
+    _t2s = None
+
+try:
+    from pypinyin import lazy_pinyin, Style
+except ImportError:
+    lazy_pinyin = None
+
+FUZZY_THRESHOLD = 0.6  # 最佳候选的最低得分
+FUZZY_MARGIN = 0.1  # 最佳候选需要领先第二名的分数
+FUZZY_CANDIDATES = 10  # 按二元字串相似度预选后，再计算编辑距离的候选数
+_INITIALS_RE = re.compile(r"[a-z]+")
+
+_BRACKETS = re.compile(r"《(.*?)》")
+
+
+def bare_title(text):
+    """书名号中的剧名，没有书名号时返回原文"""
+    match = _BRACKETS.search(text)
+    return match.group(1) if match else text
+
+
+def fuzzy_key(text):
+    """模糊匹配使用的形式：去书名号、规范化，并转为简体"""
+    key = normalize_title(bare_title(text))
+    return _t2s(key) if _t2s else key
+
+
+def pinyin_initials(text):
+    if lazy_pinyin is None:
+        return ""
+    return "".join(lazy_pinyin(text, style=Style.FIRST_LETTER, errors="default")).casefold()
+
+
+def edit_distance(a, b):
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def _grams(text):
+    if len(text) < 2:
+        return set(text)
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class TitleIndex:
+
+    def __init__(self):
+        self._titles = {}  # event_id -> 原始剧名
+        self._norm = {}  # event_id -> 规范化剧名
+        self._exact = {}  # 规范化剧名 / 去书名号剧名 -> {event_id}
+        self._chars = {}  # 单字 -> {event_id}
+        self._bigrams = {}  # 二元字串 -> {event_id}
+        self._order = {}  # event_id -> 在剧目列表中的位置
+        self._fuzzy = {}  # event_id -> fuzzy_key
+        self._fuzzy_grams = {}  # fuzzy_key 的二元字串 -> {event_id}
+        self._fuzzy_chars = {}  # fuzzy_key 的单字 -> {event_id}
+        self._initials = {}  # event_id -> 拼音首字母
+
+    def __len__(self):
+        return len(self._titles)
+
+    def sync(self, events):
+        """
+        按 events（{event_id: {"title": ...}}）增量更新索引：只处理新增、删除和改名的剧目
+        """
+        titles = {str(eid): event.get("title") or "" for eid, event in events.items()}
+        for eid in [eid for eid in self._titles if eid not in titles]:
+            self._remove(eid)
+        for eid, title in titles.items():
+            if self._titles.get(eid) != title:
+                self._remove(eid)
+                self._add(eid, title)
+        self._order = {eid: i for i, eid in enumerate(titles)}
+
+    def _keys(self, title):
+        norm = normalize_title(title)
+        return norm, {norm, normalize_title(bare_title(title))}
+
+    def _add(self, eid, title):
+        norm, exact_keys = self._keys(title)
+        self._titles[eid] = title
+        self._norm[eid] = norm
+        for key in exact_keys:
+            self._exact.setdefault(key, set()).add(eid)
+        for ch in set(norm):
+            self._chars.setdefault(ch, set()).add(eid)
+        for gram in _grams(norm):
+            self._bigrams.setdefault(gram, set()).add(eid)
+        key = self._fuzzy[eid] = fuzzy_key(title)
+        for gram in _grams(key):
+            self._fuzzy_grams.setdefault(gram, set()).add(eid)
+        for ch in set(key):
+            self._fuzzy_chars.setdefault(ch, set()).add(eid)
+        self._initials[eid] = pinyin_initials(key)
+
+    def _remove(self, eid):
+        title = self._titles.pop(eid, None)
+        if title is None:
+            return
+        norm, exact_keys = self._keys(title)
+        self._norm.pop(eid, None)
+        self._initials.pop(eid, None)
+        key = self._fuzzy.pop(eid, "")
+        for table, keys in ((self._exact, exact_keys), (self._chars, set(norm)), (self._bigrams, _grams(norm)),
+                            (self._fuzzy_grams, _grams(key)), (self._fuzzy_chars, set(key))):
+            for k in keys:
+                ids = table.get(k)
+                if ids is not None:
+                    ids.discard(eid)
+                    if not ids:
+                        del table[k]
+
+    def _sorted(self, eids):
+        return sorted(eids, key=lambda eid: self._order.get(eid, 0))
+
+    def exact(self, query):
+        return self._sorted(self._exact.get(normalize_title(query), ()))
+
+    def prefix(self, query):
+        return self._starting_with(self.substring(query), query)
+
+    def _starting_with(self, eids, query):
+        # 以查询开头的剧名都包含查询，只需在子串匹配的结果中筛选
+        q = normalize_title(query)
+        return [eid for eid in eids if self._norm[eid].startswith(q) or
+                normalize_title(bare_title(self._titles[eid])).startswith(q)]
+
+    def substring(self, query):
+        q = normalize_title(query)
+        if not q:
+            return self._sorted(self._titles)
+        postings = [self._chars.get(q)] if len(q) == 1 else [self._bigrams.get(g) for g in _grams(q)]
+        if any(p is None for p in postings):
+            return []
+        candidates = set.intersection(*postings)
+        return self._sorted(eid for eid in candidates if q in self._norm[eid])
+
+    def search(self, query):
+        """
+        Returns:
+            list[[event_id, title]]: 有完全相同的剧名时只返回这些剧目，其次是以查询开头的剧目，
+                                     否则返回所有包含查询的剧目
+        """
+        eids = self.exact(query)
+        if not eids:
+            matches = self.substring(query)
+            eids = self._starting_with(matches, query) or matches
+        return [[eid, self._titles[eid]] for eid in eids]
+
+    def fuzzy(self, query, limit=5):
+        """
+        模糊匹配
+
+        Returns:
+            list[(event_id, title, score)]: 按得分从高到低排列，score 在 0~1 之间
+        """
+        q = fuzzy_key(query)
+        if not q:
+            return []
+        q_grams = _grams(q)
+        # 按共有的二元字串（查询只有一个字或没有共有二元字串时按单字）预选候选
+        shared = Counter()
+        for gram in q_grams if len(q) > 1 else ():
+            shared.update(self._fuzzy_grams.get(gram, ()))
+        if not shared:
+            for ch in set(q):
+                shared.update(self._fuzzy_chars.get(ch, ()))
+        candidates = set(heapq.nlargest(FUZZY_CANDIDATES, shared, key=lambda eid: shared[eid] / len(self._fuzzy[eid])))
+        initials = q if _INITIALS_RE.fullmatch(q) and lazy_pinyin else None
+        if initials:
+            candidates |= {eid for eid, i in self._initials.items() if initials in i}
+        scored = []
+        for eid in candidates:
+            key = self._fuzzy[eid]
+            k_grams = _grams(key)
+            # 二元字串的 Dice 系数与编辑距离相似度取较大者；包含关系按覆盖比例计分
+            score = 2 * len(q_grams & k_grams) / (len(q_grams) + len(k_grams))
+            score = max(score, 1 - edit_distance(q, key) / max(len(q), len(key)))
+            if q in key:
+                score = max(score, 0.5 + 0.5 * len(q) / len(key))
+            if initials and self._initials[eid]:
+                if self._initials[eid] == initials:
+                    score = max(score, 0.95)
+                elif self._initials[eid].startswith(initials):
+                    score = max(score, 0.6 + 0.3 * len(initials) / len(self._initials[eid]))
+            scored.append((eid, self._titles[eid], round(score, 3)))
+        scored.sort(key=lambda x: (-x[2], self._order.get(x[0], 0)))
+        return scored[:limit]
+
+    def best_match(self, query, threshold=FUZZY_THRESHOLD, margin=FUZZY_MARGIN):
+        """
+        Returns:
+            (event_id, title, score) | None: 得分达到 threshold 且领先第二名 margin 以上时返回最佳候选
+        """
+        ranked = self.fuzzy(query, limit=2)
+        if not ranked or ranked[0][2] < threshold:
+            return None
+        if len(ranked) > 1 and ranked[0][2] - ranked[1][2] < margin:
+            return None
+        return ranked[0]
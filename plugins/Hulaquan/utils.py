@@ -1,4 +1,5 @@
 from datetime import datetime, timedelta
+from functools import lru_cache
 import unicodedata
 import traceback
 import random
@@ -37,16 +38,46 @@ def delta_time_list(start_date, end_date):
             current_date += timedelta(days=1)
         return date_list   
     
+def _char_width(char):
+    # 判断字符是否是全宽字符（通常是中文等）
+    if unicodedata.east_asian_width(char) in ['F', 'W'] or char in ["《", "》"]:  # 'F' = Fullwidth, 'W' = Wide
+        return 3  # 全宽字符占用2个位置
+    return 1  # 半宽字符占用1个位置
+
+
+def _wide_bmp_pattern():
+    # 预先计算基本多文种平面（BMP）内每个字符的宽度，把全宽字符的区间合并成一个字符类
+    ranges = []
+    start = None
+    for code in range(0x10001):
+        wide = code < 0x10000 and _char_width(chr(code)) == 3
+        if wide and start is None:
+            start = code
+        elif not wide and start is not None:
+            ranges.append(re.escape(chr(start)) + ("-" + re.escape(chr(code - 1)) if code - 1 > start else ""))
+            start = None
+    return re.compile("[" + "".join(ranges) + "]")
+
+
+_WIDE_BMP = _wide_bmp_pattern()
+_ASTRAL = re.compile("[\U00010000-\U0010ffff]")
+
+
 def get_display_width(s):
-    width = 0
-    for char in s:
-        # 判断字符是否是全宽字符（通常是中文等）
-        if unicodedata.east_asian_width(char) in ['F', 'W'] or char in ["《", "》"]:  # 'F' = Fullwidth, 'W' = Wide
-            width += 3  # 全宽字符占用2个位置
-        else:
-            width += 1  # 半宽字符占用1个位置
+    if s.isascii():
+        return len(s)
+    # 每个字符先按 1 计，全宽字符再加 2
+    width = len(s) + 2 * len(_WIDE_BMP.findall(s))
+    for char in _ASTRAL.findall(s):
+        width += _char_width(char) - 1
     return width
-    
+
+
+def get_display_widths(strings):
+    """批量计算显示宽度，返回与 strings 顺序一致的列表"""
+    return [get_display_width(s) for s in strings]
+
+
 def ljust_for_chinese(s, width, fillchar=' '):
     current_width = get_display_width(s)
     if current_width >= width:
@@ -54,6 +85,21 @@ def ljust_for_chinese(s, width, fillchar=' '):
     fill_width = width - current_width
     return s + fillchar * fill_width
 
+
+def ljust_all_for_chinese(strings, width=None, fillchar=' '):
+    """
+    将多行文本按显示宽度左对齐，每行只计算一次宽度
+
+    Args:
+        width: 对齐宽度，默认为各行中的最大显示宽度
+    """
+    strings = list(strings)
+    widths = get_display_widths(strings)
+    if width is None:
+        width = max(widths, default=0)
+    return [s + fillchar * (width - w) if w < width else s for s, w in zip(strings, widths)]
+
+
 def get_max_cast_length(casts=None):
     return 8
 
@@ -102,28 +148,55 @@ def standardize_datetime_for_saoju(dateAndTime: str, return_str=False, latest_st
 
 
 
+DATETIME_CACHE_SIZE = 8192
+# 票务和扫剧数据中的标准格式 "YYYY-MM-DD HH:MM[:SS]"，直接按位置解析，不必逐个尝试 strptime
+_CANONICAL_DATETIME = re.compile(r"(\d{4})-(\d{2})-(\d{2}) (\d{2}):(\d{2})(?::(\d{2}))?")
+_DATETIME_FORMATS = [
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%d",
+    "%m-%d %H:%M:%S",
+    "%m-%d %H:%M",
+    "%m-%d",
+    "%y-%m-%d %H:%M:%S",
+    "%y-%m-%d %H:%M",
+    "%H:%M:%S",
+    "%H:%M",
+    # 新增支持“2025 04-01 19:30”/“2025 04-01 19:30:00”格式
+    "%Y %m-%d %H:%M:%S",
+    "%Y %m-%d %H:%M",
+]
+
+
 def standardize_datetime(dateAndTime: str, return_str=True, with_second=True):
-    current_year = datetime.now().year
     dateAndTime = dateAndTime.replace("：", ':').replace("/", "-").strip()
-    formats = [
-        "%Y-%m-%d %H:%M:%S",
-        "%Y-%m-%d %H:%M",
-        "%Y-%m-%d",
-        "%m-%d %H:%M:%S",
-        "%m-%d %H:%M",
-        "%m-%d",
-        "%y-%m-%d %H:%M:%S",
-        "%y-%m-%d %H:%M",
-        "%H:%M:%S",
-        "%H:%M",
-        # 新增支持“2025 04-01 19:30”/“2025 04-01 19:30:00”格式
-        "%Y %m-%d %H:%M:%S",
-        "%Y %m-%d %H:%M",
-    ]
+    # 缺少年份的格式按今年补全，因此缓存按年份区分
+    dt = _parse_datetime_cached(dateAndTime, datetime.now().year)
+    if return_str:
+        if with_second:
+            return dt.strftime("%Y-%m-%d %H:%M:%S")
+        else:
+            return dt.strftime("%Y-%m-%d %H:%M")
+    else:
+        return dt
+
+
+@lru_cache(maxsize=DATETIME_CACHE_SIZE)
+def _parse_datetime_cached(dateAndTime, current_year):
+    match = _CANONICAL_DATETIME.fullmatch(dateAndTime)
+    if match:
+        try:
+            return datetime(*(int(g) for g in match.groups(0)))
+        except ValueError:
+            pass
+    return _parse_datetime_formats(dateAndTime, current_year)
+
+
+def _parse_datetime_formats(dateAndTime, current_year):
     # 处理“8月3日 星期日 14:30”格式
     
     # 其他格式
-    for fmt in formats:
+    for fmt in _DATETIME_FORMATS:
         try:
             dt_str = dateAndTime
             fmt_try = fmt
@@ -148,14 +221,7 @@ def standardize_datetime(dateAndTime: str, return_str=True, with_second=True):
             if fmt_try in ["%Y-%m-%d %H:%M:%S", "%y-%m-%d %H:%M:%S", "%m-%d %H:%M:%S"]:
                 if len(dt_str.split()) == 1:
                     dt_str = f"{dt_str} 00:00:00"
-            dt = datetime.strptime(dt_str, fmt_try)
-            if return_str:
-                if with_second:
-                    return dt.strftime("%Y-%m-%d %H:%M:%S")
-                else:
-                    return dt.strftime("%Y-%m-%d %H:%M")
-            else:
-                return dt
+            return datetime.strptime(dt_str, fmt_try)
         except Exception:
             continue
     raise ValueError("无法解析该日期时间格式")
@@ -189,6 +255,10 @@ def extract_text_in_brackets(text, keep_brackets=True):
         return match.group(0) if keep_brackets else match.group(1)
     return text if not keep_brackets else "《"+text+"》"
 
+def normalize_title(text):
+    """剧名规范化：忽略大小写和空白（扫剧排期索引和剧名检索索引共用）"""
+    return "".join(str(text).split()).casefold()
+
 # 将城市列表定义为模块级别的常量，避免每次调用都重新创建
 # 按长度从大到小排序，优先匹配长的城市名（避免"北京"匹配到"北"）
 CITIES = sorted([